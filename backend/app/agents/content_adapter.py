@@ -5,11 +5,137 @@ Generates multiple variants optimized for different learning styles.
 
 from ..models import ContentVariant, ContentRequest, Profile
 from ..llm_client import llm_client
-from typing import Dict, Any
+from ..cache import LRUCache, content_key
+from ..cohorts import CohortModel, cohort_model
+from .profile_agent import ProfileAgent, profile_agent
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
+import os
+
+# Profile fields the adaptation prompt actually depends on
+PROMPT_PROFILE_FIELDS = (
+    "attention_span_minutes",
+    "preferred_modalities",
+    "working_memory_index",
+    "anxiety_triggers",
+    "best_time_of_day",
+)
+
+# Canonical profile buckets for precomputed lesson variants:
+# attention span x working memory x time-pressure anxiety
+ATTENTION_BUCKETS = {"short": 12, "medium": 25, "long": 60}
+MEMORY_BUCKETS = {"low_memory": 0.4, "high_memory": 0.75}
+PRESSURE_BUCKETS = {"time_pressure": ["time_pressure"], "no_time_pressure": []}
+
+# Fields that define a bucket; a cohort's prompt profile takes these from the learner's bucket
+BUCKET_PROFILE_FIELDS = ("attention_span_minutes", "working_memory_index", "anxiety_triggers")
+
+PROFILE_BUCKETS = [
+    f"{attention}:{memory}:{pressure}"
+    for attention in ATTENTION_BUCKETS
+    for memory in MEMORY_BUCKETS
+    for pressure in PRESSURE_BUCKETS
+]
+
+def profile_bucket(profile: Profile) -> str:
+    """Nearest canonical bucket for a learner profile"""
+    if profile.attention_span_minutes < 20:
+        attention = "short"
+    elif profile.attention_span_minutes < 45:
+        attention = "medium"
+    else:
+        attention = "long"
+    memory = "low_memory" if profile.working_memory_index < 0.5 else "high_memory"
+    pressure = "time_pressure" if "time_pressure" in profile.anxiety_triggers else "no_time_pressure"
+    return f"{attention}:{memory}:{pressure}"
+
+def bucket_prompt_profile(bucket: str) -> Dict[str, Any]:
+    """
+    Representative prompt profile for a bucket. Modalities are left neutral
+    because their suggestions are added per learner at request time.
+    """
+    attention, memory, pressure = bucket.split(":")
+    return {
+        "attention_span_minutes": ATTENTION_BUCKETS[attention],
+        "preferred_modalities": ["reading"],
+        "working_memory_index": MEMORY_BUCKETS[memory],
+        "anxiety_triggers": PRESSURE_BUCKETS[pressure],
+        "best_time_of_day": "any",
+    }
 
 class ContentAdapterAgent:
     """Adapts content to learner profiles and preferences"""
     
+    def __init__(self, cache: LRUCache = None, precomputed: LRUCache = None, cohorts: CohortModel = None,
+                 profiles: ProfileAgent = None, min_cohort_size: int = 20):
+        self.cache = cache
+        self.precomputed = precomputed
+        # Learners in the same cohort and bucket share variants generated for the
+        # cohort's representative learner; per-learner tweaks are applied afterwards
+        self.cohorts = cohorts
+        self.profiles = profiles
+        self.min_cohort_size = min_cohort_size
+    
+    async def precompute(self, raw_text: str) -> int:
+        """
+        Generate and store variants of a lesson for every canonical profile bucket.
+        Missing buckets are requested concurrently so the client can batch them.
+        Returns the number of buckets that had to be generated.
+        """
+        missing = [
+            bucket for bucket in PROFILE_BUCKETS
+            if self.precomputed.get(content_key("lesson", raw_text, bucket)) is None
+        ]
+        results = await asyncio.gather(*[
+            llm_client.adapt_content(raw_text, bucket_prompt_profile(bucket)) for bucket in missing
+        ])
+        for bucket, variants in zip(missing, results):
+            self.precomputed.set(content_key("lesson", raw_text, bucket), variants)
+        return len(missing)
+    
+    def _cohort(self, profile: Profile) -> Optional[int]:
+        """The learner's cohort, if the cohorts are fine enough and it is big enough to share variants"""
+        if self.cohorts is None:
+            return None
+        cohort = self.cohorts.cohort_of(profile.user_id)
+        if cohort is None or len(self.cohorts.sizes) < 2 or self.cohorts.cohort_size(cohort) < self.min_cohort_size:
+            return None
+        return cohort
+    
+    def _cache_key(self, request: ContentRequest, profile_dict: Dict[str, Any], cohort: Optional[int]) -> str:
+        """Variants are cached per cohort and bucket when the learner has a usable cohort, else per exact profile"""
+        if cohort is not None:
+            return content_key("cohort", request.raw_text, self.cohorts.version, cohort, profile_bucket(request.profile))
+        return content_key(request.raw_text, profile_dict)
+    
+    async def _generation_profile(self, request: ContentRequest, profile_dict: Dict[str, Any],
+                                  cohort: Optional[int]) -> Dict[str, Any]:
+        """
+        Prompt profile for generating variants. Cohort variants come from the
+        cohort's representative learner with the bucket's fields, so they do
+        not depend on which member asked first.
+        """
+        if cohort is None:
+            return profile_dict
+        prompt_profile = bucket_prompt_profile(profile_bucket(request.profile))
+        representative_id = self.cohorts.representative(cohort)
+        if representative_id is not None and self.profiles is not None:
+            representative = await self.profiles.get_profile(representative_id)
+            if representative is not None:
+                bucket_fields = {field: prompt_profile[field] for field in BUCKET_PROFILE_FIELDS}
+                prompt_profile = {**self._prompt_profile(representative), **bucket_fields}
+        return prompt_profile
+    
+    def _lookup_variants(self, request: ContentRequest, cache_key: str):
+        """Precomputed variants for the learner's bucket, else cached ones for the cohort or exact profile"""
+        if self.precomputed is not None:
+            variants = self.precomputed.get(content_key("lesson", request.raw_text, profile_bucket(request.profile)))
+            if variants is not None:
+                return variants
+        if self.cache is not None:
+            return self.cache.get(cache_key)
+        return None
+    
     async def convert_content(self, request: ContentRequest) -> ContentVariant:
         """
         Convert raw educational content into multiple adapted variants.
@@ -17,37 +143,80 @@ class ContentAdapterAgent:
         """
         
         # Prepare context for LLM
-        profile_dict = request.profile.dict()
+        profile_dict = self._prompt_profile(request.profile)
         
-        # Use LLM to generate adapted content variants
-        variants = await llm_client.adapt_content(request.raw_text, profile_dict)
+        # Reuse variants precomputed for the lesson or generated for the cohort or an equivalent profile
+        cohort = self._cohort(request.profile)
+        cache_key = self._cache_key(request, profile_dict, cohort)
+        variants = self._lookup_variants(request, cache_key)
+        
+        if variants is None:
+            # Use LLM to generate adapted content variants
+            prompt_profile = await self._generation_profile(request, profile_dict, cohort)
+            variants = await llm_client.adapt_content(request.raw_text, prompt_profile)
+            if self.cache is not None:
+                self.cache.set(cache_key, variants)
         
         # Apply profile-specific adaptations
         adapted_variants = self._apply_profile_adaptations(variants, request.profile)
         
         return ContentVariant(**adapted_variants)
     
+    def _prompt_profile(self, profile: Profile) -> Dict[str, Any]:
+        """Profile features sent to the LLM (excludes ids, embeddings and timestamps)"""
+        profile_dict = profile.model_dump(mode="json", include=set(PROMPT_PROFILE_FIELDS))
+        profile_dict["preferred_modalities"] = sorted(profile_dict["preferred_modalities"])
+        profile_dict["anxiety_triggers"] = sorted(profile_dict["anxiety_triggers"])
+        return profile_dict
+    
+    async def convert_content_stream(self, request: ContentRequest) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Yield (section, text) pairs of the adapted content as soon as each
+        section is generated, instead of waiting for the full completion.
+        """
+        
+        profile_dict = self._prompt_profile(request.profile)
+        cohort = self._cohort(request.profile)
+        cache_key = self._cache_key(request, profile_dict, cohort)
+        variants = self._lookup_variants(request, cache_key)
+        
+        if variants is not None:
+            for name, text in variants.items():
+                yield name, self._adapt_section(name, text, request.profile)
+            return
+        
+        variants = {}
+        prompt_profile = await self._generation_profile(request, profile_dict, cohort)
+        async for name, text in llm_client.adapt_content_stream(request.raw_text, prompt_profile):
+            variants[name] = text
+            yield name, self._adapt_section(name, text, request.profile)
+        
+        if self.cache is not None:
+            self.cache.set(cache_key, variants)
+    
     def _apply_profile_adaptations(self, variants: Dict[str, str], profile: Profile) -> Dict[str, str]:
         """Apply profile-specific adaptations to content variants"""
-        
-        adapted = variants.copy()
+        return {name: self._adapt_section(name, text, profile) for name, text in variants.items()}
+    
+    def _adapt_section(self, name: str, text: str, profile: Profile) -> str:
+        """Apply profile-specific adaptations to a single content variant"""
         
         # Adjust for attention span
-        if profile.attention_span_minutes < 15:
-            adapted["micro_tasks"] = self._break_into_smaller_chunks(variants["micro_tasks"])
+        if name == "micro_tasks" and profile.attention_span_minutes < 15:
+            text = self._break_into_smaller_chunks(text)
         
         # Add modality-specific suggestions
-        if "auditory" in profile.preferred_modalities:
-            adapted["simplified"] += "\n\n💡 Consider reading this aloud or using text-to-speech."
+        if name == "simplified" and "auditory" in profile.preferred_modalities:
+            text += "\n\n💡 Consider reading this aloud or using text-to-speech."
         
-        if "visual" in profile.preferred_modalities:
-            adapted["bullets"] += "\n\n📊 Try creating a mind map or diagram of these points."
+        if name == "bullets" and "visual" in profile.preferred_modalities:
+            text += "\n\n📊 Try creating a mind map or diagram of these points."
         
         # Adjust for working memory
-        if profile.working_memory_index < 0.5:
-            adapted["simplified"] = self._reduce_cognitive_load(adapted["simplified"])
+        if name == "simplified" and profile.working_memory_index < 0.5:
+            text = self._reduce_cognitive_load(text)
         
-        return adapted
+        return text
     
     def _break_into_smaller_chunks(self, content: str) -> str:
         """Break content into smaller, more manageable chunks"""
@@ -73,4 +242,18 @@ class ContentAdapterAgent:
         return simplified
 
 # Global agent instance
-content_adapter = ContentAdapterAgent()
+content_adapter = ContentAdapterAgent(
+    cache=LRUCache(
+        max_entries=5000,
+        max_bytes=64 * 1024 * 1024,
+        ttl_seconds=7 * 24 * 3600,
+        path=os.getenv("CONTENT_CACHE_PATH")
+    ),
+    # Precomputed catalog variants never expire; shared with workers via SQLite
+    precomputed=LRUCache(
+        max_entries=50000,
+        path=os.getenv("PRECOMPUTED_VARIANTS_PATH")
+    ),
+    cohorts=cohort_model,
+    profiles=profile_agent
+)
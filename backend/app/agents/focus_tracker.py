@@ -4,14 +4,16 @@ Maintains focus state and triggers interventions when needed.
 """
 
 from ..models import FocusEvent
-from ..db import focus_events_store
+from ..db import confidence_units
+from ..stores import FocusStore, FocusTotals, focus_store
 from typing import List, Dict, Any
-from datetime import datetime, timedelta
+import time
 
 class FocusTrackerAgent:
     """Processes and analyzes focus events from client-side tracking"""
     
-    def __init__(self):
+    def __init__(self, store: FocusStore = focus_store):
+        self.store = store
         self.focus_threshold = 0.7  # Minimum confidence for "focused" state
         self.distraction_window = 300  # 5 minutes in seconds
     
@@ -21,11 +23,11 @@ class FocusTrackerAgent:
         Events come from client-side TensorFlow.js processing.
         """
         
-        # Store event (in production, use Redis or database)
-        focus_events_store.append(event.dict())
+        # Store event in the session's event log (in-memory or Redis)
+        await self.store.append(event.session_id, event.event_type, event.confidence, event.timestamp)
         
         # Analyze recent focus pattern
-        focus_state = self._analyze_focus_state(event.session_id)
+        focus_state = await self._analyze_focus_state(event.session_id)
         
         return {
             "event_logged": True,
@@ -34,41 +36,55 @@ class FocusTrackerAgent:
             "needs_intervention": focus_state["needs_intervention"]
         }
     
-    def _analyze_focus_state(self, session_id: str) -> Dict[str, Any]:
+    async def log_focus_events(self, session_id: str, events: List[FocusEvent]) -> Dict[str, Any]:
+        """
+        Log a batch of focus events for one session and return the final focus state.
+        The focus state is analyzed once for the whole batch.
+        """
+        
+        await self.store.append_many(
+            session_id,
+            [(event.event_type, event.confidence, event.timestamp) for event in events]
+        )
+        
+        focus_state = await self._analyze_focus_state(session_id)
+        
+        return {
+            "events_logged": len(events),
+            "current_focus_score": focus_state["focus_score"],
+            "trend": focus_state["trend"],
+            "needs_intervention": focus_state["needs_intervention"]
+        }
+    
+    async def _analyze_focus_state(self, session_id: str) -> Dict[str, Any]:
         """Analyze recent focus events to determine current state"""
         
-        # Get recent events for this session
-        cutoff_time = datetime.now() - timedelta(seconds=self.distraction_window)
-        recent_events = [
-            event for event in focus_events_store
-            if (event["session_id"] == session_id and 
-                datetime.fromisoformat(event["timestamp"]) > cutoff_time)
-        ]
+        # Get running totals for the recent window of this session
+        window = await self.store.window(session_id, self.distraction_window, time.time(), latest=3)
         
-        if not recent_events:
+        if window is None or window.count == 0:
             return {
                 "focus_score": 0.5,
                 "trend": "unknown",
                 "needs_intervention": False
             }
         
-        # Calculate average focus score
-        focus_scores = [event["confidence"] for event in recent_events]
-        avg_focus = sum(focus_scores) / len(focus_scores)
+        # Average focus score over the window
+        avg_focus = window.average_confidence
         
-        # Determine trend
-        if len(focus_scores) >= 3:
-            recent_avg = sum(focus_scores[-3:]) / 3
-            older_avg = sum(focus_scores[:-3]) / max(1, len(focus_scores) - 3)
-            trend = "improving" if recent_avg > older_avg else "declining"
+        # Determine trend from the last 3 events against the rest of the window
+        if window.count >= 3:
+            recent_units = sum(confidence_units(c) for c in window.latest_confidences)
+            older_units = window.confidence_units - recent_units
+            older_count = max(1, window.count - 3)
+            trend = "improving" if recent_units * older_count > older_units * 3 else "declining"
         else:
             trend = "stable"
         
         # Check if intervention is needed
-        distraction_events = [e for e in recent_events if e["event_type"] == "distraction"]
         needs_intervention = (
             avg_focus < self.focus_threshold or 
-            len(distraction_events) >= 3
+            window.distraction_count >= 3
         )
         
         return {
@@ -80,32 +96,24 @@ class FocusTrackerAgent:
     async def get_session_summary(self, session_id: str) -> Dict[str, Any]:
         """Get focus summary for a learning session"""
         
-        session_events = [
-            event for event in focus_events_store
-            if event["session_id"] == session_id
-        ]
+        totals = await self.store.totals(session_id)
         
-        if not session_events:
+        if totals is None:
             return {"error": "No events found for session"}
         
-        focus_scores = [event["confidence"] for event in session_events]
-        distraction_count = len([e for e in session_events if e["event_type"] == "distraction"])
-        
         return {
-            "total_events": len(session_events),
-            "average_focus": sum(focus_scores) / len(focus_scores),
-            "distraction_count": distraction_count,
-            "session_duration_minutes": self._calculate_session_duration(session_events)
+            "total_events": totals.total_events,
+            "average_focus": totals.confidence_sum / totals.total_events,
+            "distraction_count": totals.distraction_count,
+            "session_duration_minutes": self._calculate_session_duration(totals)
         }
     
-    def _calculate_session_duration(self, events: List[Dict]) -> float:
-        """Calculate session duration from events"""
-        if len(events) < 2:
+    def _calculate_session_duration(self, totals: FocusTotals) -> float:
+        """Calculate session duration from first and last event timestamps"""
+        if totals.total_events < 2:
             return 0
         
-        start_time = datetime.fromisoformat(events[0]["timestamp"])
-        end_time = datetime.fromisoformat(events[-1]["timestamp"])
-        duration = (end_time - start_time).total_seconds() / 60
+        duration = (totals.last_timestamp - totals.first_timestamp) / 60
         
         return round(duration, 2)
 
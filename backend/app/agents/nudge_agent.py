@@ -5,22 +5,92 @@ Provides gentle, non-patronizing nudges to improve learning effectiveness.
 
 from ..models import NudgeAction, FocusEvent, Profile
 from ..llm_client import llm_client
-from typing import Dict, Any
+from ..stores import NudgeLimiter, nudge_limiter
+from typing import Dict, Any, Optional
+import copy
+import os
+import random
+import time
+
+# Templates for routine nudges; "{...}" fields are filled from the payload after profile adjustments
+NUDGE_TEMPLATES = {
+    "break": {
+        "type": "break",
+        "payload": {"duration_minutes": 5},
+        "message": "Time for a quick break! Step away from the screen for {duration_minutes} minutes.",
+        "priority": 3
+    },
+    "breathing": {
+        "type": "breathing",
+        "payload": {"technique": "4-7-8"},
+        "message": "Let's try a breathing exercise to refocus.",
+        "priority": 2
+    },
+    "adjust_difficulty": {
+        "type": "adjust_difficulty",
+        "payload": {"direction": "easier"},
+        "message": "Let's switch to a smaller step for now and build back up from there.",
+        "priority": 2
+    },
+}
+
+# Session context the rules understand; any other key makes the situation novel
+ROUTINE_CONTEXT_KEYS = {"focus_state"}
 
 class NudgeAgent:
     """Generates contextual nudges and interventions"""
     
+    def __init__(self, limiter: NudgeLimiter = nudge_limiter, llm_sample_rate: float = 0.05,
+                 rng: random.Random = None):
+        # Routine situations are answered from templates; the LLM handles novel
+        # ones and a `llm_sample_rate` share of routine ones
+        self.limiter = limiter
+        self.llm_sample_rate = llm_sample_rate
+        self.rng = rng or random.Random()
+        self.metrics = {"template": 0, "llm_novel": 0, "llm_sampled": 0}
+    
+    def _routine_nudge_type(self, focus_event: FocusEvent, profile: Profile,
+                            context: Dict[str, Any]) -> Optional[str]:
+        """Template for a routine situation, or None when it needs the LLM"""
+        if not set(context) <= ROUTINE_CONTEXT_KEYS:
+            return None
+        
+        trend = context.get("focus_state", {}).get("trend")
+        if focus_event.event_type == "distraction":
+            return "break"
+        if focus_event.event_type == "attention_drop":
+            # Falling focus with low working memory suggests the material is too hard
+            if trend == "declining" and profile.working_memory_index < 0.5:
+                return "adjust_difficulty"
+            if profile.attention_span_minutes < 20:
+                return "break"
+            return "breathing"
+        return None
+    
+    def _template_nudge(self, nudge_type: str, profile: Profile) -> Dict[str, Any]:
+        nudge_data = copy.deepcopy(NUDGE_TEMPLATES[nudge_type])
+        adjusted = self._adjust_for_profile(nudge_data, profile)
+        adjusted["message"] = adjusted["message"].format(**adjusted["payload"])
+        return adjusted
+    
     async def generate_nudge(self, focus_event: FocusEvent, profile: Profile, 
                            context: Dict[str, Any]) -> NudgeAction:
         """
         Generate a contextual nudge based on focus state and learner profile.
-        Uses LLM to create personalized, appropriate interventions.
+        Routine situations use templates; novel ones use the LLM to create
+        personalized, appropriate interventions.
         """
         
+        nudge_type = self._routine_nudge_type(focus_event, profile, context)
+        if nudge_type is not None and self.rng.random() >= self.llm_sample_rate:
+            self.metrics["template"] += 1
+            return NudgeAction(**self._template_nudge(nudge_type, profile))
+        self.metrics["llm_novel" if nudge_type is None else "llm_sampled"] += 1
+        
         # Prepare context for LLM
         nudge_context = {
-            "focus_event": focus_event.dict(),
-            "profile": profile.dict(),
+            "focus_event": focus_event.model_dump(mode="json"),
+            "profile": profile.model_dump(mode="json", exclude={"user_id", "embedding", "created_at"}),
             "session_context": context,
             "current_time": focus_event.timestamp.isoformat()
         }
@@ -53,25 +123,15 @@ class NudgeAgent:
         
         return adjusted
     
-    async def should_nudge(self, session_id: str, profile: Profile) -> bool:
-        """Determine if a nudge is appropriate at this time"""
-        
-        # Simple heuristic - in production, use more sophisticated logic
-        from ..db import focus_events_store
-        from datetime import datetime, timedelta
-        
-        # Don't nudge too frequently
-        recent_cutoff = datetime.now() - timedelta(minutes=10)
-        recent_events = [
-            event for event in focus_events_store
-            if (event["session_id"] == session_id and 
-                datetime.fromisoformat(event["timestamp"]) > recent_cutoff)
-        ]
-        
-        # Check if there have been multiple distraction events
-        distraction_events = [e for e in recent_events if e["event_type"] == "distraction"]
-        
-        return len(distraction_events) >= 2
+    async def should_nudge(self, session_id: str, profile: Profile, now: Optional[float] = None) -> bool:
+        """
+        Determine if a nudge is appropriate at this time: at most one per
+        session per cooldown, checked with a single limiter lookup.
+        """
+        return await self.limiter.acquire(session_id, time.time() if now is None else now)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"llm_sample_rate": self.llm_sample_rate, **self.metrics}
 
 # Global agent instance
-nudge_agent = NudgeAgent()
+nudge_agent = NudgeAgent(llm_sample_rate=float(os.getenv("NUDGE_LLM_SAMPLE_RATE", "0.05")))
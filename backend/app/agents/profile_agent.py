@@ -5,13 +5,63 @@ Generates embeddings for semantic matching and personalization.
 
 from ..models import Profile, OnboardingData
 from ..llm_client import llm_client
-from ..db import vector_db
-import numpy as np
-from typing import Dict, Any
+from ..db import ProfileDB, engine, init_db, vector_db
+from ..cache import LRUCache
+from ..embeddings import ProfileEmbedder, profile_embedder
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from contextlib import asynccontextmanager
+import json
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+# Profile fields stored as JSON text in ProfileDB (the embedding is a float32 blob)
+PROFILE_JSON_FIELDS = ("preferred_modalities", "anxiety_triggers", "suggestions")
+
+# Profile summary fields the embedding is computed from
+EMBEDDING_FIELDS = (
+    "attention_span_minutes",
+    "preferred_modalities",
+    "working_memory_index",
+    "anxiety_triggers",
+    "best_time_of_day",
+    "suggestions",
+)
 
 class ProfileAgent:
     """Builds and maintains learner profiles"""
     
+    def __init__(self, bind: AsyncEngine = engine, cache: LRUCache = None,
+                 embedder: ProfileEmbedder = profile_embedder):
+        # Profiles are persisted in the profiles table; `cache` holds recently used ones by user_id
+        self.bind = bind
+        self.embedder = embedder
+        self.session_factory = async_sessionmaker(bind, expire_on_commit=False, autoflush=False)
+        self.schema_ready = False
+        self.cache = cache
+    
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        if not self.schema_ready:
+            await init_db(self.bind)
+            self.schema_ready = True
+        async with self.session_factory() as db:
+            yield db
+    
+    @staticmethod
+    def _to_row(profile: Profile) -> ProfileDB:
+        fields = profile.model_dump(mode="json", exclude={"created_at"})
+        for field in PROFILE_JSON_FIELDS:
+            fields[field] = json.dumps(fields[field])
+        return ProfileDB(**fields, created_at=profile.created_at)
+    
+    @staticmethod
+    def _to_model(row: ProfileDB) -> Profile:
+        fields = {column.name: getattr(row, column.name) for column in ProfileDB.__table__.columns}
+        for field in PROFILE_JSON_FIELDS:
+            fields[field] = json.loads(fields[field]) if fields[field] else []
+        fields["embedding"] = fields["embedding"].tolist() if fields["embedding"] is not None else []
+        return Profile(**fields)
+    
     async def build_profile(self, user_id: str, onboarding_data: OnboardingData) -> Profile:
         """
         Create a learner profile from onboarding data.
@@ -19,13 +69,13 @@ class ProfileAgent:
         """
         
         # Convert onboarding data to dict for LLM processing
-        onboarding_dict = onboarding_data.dict()
+        onboarding_dict = onboarding_data.model_dump()
         
         # Use LLM to analyze and summarize profile
         profile_data = await llm_client.summarize_profile(onboarding_dict)
         
-        # Generate embedding vector
-        embedding = self._generate_embedding(profile_data)
+        # Generate embedding vector (float32, the precision it is stored with)
+        embedding = self._generate_embedding({field: profile_data[field] for field in EMBEDDING_FIELDS})
         
         # Create profile object
         profile = Profile(
@@ -46,22 +96,99 @@ class ProfileAgent:
             {"profile_type": "learner", "created_at": profile.created_at.isoformat()}
         )
         
+        # Persist so later requests can refer to the profile by user_id
+        await self.save_profile(profile)
+        
+        return profile
+    
+    async def save_profile(self, profile: Profile) -> Profile:
+        """Insert or replace a stored profile and refresh its cache entry"""
+        async with self._session() as db:
+            await db.merge(self._to_row(profile))
+            await db.commit()
+        if self.cache is not None:
+            self.cache.set(profile.user_id, profile)
         return profile
     
+    async def get_profile(self, user_id: str) -> Optional[Profile]:
+        """Stored profile for a user, served from the cache when possible"""
+        if self.cache is not None:
+            profile = self.cache.get(user_id)
+            if profile is not None:
+                return profile
+        
+        async with self._session() as db:
+            row = await db.get(ProfileDB, user_id)
+            profile = self._to_model(row) if row is not None else None
+        
+        if profile is not None and self.cache is not None:
+            self.cache.set(user_id, profile)
+        return profile
+    
+    def invalidate(self, user_id: str):
+        """Drop a cached profile, e.g. after another process updated it"""
+        if self.cache is not None:
+            self.cache.delete(user_id)
+    
+    def similar_learners(self, user_id: str, limit: int = 5) -> Optional[List[Dict[str, Any]]]:
+        """Learners whose profile embeddings are closest to this one, or None without an embedding"""
+        vector_db.refresh()
+        embedding = vector_db.get_embedding(user_id)
+        if embedding is None:
+            return None
+        matches = vector_db.search_similar(embedding, limit + 1)
+        return [match for match in matches if match["id"] != user_id][:limit]
+    
     def _generate_embedding(self, profile_data: Dict[str, Any]) -> list[float]:
+        """Generate embedding vector for profile with the configured embedder"""
+        return self.embedder.encode(profile_data).tolist()
+    
+    async def reembed_profiles(self, batch_size: int = 1000) -> int:
         """
-        Generate embedding vector for profile.
-        Stub implementation - replace with actual embedding model.
+        Recompute every stored embedding, e.g. after changing the embedder.
+        Profiles are paged by user_id and encoded one batch per call.
         """
-        # Simple hash-based embedding for development
-        profile_str = str(sorted(profile_data.items()))
-        np.random.seed(hash(profile_str) % 2**32)
-        return np.random.normal(0, 1, 384).tolist()  # 384-dim vector
+        columns = [getattr(ProfileDB, field) for field in ("user_id", "created_at") + EMBEDDING_FIELDS]
+        statement = (
+            update(ProfileDB.__table__)
+            .where(ProfileDB.__table__.c.user_id == bindparam("row_user_id"))
+            .values(embedding=bindparam("vector", type_=ProfileDB.__table__.c.embedding.type))
+        )
+        updated = 0
+        last_user_id = ""
+        while True:
+            async with self._session() as db:
+                rows = (await db.execute(
+                    select(*columns).where(ProfileDB.user_id > last_user_id)
+                    .order_by(ProfileDB.user_id).limit(batch_size)
+                )).all()
+                if not rows:
+                    return updated
+                
+                profiles: List[Dict[str, Any]] = []
+                for row in rows:
+                    fields = {field: getattr(row, field) for field in EMBEDDING_FIELDS}
+                    for field in PROFILE_JSON_FIELDS:
+                        fields[field] = json.loads(fields[field]) if fields[field] else []
+                    profiles.append(fields)
+                embeddings = self.embedder.encode_batch(profiles)
+                
+                await db.execute(statement, [
+                    {"row_user_id": row.user_id, "vector": embedding} for row, embedding in zip(rows, embeddings)
+                ])
+                await db.commit()
+            
+            for row, embedding in zip(rows, embeddings):
+                created_at = row.created_at.isoformat() if row.created_at else None
+                vector_db.store_embedding(row.user_id, embedding, {"profile_type": "learner", "created_at": created_at})
+                self.invalidate(row.user_id)
+            updated += len(rows)
+            last_user_id = rows[-1].user_id
     
     async def update_profile(self, user_id: str, learning_data: Dict[str, Any]) -> Profile:
         """Update profile based on learning behavior and performance"""
         # TODO: Implement profile updates based on learning analytics
         pass
 
-# Global agent instance
-profile_agent = ProfileAgent()
+# Global agent instance; the short TTL bounds staleness across workers
+profile_agent = ProfileAgent(cache=LRUCache(max_entries=10000, ttl_seconds=300))
@@ -4,16 +4,157 @@ Optimizes review timing based on performance and forgetting curves.
 """
 
 from ..models import SRSItem, QuizResult
+from ..db import SRSItemDB, engine, init_db
+from ..decks import iter_deck_rows, parse_deck_row, format_deck_items, new_item_id
+from sqlalchemy import select, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, Iterable, List, Optional, TextIO, Tuple
+import heapq
 import math
+import os
+import time
+import numpy as np
+
+SRS_FIELDS = ("item_id", "user_id", "content", "easiness", "interval", "repetitions", "next_due", "last_reviewed")
+
+def sm2_update_arrays(easiness: np.ndarray, interval: np.ndarray, repetitions: np.ndarray,
+                      quality: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized SM-2 step over aligned arrays of items and quality ratings.
+    Uses the same operation order as the scalar update so results match exactly.
+    """
+    lapse = 5 - quality.astype(np.int64)
+    new_easiness = np.maximum(1.3, easiness + (0.1 - lapse * (0.08 + lapse * 0.02)))
+    
+    correct = quality >= 3
+    new_repetitions = np.where(correct, repetitions + 1, 0)
+    grown = np.ceil(interval * new_easiness).astype(np.int64)
+    new_interval = np.where(
+        ~correct | (new_repetitions == 1), 1,
+        np.where(new_repetitions == 2, 6, grown)
+    )
+    return new_easiness, new_interval, new_repetitions
+
+class UserDueQueue:
+    """
+    Min-heap of (next_due, item_id) over one user's items, with the items
+    themselves kept alongside. Rescheduling pushes a new entry and leaves
+    the old one in place; stale entries are skipped when they reach the top
+    and the heap is rebuilt once they outnumber the live ones. Updates are
+    O(log M) and the top N is O((N + stale) log M).
+    """
+    
+    def __init__(self, items: Iterable[SRSItem] = ()):
+        self.items: Dict[str, SRSItem] = {item.item_id: item for item in items}
+        self._rebuild()
+        self.last_seen = time.time()
+    
+    def _rebuild(self):
+        self.heap: List[Tuple[datetime, str]] = [(item.next_due, item_id) for item_id, item in self.items.items()]
+        heapq.heapify(self.heap)
+    
+    def push(self, item: SRSItem):
+        previous = self.items.get(item.item_id)
+        self.items[item.item_id] = item
+        if previous is None or previous.next_due != item.next_due:
+            heapq.heappush(self.heap, (item.next_due, item.item_id))
+            if len(self.heap) > 2 * len(self.items) + 64:
+                self._rebuild()
+    
+    def top_due(self, now: datetime, limit: int) -> List[SRSItem]:
+        """Up to `limit` items due at `now`, oldest first"""
+        taken: List[Tuple[datetime, str]] = []
+        seen = set()
+        while self.heap and len(taken) < limit and self.heap[0][0] <= now:
+            next_due, item_id = heapq.heappop(self.heap)
+            item = self.items.get(item_id)
+            # Entries left behind by reschedules, and repeats of a live one, are dropped
+            if item is not None and item.next_due == next_due and item_id not in seen:
+                seen.add(item_id)
+                taken.append((next_due, item_id))
+        for entry in taken:
+            heapq.heappush(self.heap, entry)
+        return [self.items[item_id].model_copy() for _, item_id in taken]
+
+class DueQueueStore:
+    """Lazily loaded per-user due queues with idle-user eviction"""
+    
+    def __init__(self, idle_ttl_seconds: float = 1800, max_users: int = 10000):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_users = max_users
+        self.queues: "OrderedDict[str, UserDueQueue]" = OrderedDict()
+    
+    def get(self, user_id: str) -> Optional[UserDueQueue]:
+        queue = self.queues.get(user_id)
+        if queue is not None:
+            queue.last_seen = time.time()
+            self.queues.move_to_end(user_id)
+        return queue
+    
+    def put(self, user_id: str, queue: UserDueQueue):
+        self.queues[user_id] = queue
+        self.queues.move_to_end(user_id)
+        self._evict_idle(time.time())
+    
+    def update(self, item: SRSItem):
+        """Store a written item if its user's queue is loaded; unloaded users read the table on demand"""
+        queue = self.queues.get(item.user_id)
+        if queue is not None:
+            queue.push(item.model_copy())
+    
+    def discard(self, user_id: str):
+        self.queues.pop(user_id, None)
+    
+    def _evict_idle(self, now: float):
+        """Drop least recently used queues that are idle or over the user cap"""
+        cutoff = now - self.idle_ttl_seconds
+        while self.queues:
+            user_id, queue = next(iter(self.queues.items()))
+            if queue.last_seen >= cutoff and len(self.queues) <= self.max_users:
+                break
+            del self.queues[user_id]
+    
+    def clear(self):
+        self.queues.clear()
 
 class RetentionAgent:
-    """Manages spaced repetition scheduling for optimal retention"""
+    """
+    Manages spaced repetition scheduling for optimal retention.
+    
+    Items live in the srs_items table and due items are read with an indexed
+    range scan. With `single_writer`, loaded users' items are also kept in
+    in-memory due queues and served without a query; only enable it when
+    this process is the only one writing srs_items (no other API workers,
+    no `scripts/deck.py import` against the same database), since the
+    queues never see other processes' writes.
+    """
+    
+    def __init__(self, bind: AsyncEngine = engine, single_writer: bool = False):
+        self.bind = bind
+        self.session_factory = async_sessionmaker(bind, expire_on_commit=False, autoflush=False)
+        self.schema_ready = False
+        self.single_writer = single_writer
+        self.due_queues = DueQueueStore()
+    
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        if not self.schema_ready:
+            await init_db(self.bind)
+            self.schema_ready = True
+        async with self.session_factory() as db:
+            yield db
     
-    def __init__(self):
-        # In-memory storage for development (replace with database)
-        self.srs_items: Dict[str, SRSItem] = {}
+    @staticmethod
+    def _to_model(row: SRSItemDB) -> SRSItem:
+        return SRSItem(**{field: getattr(row, field) for field in SRS_FIELDS})
+    
+    @staticmethod
+    def _to_row(item: SRSItem) -> SRSItemDB:
+        return SRSItemDB(**{field: getattr(item, field) for field in SRS_FIELDS})
     
     async def report_quiz_result(self, result: QuizResult) -> Dict[str, Any]:
         """
@@ -21,19 +162,24 @@ class RetentionAgent:
         Returns updated schedule and next review time.
         """
         
-        # Get or create SRS item
-        srs_item = self.srs_items.get(result.item_id)
-        if not srs_item:
-            srs_item = SRSItem(
-                item_id=result.item_id,
-                user_id=result.user_id,
-                content="",  # Would be populated from content database
-                next_due=datetime.now()
-            )
-        
-        # Apply SM-2 algorithm
-        updated_item = self._update_sm2_schedule(srs_item, result.quality)
-        self.srs_items[result.item_id] = updated_item
+        async with self._session() as db:
+            # Get or create SRS item
+            row = await db.get(SRSItemDB, result.item_id)
+            if row is not None:
+                srs_item = self._to_model(row)
+            else:
+                srs_item = SRSItem(
+                    item_id=result.item_id,
+                    user_id=result.user_id,
+                    content="",  # Would be populated from content database
+                    next_due=datetime.now()
+                )
+            
+            # Apply SM-2 algorithm
+            updated_item = self._update_sm2_schedule(srs_item, result.quality)
+            await db.merge(self._to_row(updated_item))
+            await db.commit()
+        self.due_queues.update(updated_item)
         
         return {
             "item_id": result.item_id,
@@ -44,6 +190,82 @@ class RetentionAgent:
             "schedule_updated": True
         }
     
+    async def report_quiz_results(self, results: List[QuizResult]) -> List[Dict[str, Any]]:
+        """
+        Apply a batch of quiz results in one vectorized SM-2 pass and one transaction.
+        Repeated answers for the same item are applied in submission order.
+        """
+        
+        if not results:
+            return []
+        now = datetime.now()
+        
+        async with self._session() as db:
+            item_ids = list(dict.fromkeys(result.item_id for result in results))
+            rows = {row.item_id: row for row in await db.scalars(select(SRSItemDB).where(SRSItemDB.item_id.in_(item_ids)))}
+            items = {
+                item_id: self._to_model(rows[item_id]) if item_id in rows else None
+                for item_id in item_ids
+            }
+            for result in results:
+                if items[result.item_id] is None:
+                    items[result.item_id] = SRSItem(
+                        item_id=result.item_id,
+                        user_id=result.user_id,
+                        content="",
+                        next_due=now
+                    )
+            
+            # Split into rounds so each item appears at most once per vectorized pass
+            rounds: List[List[int]] = []
+            seen: Dict[str, int] = {}
+            for index, result in enumerate(results):
+                occurrence = seen.get(result.item_id, 0)
+                seen[result.item_id] = occurrence + 1
+                if occurrence == len(rounds):
+                    rounds.append([])
+                rounds[occurrence].append(index)
+            
+            responses: List[Dict[str, Any]] = [None] * len(results)
+            for batch in rounds:
+                batch_items = [items[results[index].item_id] for index in batch]
+                easiness, interval, repetitions = sm2_update_arrays(
+                    np.array([item.easiness for item in batch_items], dtype=np.float64),
+                    np.array([item.interval for item in batch_items], dtype=np.int64),
+                    np.array([item.repetitions for item in batch_items], dtype=np.int64),
+                    np.array([results[index].quality for index in batch], dtype=np.int64)
+                )
+                for index, item, e, i, r in zip(batch, batch_items, easiness.tolist(),
+                                                interval.tolist(), repetitions.tolist()):
+                    item.easiness = e
+                    item.interval = i
+                    item.repetitions = r
+                    item.next_due = now + timedelta(days=i)
+                    item.last_reviewed = now
+                    responses[index] = {
+                        "item_id": item.item_id,
+                        "next_review": item.next_due.isoformat(),
+                        "interval_days": i,
+                        "easiness": e,
+                        "repetitions": r,
+                        "schedule_updated": True
+                    }
+            
+            # Loaded rows are updated in place; only new items are inserted
+            for item_id, item in items.items():
+                row = rows.get(item_id)
+                if row is None:
+                    db.add(self._to_row(item))
+                else:
+                    for field in ("easiness", "interval", "repetitions", "next_due", "last_reviewed"):
+                        setattr(row, field, getattr(item, field))
+            await db.commit()
+        
+        for item in items.values():
+            self.due_queues.update(item)
+        
+        return responses
+    
     def _update_sm2_schedule(self, item: SRSItem, quality: int) -> SRSItem:
         """
         Update SRS item using SM-2 algorithm.
@@ -86,31 +308,135 @@ class RetentionAgent:
         """Get items due for review for a specific user"""
         
         now = datetime.now()
-        due_items = [
-            item for item in self.srs_items.values()
-            if item.user_id == user_id and item.next_due <= now
-        ]
-        
-        # Sort by due date (oldest first)
-        due_items.sort(key=lambda x: x.next_due)
+        queue = self.due_queues.get(user_id) if self.single_writer else None
+        if queue is not None:
+            return queue.top_due(now, limit)
         
-        return due_items[:limit]
+        async with self._session() as db:
+            if self.single_writer:
+                # Load the user's items once; this process's writes keep the queue current
+                rows = await db.scalars(select(SRSItemDB).where(SRSItemDB.user_id == user_id))
+                queue = UserDueQueue(self._to_model(row) for row in rows)
+                self.due_queues.put(user_id, queue)
+                return queue.top_due(now, limit)
+            
+            query = (
+                select(SRSItemDB)
+                .where(SRSItemDB.user_id == user_id, SRSItemDB.next_due <= now)
+                .order_by(SRSItemDB.next_due)
+                .limit(limit)
+            )
+            return [self._to_model(row) for row in await db.scalars(query)]
     
-    async def add_item(self, user_id: str, content: str, item_id: str = None) -> SRSItem:
+    async def get_item(self, item_id: str) -> Optional[SRSItem]:
+        """Fetch a single item, or None if it does not exist"""
+        async with self._session() as db:
+            row = await db.get(SRSItemDB, item_id)
+            return self._to_model(row) if row is not None else None
+    
+    async def save_item(self, item: SRSItem) -> SRSItem:
+        """Insert or replace an item"""
+        async with self._session() as db:
+            await db.merge(self._to_row(item))
+            await db.commit()
+        self.due_queues.update(item)
+        return item
+    
+    async def add_item(self, user_id: str, content: str, item_id: str = None,
+                       next_due: Optional[datetime] = None) -> SRSItem:
         """Add a new item to the SRS system"""
         
-        if not item_id:
-            item_id = f"{user_id}_{len(self.srs_items)}"
-        
-        item = SRSItem(
-            item_id=item_id,
-            user_id=user_id,
-            content=content,
-            next_due=datetime.now()  # Due immediately for first review
+        async with self._session() as db:
+            if not item_id:
+                item_id = new_item_id(user_id)
+            
+            item = SRSItem(
+                item_id=item_id,
+                user_id=user_id,
+                content=content,
+                next_due=next_due or datetime.now()  # Due immediately for first review
+            )
+            
+            await db.merge(self._to_row(item))
+            await db.commit()
+        self.due_queues.update(item)
+        return item
+    
+    def _upsert_statement(self):
+        """Bulk INSERT that replaces rows with an existing item_id where the dialect allows it"""
+        dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(self.bind.dialect.name)
+        if dialect is None:
+            return insert(SRSItemDB)
+        statement = dialect.insert(SRSItemDB)
+        return statement.on_conflict_do_update(
+            index_elements=[SRSItemDB.item_id],
+            set_={field: statement.excluded[field] for field in SRS_FIELDS if field != "item_id"}
         )
+    
+    async def _insert_batch(self, batch: List[Dict[str, Any]]):
+        async with self._session() as db:
+            await db.execute(self._upsert_statement(), batch)
+            await db.commit()
+        for user_id in {row["user_id"] for row in batch}:
+            self.due_queues.discard(user_id)
+    
+    async def import_deck(self, stream: TextIO, fmt: str = "jsonl", batch_size: int = 5000,
+                          max_errors: int = 20) -> Dict[str, Any]:
+        """
+        Stream a CSV/JSONL deck into srs_items, one transaction per `batch_size` rows.
+        Invalid rows are skipped and reported; returns counts and throughput.
+        """
         
-        self.srs_items[item_id] = item
-        return item
+        start = time.perf_counter()
+        now = datetime.now()
+        imported = 0
+        batches = 0
+        skipped = 0
+        errors: List[str] = []
+        batch: List[Dict[str, Any]] = []
+        
+        for line_num, raw in iter_deck_rows(stream, fmt):
+            try:
+                item = parse_deck_row(raw, now)
+            except (ValueError, TypeError) as e:
+                skipped += 1
+                if len(errors) < max_errors:
+                    errors.append(f"line {line_num}: {e}")
+                continue
+            batch.append({field: getattr(item, field) for field in SRS_FIELDS})
+            if len(batch) >= batch_size:
+                await self._insert_batch(batch)
+                imported += len(batch)
+                batches += 1
+                batch = []
+        
+        if batch:
+            await self._insert_batch(batch)
+            imported += len(batch)
+            batches += 1
+        
+        elapsed = time.perf_counter() - start
+        return {
+            "imported": imported,
+            "skipped": skipped,
+            "batches": batches,
+            "seconds": round(elapsed, 3),
+            "items_per_second": round(imported / elapsed, 1) if elapsed > 0 else 0.0,
+            "errors": errors
+        }
+    
+    async def iter_items(self, user_id: Optional[str] = None, chunk_size: int = 1000) -> AsyncIterator[SRSItem]:
+        """Stream items (optionally for one user) ordered by id without loading them all"""
+        query = select(SRSItemDB).order_by(SRSItemDB.item_id).execution_options(yield_per=chunk_size)
+        if user_id is not None:
+            query = query.where(SRSItemDB.user_id == user_id)
+        async with self._session() as db:
+            async for row in await db.stream_scalars(query):
+                yield self._to_model(row)
+    
+    def export_deck(self, fmt: str = "jsonl", user_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Serialize the deck lazily as CSV or JSONL text chunks"""
+        return format_deck_items(self.iter_items(user_id), fmt)
 
-# Global agent instance
-retention_agent = RetentionAgent()
+# Global agent instance; set SRS_SINGLE_WRITER=1 only for a single API process
+retention_agent = RetentionAgent(single_writer=os.getenv("SRS_SINGLE_WRITER", "0") == "1")
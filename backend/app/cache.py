@@ -0,0 +1,139 @@
+"""
+In-process LRU/TTL cache with optional SQLite persistence.
+Used to memoize expensive LLM results keyed by content hashes.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+def content_key(*parts: Any) -> str:
+    """Stable SHA-256 key over JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class LRUCache:
+    """
+    Least-recently-used cache with per-entry TTL and entry/byte size limits.
+    Values must be JSON-serializable when `max_bytes` or `path` is set; with a
+    `path` they are written through to SQLite so they survive restarts and are
+    shared between workers. Memory-only caches without a byte limit hold any object.
+    """
+    
+    def __init__(self, max_entries: int = 10000, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()  # key -> (value, stored_at, size)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        
+        self.conn: Optional[sqlite3.Connection] = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)"
+            )
+            self.prune()
+    
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, stored_at, _ = entry
+                if not self._expired(stored_at, now):
+                    self.entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    return value
+                self._remove(key)
+                self.metrics["expirations"] += 1
+            
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    value = json.loads(row[0])
+                    self._insert(key, value, row[1], len(row[0]))
+                    self.metrics["disk_hits"] += 1
+                    return value
+            
+            self.metrics["misses"] += 1
+            return None
+    
+    def set(self, key: str, value: Any):
+        """Store a value, evicting least recently used entries over the limits"""
+        now = time.time()
+        serialized = json.dumps(value) if self.max_bytes is not None or self.conn is not None else None
+        with self.lock:
+            self._insert(key, value, now, len(serialized) if serialized is not None else 0)
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                        (key, serialized, now)
+                    )
+    
+    def _insert(self, key: str, value: Any, stored_at: float, size: int):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (value, stored_at, size)
+        self.total_bytes += size
+        
+        while self.entries and (
+            len(self.entries) > self.max_entries or
+            (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.metrics["evictions"] += 1
+    
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+    
+    def delete(self, key: str):
+        """Invalidate a key in memory and on disk"""
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+    
+    def prune(self):
+        """Delete expired rows from the SQLite store"""
+        if self.conn is not None and self.ttl_seconds is not None:
+            with self.conn:
+                self.conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM cache")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.metrics["hits"] + self.metrics["disk_hits"] + self.metrics["misses"]
+        hits = self.metrics["hits"] + self.metrics["disk_hits"]
+        return {
+            **self.metrics,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,228 @@
+"""
+Learner cohorts: mini-batch k-means clusters over the profile embeddings in the vector DB.
+Assignments are cached (optionally in a shared .npz file) and refreshed incrementally.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .db import VectorDB, vector_db
+from .vector_index import assign_nearest, minibatch_spherical_kmeans
+
+class CohortModel:
+    """
+    Groups learners by profile embedding so content variants can be cached
+    per cohort instead of per learner.
+    
+    `rebuild` clusters every stored embedding. `refresh` only folds in ids
+    added or removed since the last run: centroids take a few mini-batch
+    steps on the new vectors and only the new vectors are assigned. Once the
+    store has grown by `rebuild_growth` since the last rebuild, refresh
+    rebuilds instead. Embeddings changed in place (re-embedding) keep their
+    old cohort until the next rebuild.
+    
+    Each cohort's representative is the member closest to its centroid.
+    Cohort ids are only stable within a `version`; every rebuild bumps it.
+    With a `path`, the model is saved after each run and other processes
+    reload it when the file changes (checked at most every `check_interval` seconds).
+    """
+    
+    def __init__(self, store: VectorDB = vector_db, n_cohorts: Optional[int] = None,
+                 batch_size: int = 1024, iterations: int = 100, rebuild_growth: float = 2.0,
+                 seed: int = 0, path: Optional[str] = None, check_interval: float = 5.0):
+        self.store = store
+        self.n_cohorts = n_cohorts
+        self.batch_size = batch_size
+        self.iterations = iterations
+        self.rebuild_growth = rebuild_growth
+        self.seed = seed
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.loaded_mtime: Optional[float] = None
+        self.last_check = 0.0
+        self._install(None, None, {}, [], version=0, trained_size=0)
+        
+        if path and os.path.exists(path):
+            self.load()
+    
+    def _install(self, centroids: Optional[np.ndarray], counts: Optional[np.ndarray],
+                 assignments: Dict[str, int], representatives: List[Optional[str]],
+                 version: int, trained_size: int):
+        self.centroids = centroids
+        self.counts = counts
+        self.assignments = assignments  # user_id -> cohort
+        self.representatives = representatives  # cohort -> user_id nearest its centroid
+        self.sizes = np.bincount(
+            np.fromiter(assignments.values(), dtype=np.int64, count=len(assignments)),
+            minlength=0 if centroids is None else len(centroids)
+        )
+        self.version = version
+        self.trained_size = trained_size
+        self.updated_at = time.time()
+    
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+    
+    def cohort_count(self, n: int) -> int:
+        """
+        Number of cohorts for `n` learners (sqrt(n/2) unless fixed). Small
+        stores end up with one cohort, which callers should not rely on.
+        """
+        return max(1, min(self.n_cohorts or int(math.sqrt(n / 2)), n))
+    
+    def _snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """Ids and a copy of the vectors of every live embedding"""
+        self.store.refresh()
+        matrix = self.store.matrix
+        rows = self.store.live_rows()
+        if matrix is None or len(rows) == 0:
+            return [], np.empty((0, 0), dtype=np.float32)
+        return [self.store.row_ids[row] for row in rows.tolist()], np.asarray(matrix[rows], dtype=np.float32)
+    
+    @staticmethod
+    def _representatives(ids: List[str], vectors: np.ndarray, labels: np.ndarray,
+                         centroids: np.ndarray) -> List[Optional[str]]:
+        """Member with the highest similarity to its centroid, per cohort (None when empty)"""
+        similarity = np.einsum("ij,ij->i", vectors, centroids[labels])
+        best = np.full(len(centroids), -np.inf)
+        representatives: List[Optional[str]] = [None] * len(centroids)
+        np.maximum.at(best, labels, similarity)
+        for index in np.flatnonzero(similarity >= best[labels]).tolist():
+            if representatives[labels[index]] is None:
+                representatives[labels[index]] = ids[index]
+        return representatives
+    
+    def rebuild(self) -> Dict[str, Any]:
+        """Cluster every stored embedding from scratch"""
+        with self.lock:
+            self._rebuild(*self._snapshot())
+            self.save()
+            return self.stats()
+    
+    def _rebuild(self, ids: List[str], vectors: np.ndarray):
+        if not ids:
+            self._install(None, None, {}, [], self.version + 1, 0)
+            return
+        centroids, counts = minibatch_spherical_kmeans(
+            vectors, self.cohort_count(len(ids)), self.batch_size, self.iterations, self.seed
+        )
+        labels = assign_nearest(vectors, centroids)
+        self._install(
+            centroids, counts, dict(zip(ids, labels.tolist())),
+            self._representatives(ids, vectors, labels, centroids), self.version + 1, len(ids)
+        )
+    
+    def refresh(self) -> Dict[str, Any]:
+        """Fold in embeddings added or deleted since the last run"""
+        with self.lock:
+            self.reload()
+            ids, vectors = self._snapshot()
+            if not self.trained or len(ids) >= self.trained_size * self.rebuild_growth \
+                    or vectors.shape[1] != self.centroids.shape[1]:
+                self._rebuild(ids, vectors)
+                self.save()
+                return self.stats()
+            
+            # Copy first: cohort_of may assign single learners concurrently
+            previous = self.assignments.copy()
+            assignments = {id: previous[id] for id in ids if id in previous}
+            new = [i for i, id in enumerate(ids) if id not in assignments]
+            centroids, counts = self.centroids, self.counts
+            if new:
+                new_vectors = vectors[new]
+                steps = math.ceil(len(new) / self.batch_size)
+                centroids, counts = minibatch_spherical_kmeans(
+                    new_vectors, len(centroids), self.batch_size, steps,
+                    self.seed + self.version, centroids=centroids, counts=counts
+                )
+                labels = assign_nearest(new_vectors, centroids)
+                assignments.update(zip((ids[i] for i in new), labels.tolist()))
+            
+            labels = np.fromiter((assignments[id] for id in ids), dtype=np.int64, count=len(ids))
+            representatives = self._representatives(ids, vectors, labels, centroids)
+            self._install(centroids, counts, assignments, representatives, self.version, self.trained_size)
+            self.save()
+            return self.stats()
+    
+    def cohort_of(self, user_id: str) -> Optional[int]:
+        """
+        Cohort of a learner. Learners stored since the last refresh are
+        assigned to their nearest centroid on first lookup.
+        """
+        self.reload()
+        cohort = self.assignments.get(user_id)
+        if cohort is None and self.trained:
+            embedding = self.store.get_embedding(user_id)
+            if embedding is not None and len(embedding) == self.centroids.shape[1]:
+                cohort = int(np.argmax(self.centroids @ embedding))
+                self.assignments[user_id] = cohort
+                self.sizes[cohort] += 1
+        return cohort
+    
+    def cohort_size(self, cohort: int) -> int:
+        return int(self.sizes[cohort]) if 0 <= cohort < len(self.sizes) else 0
+    
+    def representative(self, cohort: int) -> Optional[str]:
+        """Learner closest to the cohort's centroid as of the last refresh"""
+        return self.representatives[cohort] if 0 <= cohort < len(self.representatives) else None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "trained": self.trained,
+            "version": self.version,
+            "cohorts": len(self.sizes),
+            "assigned": len(self.assignments),
+            "trained_size": self.trained_size,
+            "sizes": self.sizes.tolist(),
+            "updated_at": self.updated_at,
+        }
+    
+    def save(self):
+        """Atomically write the model to `path` (no-op without one)"""
+        if not self.path or not self.trained:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                counts=self.counts,
+                ids=np.array(list(self.assignments), dtype=str),
+                labels=np.fromiter(self.assignments.values(), dtype=np.int64, count=len(self.assignments)),
+                representatives=np.array([id or "" for id in self.representatives], dtype=str),
+                meta=np.array([self.version, self.trained_size], dtype=np.int64),
+            )
+        os.replace(tmp_path, self.path)
+        self.loaded_mtime = os.path.getmtime(self.path)
+    
+    def load(self):
+        """Replace the in-memory model with the one saved at `path`"""
+        mtime = os.path.getmtime(self.path)
+        with np.load(self.path) as data:
+            version, trained_size = data["meta"].tolist()
+            self._install(
+                data["centroids"], data["counts"],
+                dict(zip(data["ids"].tolist(), data["labels"].tolist())),
+                [id or None for id in data["representatives"].tolist()] if "representatives" in data.files else [],
+                version, trained_size
+            )
+        self.loaded_mtime = mtime
+    
+    def reload(self):
+        """Load the saved model if another process has written a newer one"""
+        if not self.path:
+            return
+        now = time.time()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        if os.path.exists(self.path) and os.path.getmtime(self.path) != self.loaded_mtime:
+            self.load()
+
+# Global cohort model over the profile embeddings
+cohort_model = CohortModel(path=os.getenv("COHORT_MODEL_PATH"))
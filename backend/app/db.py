@@ -1,21 +1,103 @@
 """
-Simple SQLite database setup with SQLAlchemy.
+Async SQLAlchemy database setup (SQLite by default, PostgreSQL via DATABASE_URL).
 Provides in-memory storage for development and testing.
 """
 
 import sqlite3
-from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime, Text, JSON
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import (
+    Column, String, Float, Integer, DateTime, Text, JSON, Index, LargeBinary, TypeDecorator,
+    bindparam, event, inspect, text, update
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import json
+import numpy as np
+from .vector_index import IVFIndex
 
-DATABASE_URL = "sqlite:///./cogniflow.db"
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cogniflow.db")
+
+# Async drivers for the plain URLs used in docker-compose and .env files
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# Applied to every new SQLite connection: WAL lets readers overlap a writer
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,  # 64 MB
+}
+
+def async_database_url(url: str) -> str:
+    """Swap a sync driver URL for its async equivalent"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False) if driver else url
+
+def create_engine_from_url(url: str, pool_size: Optional[int] = None, max_overflow: Optional[int] = None,
+                           pool_timeout: Optional[float] = None, **kwargs: Any) -> AsyncEngine:
+    """Async engine with pool sizing from arguments or DB_POOL_* variables, and SQLite pragmas"""
+    url = async_database_url(url)
+    parsed = make_url(url)
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not in_memory and "poolclass" not in kwargs:
+        # In-memory SQLite uses a single static connection, so pool sizing does not apply.
+        # aiosqlite defaults to NullPool; reuse connections so pragmas are set once each.
+        if parsed.get_backend_name() == "sqlite":
+            kwargs["poolclass"] = AsyncAdaptedQueuePool
+        kwargs["pool_size"] = pool_size or int(os.getenv("DB_POOL_SIZE", "5"))
+        kwargs["max_overflow"] = max_overflow if max_overflow is not None else int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        kwargs["pool_timeout"] = pool_timeout or float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        kwargs.setdefault("pool_pre_ping", True)
+    
+    async_engine = create_async_engine(url, **kwargs)
+    if parsed.get_backend_name() == "sqlite":
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return async_engine
+
+engine = create_engine_from_url(DATABASE_URL)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
+class Float32Vector(TypeDecorator):
+    """
+    Vector stored as a BLOB of packed little-endian float32 (1.5KB for 384 dims).
+    Reads decode zero-copy with np.frombuffer into a read-only array.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype="<f4").tobytes()
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):  # JSON text row not yet migrated
+            return np.asarray(json.loads(value), dtype="<f4")
+        return np.frombuffer(value, dtype="<f4")
+
 class ProfileDB(Base):
     __tablename__ = "profiles"
     
@@ -26,11 +108,15 @@ class ProfileDB(Base):
     anxiety_triggers = Column(Text)  # JSON string
     best_time_of_day = Column(String)
     suggestions = Column(Text)  # JSON string
-    embedding = Column(Text)  # JSON string
+    embedding = Column(Float32Vector)  # packed float32 blob
     created_at = Column(DateTime, default=datetime.now)
 
 class SRSItemDB(Base):
     __tablename__ = "srs_items"
+    __table_args__ = (
+        # Due-item queries are a range scan over one user's items ordered by due date
+        Index("ix_srs_items_user_next_due", "user_id", "next_due"),
+    )
     
     item_id = Column(String, primary_key=True)
     user_id = Column(String)
@@ -41,54 +127,600 @@ class SRSItemDB(Base):
     next_due = Column(DateTime)
     last_reviewed = Column(DateTime)
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+def _create_schema(connection):
+    Base.metadata.create_all(bind=connection)
+    # create_all skips indexes on tables that already existed
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+async def init_db(bind: AsyncEngine = engine):
+    """Initialize database tables and indexes"""
+    async with bind.begin() as connection:
+        await connection.run_sync(_create_schema)
+
+def _migrate_profile_embeddings(connection, batch_size: int = 1000) -> int:
+    inspector = inspect(connection)
+    if "profiles" not in inspector.get_table_names():
+        return 0
+    profiles = ProfileDB.__table__
+    
+    if connection.dialect.name == "sqlite":
+        # SQLite keeps the declared column type; only the stored values change
+        source = "embedding"
+        rows = connection.execute(text(
+            "SELECT user_id, embedding FROM profiles WHERE typeof(embedding) = 'text'"
+        )).all()
+    else:
+        column = next(c for c in inspector.get_columns("profiles") if c["name"] == "embedding")
+        if isinstance(column["type"], LargeBinary):
+            return 0
+        source = "embedding_json"
+        blob_type = LargeBinary().compile(dialect=connection.dialect)
+        connection.execute(text("ALTER TABLE profiles RENAME COLUMN embedding TO embedding_json"))
+        connection.execute(text(f"ALTER TABLE profiles ADD COLUMN embedding {blob_type}"))
+        rows = connection.execute(text(
+            "SELECT user_id, embedding_json FROM profiles WHERE embedding_json IS NOT NULL"
+        )).all()
+    
+    statement = (
+        update(profiles)
+        .where(profiles.c.user_id == bindparam("row_user_id"))
+        .values(embedding=bindparam("packed", type_=Float32Vector()))
+    )
+    for start in range(0, len(rows), batch_size):
+        connection.execute(statement, [
+            {"row_user_id": user_id, "packed": json.loads(embedding) if embedding else None}
+            for user_id, embedding in rows[start:start + batch_size]
+        ])
+    
+    if source != "embedding":
+        connection.execute(text(f"ALTER TABLE profiles DROP COLUMN {source}"))
+    return len(rows)
 
-def get_db():
+async def migrate_profile_embeddings(bind: AsyncEngine = engine) -> int:
+    """Rewrite JSON text embeddings of existing profiles as float32 blobs; returns rows converted"""
+    async with bind.begin() as connection:
+        return await connection.run_sync(_migrate_profile_embeddings)
+
+async def get_db() -> AsyncIterator[AsyncSession]:
     """Database session dependency"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# In-memory storage for development (replace with Redis in production)
-focus_events_store = []
-session_store = {}
+# Compact integer codes for focus event types stored in the ring buffers
+FOCUS_EVENT_CODES = {
+    "attention_drop": 0,
+    "distraction": 1,
+    "focus_restored": 2,
+}
+UNKNOWN_EVENT_CODE = -1
+
+# Confidences are summed as fixed-point integers so running totals never drift
+CONFIDENCE_SCALE = 10**9
+
+def confidence_units(confidence: float) -> int:
+    """Convert a confidence to fixed-point units for exact running sums"""
+    return int(round(confidence * CONFIDENCE_SCALE))
+
+class WindowAggregate:
+    """Running totals over the events of one session inside a sliding time window"""
+    
+    def __init__(self, window_seconds: float, start_seq: int):
+        self.window_seconds = window_seconds
+        self.start_seq = start_seq  # Sequence number of the oldest event in the window
+        self.count = 0
+        self.confidence_units = 0
+        self.distraction_count = 0
+    
+    def add(self, confidence: float, code: int):
+        self.count += 1
+        self.confidence_units += confidence_units(confidence)
+        if code == FOCUS_EVENT_CODES["distraction"]:
+            self.distraction_count += 1
+    
+    def remove(self, confidence: float, code: int):
+        self.start_seq += 1
+        self.count -= 1
+        self.confidence_units -= confidence_units(confidence)
+        if code == FOCUS_EVENT_CODES["distraction"]:
+            self.distraction_count -= 1
+    
+    @property
+    def average_confidence(self) -> float:
+        return self.confidence_units / CONFIDENCE_SCALE / self.count if self.count else 0.0
+
+class SessionEventBuffer:
+    """Fixed-capacity, time-ordered ring buffer of focus events for one session"""
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)  # epoch seconds
+        self.confidences = np.zeros(capacity, dtype=np.float64)
+        self.codes = np.zeros(capacity, dtype=np.int8)
+        self.start = 0  # Physical index of the oldest buffered event
+        self.size = 0
+        
+        # Lifetime totals so session summaries survive ring buffer wrap-around
+        self.total_events = 0
+        self.confidence_sum = 0.0
+        self.distraction_count = 0
+        self.first_timestamp: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self.last_seen = 0.0
+        
+        # Sliding-window aggregates keyed by window length in seconds
+        self.aggregates: Dict[float, WindowAggregate] = {}
+    
+    @property
+    def oldest_seq(self) -> int:
+        """Sequence number of the oldest event still held in the buffer"""
+        return self.total_events - self.size
+    
+    def _index(self, seq: int) -> int:
+        return (self.start + seq - self.oldest_seq) % self.capacity
+    
+    def append(self, timestamp: float, confidence: float, code: int):
+        """Append an event, overwriting the oldest one when the buffer is full"""
+        # Keep the buffer sorted so window lookups can binary search
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            timestamp = self.last_timestamp
+        
+        if self.size < self.capacity:
+            index = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            index = self.start
+            # The overwritten event leaves every window that still counts it
+            for aggregate in self.aggregates.values():
+                if aggregate.start_seq == self.oldest_seq:
+                    aggregate.remove(self.confidences[index], self.codes[index])
+            self.start = (self.start + 1) % self.capacity
+        
+        self.timestamps[index] = timestamp
+        self.confidences[index] = confidence
+        self.codes[index] = code
+        
+        for aggregate in self.aggregates.values():
+            aggregate.add(confidence, code)
+        
+        self.total_events += 1
+        self.confidence_sum += confidence
+        if code == FOCUS_EVENT_CODES["distraction"]:
+            self.distraction_count += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+    
+    def aggregate(self, window_seconds: float, now: float) -> WindowAggregate:
+        """
+        Get running totals for events newer than `now - window_seconds`.
+        Each event is added and expired once, so updates are amortized O(1).
+        """
+        aggregate = self.aggregates.get(window_seconds)
+        if aggregate is None:
+            aggregate = WindowAggregate(window_seconds, self.oldest_seq)
+            for seq in range(self.oldest_seq, self.total_events):
+                index = self._index(seq)
+                aggregate.add(self.confidences[index], self.codes[index])
+            self.aggregates[window_seconds] = aggregate
+        
+        cutoff = now - window_seconds
+        while aggregate.count:
+            index = self._index(aggregate.start_seq)
+            if self.timestamps[index] > cutoff:
+                break
+            aggregate.remove(self.confidences[index], self.codes[index])
+        
+        return aggregate
+    
+    def latest_confidences(self, n: int) -> np.ndarray:
+        """Return the confidences of the newest `n` events, oldest first"""
+        n = min(n, self.size)
+        indices = [self._index(seq) for seq in range(self.total_events - n, self.total_events)]
+        return self.confidences[indices]
+    
+    def window(self, since: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (timestamps, confidences, codes) of events newer than `since`, oldest first"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            segments = [slice(self.start, end)]
+        else:
+            segments = [slice(self.start, self.capacity), slice(0, end - self.capacity)]
+        
+        # Each physical segment is sorted, so only the tail after `since` is copied
+        parts = []
+        for segment in segments:
+            timestamps = self.timestamps[segment]
+            offset = int(np.searchsorted(timestamps, since, side="right"))
+            if offset < len(timestamps):
+                parts.append(slice(segment.start + offset, segment.stop))
+        
+        if not parts:
+            empty = slice(0, 0)
+            return self.timestamps[empty], self.confidences[empty], self.codes[empty]
+        if len(parts) == 1:
+            part = parts[0]
+            return self.timestamps[part], self.confidences[part], self.codes[part]
+        return (
+            np.concatenate([self.timestamps[part] for part in parts]),
+            np.concatenate([self.confidences[part] for part in parts]),
+            np.concatenate([self.codes[part] for part in parts]),
+        )
+
+class FocusEventStore:
+    """Per-session focus event storage with bounded memory and idle-session eviction"""
+    
+    def __init__(self, capacity_per_session: int = 1024, idle_ttl_seconds: float = 3600,
+                 max_sessions: int = 100000):
+        self.capacity_per_session = capacity_per_session
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, SessionEventBuffer]" = OrderedDict()
+    
+    def append(self, session_id: str, event_type: str, confidence: float,
+               timestamp: datetime) -> SessionEventBuffer:
+        """Store a single focus event and return the session's buffer"""
+        return self.append_many(session_id, [(event_type, confidence, timestamp)])
+    
+    def append_many(self, session_id: str, events: List[Tuple[str, float, datetime]]) -> SessionEventBuffer:
+        """Store a batch of (event_type, confidence, timestamp) events for one session in one pass"""
+        now = time.time()
+        buffer = self.sessions.get(session_id)
+        if buffer is None:
+            buffer = SessionEventBuffer(self.capacity_per_session)
+            self.sessions[session_id] = buffer
+        else:
+            self.sessions.move_to_end(session_id)
+        
+        buffer.last_seen = now
+        # Sort on epoch seconds: a batch may mix naive and timezone-aware datetimes
+        timed = sorted(
+            ((timestamp.timestamp(), confidence, event_type) for event_type, confidence, timestamp in events),
+            key=lambda e: e[0]
+        )
+        for timestamp, confidence, event_type in timed:
+            buffer.append(
+                timestamp,
+                confidence,
+                FOCUS_EVENT_CODES.get(event_type, UNKNOWN_EVENT_CODE)
+            )
+        self._evict_idle(now)
+        return buffer
+    
+    def get(self, session_id: str) -> Optional[SessionEventBuffer]:
+        """Get the buffer for a session, if it has any events"""
+        return self.sessions.get(session_id)
+    
+    def _evict_idle(self, now: float):
+        """Drop least recently active sessions that are idle or over the session cap"""
+        cutoff = now - self.idle_ttl_seconds
+        while self.sessions:
+            session_id, buffer = next(iter(self.sessions.items()))
+            if buffer.last_seen >= cutoff and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[session_id]
+    
+    def clear(self):
+        self.sessions.clear()
 
-# Vector DB interface stub
+# Vector DB backed by a contiguous matrix of normalized embeddings
 class VectorDB:
-    """Stub interface for vector database operations"""
+    """
+    Vector store for cosine similarity search.
+    Embeddings are normalized on insert into a float32 matrix so a query is
+    a single matrix-vector product followed by an argpartition top-k.
+    Pass an IVFIndex to answer queries approximately once the store is large.
+    
+    With a `path`, the matrix is a memory-mapped float32 file plus an
+    append-only JSONL id index in that directory. Restarts replay the index
+    without copying vectors, and every worker process maps the same pages.
+    """
+    
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024,
+                 index: Optional[IVFIndex] = None, path: Optional[str] = None):
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self.index = index
+        self.path = path
+        self._reset()
+        
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.refresh()
+    
+    def _reset(self):
+        self.matrix: Optional[np.ndarray] = None  # (capacity, dim) normalized rows
+        self.live: Optional[np.ndarray] = None  # False for tombstoned rows
+        self.row_ids: List[Optional[str]] = []  # Row -> id (None when deleted)
+        self.id_rows: Dict[str, int] = {}  # id -> row
+        self.metadata: Dict[str, dict] = {}
+        self.size = 0  # Rows in use, including tombstones
+        self.tombstones = 0
+        self._log_offset = 0  # Bytes of the id index already applied
+        self._log_inode = None
+        if self.index is not None:
+            self.index.reset()
+    
+    def __len__(self) -> int:
+        return len(self.id_rows)
+    
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "embeddings.f32")
+    
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "index.jsonl")
+    
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    def _reserve(self, rows: int):
+        """Grow the matrix geometrically so appends are amortized O(1)"""
+        capacity = 0 if self.matrix is None else len(self.matrix)
+        if rows <= capacity:
+            return
+        
+        new_capacity = max(capacity, self.initial_capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        
+        if self.path:
+            # Extend the backing file (sparse) and remap it; rows written by
+            # other processes beyond our capacity are picked up by the remap
+            row_bytes = self.dim * 4
+            with open(self._vectors_path, "ab") as f:
+                file_rows = f.tell() // row_bytes
+                if file_rows < new_capacity:
+                    f.truncate(new_capacity * row_bytes)
+            new_capacity = max(new_capacity, file_rows)
+            matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                               shape=(new_capacity, self.dim))
+        else:
+            matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+            if self.matrix is not None:
+                matrix[:self.size] = self.matrix[:self.size]
+        
+        live = np.zeros(new_capacity, dtype=bool)
+        if self.live is not None:
+            live[:self.size] = self.live[:self.size]
+        self.matrix, self.live = matrix, live
+    
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across processes sharing the same store"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, "lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _log(self, entry: dict):
+        """Append an entry to the on-disk id index"""
+        if not self.path:
+            return
+        line = (json.dumps(entry) + "\n").encode()
+        with open(self._log_path, "ab") as f:
+            f.write(line)
+        self._log_offset += len(line)
+        if self._log_inode is None:
+            self._log_inode = os.stat(self._log_path).st_ino
+    
+    def refresh(self):
+        """Apply id index entries written since the last refresh (e.g. by other workers)"""
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self._log_path)
+        except FileNotFoundError:
+            return
+        
+        # A new inode means the store was compacted, so reload from scratch
+        if self._log_inode is not None and stat.st_ino != self._log_inode:
+            self._reset()
+        self._log_inode = stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+        
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        data = data[:data.rfind(b"\n") + 1]  # Ignore a partially written last line
+        self._log_offset += len(data)
+        
+        for line in data.splitlines():
+            entry = json.loads(line)
+            if "dim" in entry:
+                self.dim = entry["dim"]
+            elif entry.get("deleted"):
+                self._remove_row(entry["id"])
+            else:
+                self._set_row(entry["id"], entry["row"], entry["metadata"])
+        
+        self._maybe_train()
+    
+    def _set_row(self, id: str, row: int, metadata: dict):
+        """Point an id at a row whose vector is already in the matrix"""
+        self._reserve(row + 1)
+        if row >= self.size:
+            self.row_ids.extend([None] * (row + 1 - self.size))
+            self.size = row + 1
+        self.row_ids[row] = id
+        self.id_rows[id] = row
+        self.live[row] = True
+        self.metadata[id] = metadata
+        
+        if self.index is not None and self.index.trained:
+            self.index.remove(row)
+            self.index.add(row, self.matrix[row])
     
-    def __init__(self):
-        self.vectors = {}  # In-memory storage for development
+    def _remove_row(self, id: str) -> bool:
+        row = self.id_rows.pop(id, None)
+        if row is None:
+            return False
+        self.live[row] = False
+        self.row_ids[row] = None
+        del self.metadata[id]
+        self.tombstones += 1
+        if self.index is not None:
+            self.index.remove(row)
+        return True
+    
+    def _maybe_train(self):
+        if self.index is not None and self.index.needs_training(len(self)):
+            rows = self.live_rows()
+            self.index.train(self.matrix[rows], rows)
     
     def store_embedding(self, id: str, embedding: list, metadata: dict = None):
-        """Store embedding with metadata"""
-        self.vectors[id] = {
-            "embedding": embedding,
-            "metadata": metadata or {}
-        }
-    
-    def search_similar(self, query_embedding: list, limit: int = 5) -> list:
-        """Search for similar embeddings (stub implementation)"""
-        # Simple cosine similarity stub
-        import numpy as np
-        
-        results = []
-        query_vec = np.array(query_embedding)
-        
-        for id, data in self.vectors.items():
-            stored_vec = np.array(data["embedding"])
-            similarity = np.dot(query_vec, stored_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(stored_vec))
-            results.append({
-                "id": id,
-                "similarity": float(similarity),
-                "metadata": data["metadata"]
-            })
-        
-        return sorted(results, key=lambda x: x["similarity"], reverse=True)[:limit]
+        """Store embedding with metadata, replacing any existing embedding for the id"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        
+        with self._write_lock():
+            if self.dim is None:
+                self.dim = len(vector)
+                self._log({"dim": self.dim})
+            if vector.shape != (self.dim,):
+                raise ValueError(f"Expected embedding of dimension {self.dim}, got {vector.shape}")
+            
+            row = self.id_rows.get(id)
+            if row is None:
+                row = self.size
+                self._reserve(row + 1)
+            
+            # Write the vector before logging its row so readers never see a partial entry
+            self.matrix[row] = self._normalize(vector)
+            self._set_row(id, row, metadata or {})
+            self._log({"id": id, "row": row, "metadata": self.metadata[id]})
+            self._maybe_train()
+    
+    def get_embedding(self, id: str) -> Optional[np.ndarray]:
+        """Get the normalized embedding stored for an id"""
+        row = self.id_rows.get(id)
+        return None if row is None else self.matrix[row]
+    
+    def delete_embedding(self, id: str) -> bool:
+        """
+        Tombstone an embedding. In memory the matrix is compacted once half
+        the rows are dead; persistent stores are compacted explicitly.
+        """
+        with self._write_lock():
+            if not self._remove_row(id):
+                return False
+            self._log({"id": id, "deleted": True})
+        
+        if not self.path and self.tombstones * 2 > self.size:
+            self.compact()
+        return True
+    
+    def compact(self):
+        """Drop tombstoned rows and rebuild the id index"""
+        if self.matrix is None:
+            return
+        
+        with self._write_lock():
+            keep = self.live_rows()
+            if self.path:
+                self._rewrite_files(keep)
+                self._reset()
+                self.refresh()
+                return
+            
+            self.matrix[:len(keep)] = self.matrix[keep]
+            self.live[:] = False
+            self.live[:len(keep)] = True
+            self.row_ids = [self.row_ids[row] for row in keep]
+            self.id_rows = {id: row for row, id in enumerate(self.row_ids)}
+            self.size = len(keep)
+            self.tombstones = 0
+            if self.index is not None and self.index.trained:
+                self.index.assign_all(self.matrix[:self.size], np.arange(self.size))
+    
+    def _rewrite_files(self, keep: np.ndarray):
+        """Atomically replace the on-disk store with only the live rows"""
+        vectors_tmp = self._vectors_path + ".tmp"
+        log_tmp = self._log_path + ".tmp"
+        
+        with open(vectors_tmp, "wb") as f:
+            f.write(np.ascontiguousarray(self.matrix[keep]).tobytes())
+        with open(log_tmp, "w") as f:
+            f.write(json.dumps({"dim": self.dim}) + "\n")
+            for new_row, row in enumerate(keep.tolist()):
+                id = self.row_ids[row]
+                f.write(json.dumps({"id": id, "row": new_row, "metadata": self.metadata[id]}) + "\n")
+        
+        os.replace(vectors_tmp, self._vectors_path)
+        os.replace(log_tmp, self._log_path)
+    
+    def flush(self):
+        """Flush memory-mapped vectors to disk"""
+        if isinstance(self.matrix, np.memmap):
+            self.matrix.flush()
+    
+    def live_rows(self) -> np.ndarray:
+        """Row numbers of all non-deleted embeddings"""
+        if self.matrix is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.live[:self.size])
+    
+    def search_similar(self, query_embedding: list, limit: int = 5, exact: bool = False,
+                       nprobe: Optional[int] = None) -> list:
+        """Search for the most similar embeddings by cosine similarity"""
+        return self.search_similar_many([query_embedding], limit, exact, nprobe)[0]
+    
+    def search_similar_many(self, query_embeddings: list, limit: int = 5, exact: bool = False,
+                            nprobe: Optional[int] = None) -> List[list]:
+        """
+        Search for the most similar embeddings for several queries at once.
+        Uses the ANN index when one is trained unless `exact` is set.
+        """
+        self.refresh()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if len(self) == 0 or limit <= 0:
+            return [[] for _ in range(len(queries))]
+        
+        queries = self._normalize(queries.reshape(len(queries), self.dim))
+        if self.index is not None and self.index.trained and not exact:
+            return [self._search_ann(query, limit, nprobe) for query in queries]
+        
+        scores = queries @ self.matrix[:self.size].T
+        scores[:, ~self.live[:self.size]] = -np.inf
+        return [
+            self._top_k(np.arange(self.size), query_scores, limit)
+            for query_scores in scores
+        ]
+    
+    def _search_ann(self, query: np.ndarray, limit: int, nprobe: Optional[int]) -> list:
+        """Score only the rows in the index buckets nearest to the query"""
+        rows = self.index.candidates(query, nprobe)
+        if len(rows) == 0:
+            return []
+        return self._top_k(rows, self.matrix[rows] @ query, limit)
+    
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, limit: int) -> list:
+        """Format the `limit` best scoring live rows, most similar first"""
+        k = min(limit, len(self), len(rows))
+        if k < len(rows):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        
+        return [
+            {
+                "id": self.row_ids[rows[i]],
+                "similarity": float(scores[i]),
+                "metadata": self.metadata[self.row_ids[rows[i]]]
+            }
+            for i in top
+        ]
 
 # Global vector DB instance
-vector_db = VectorDB()
+vector_db = VectorDB(path=os.getenv("VECTOR_DB_PATH"))
@@ -0,0 +1,72 @@
+"""
+Streaming CSV/JSONL reader and writer for spaced repetition decks.
+Rows are parsed and serialized one at a time so decks of any size use constant memory.
+"""
+
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterator, TextIO, Tuple, Union
+from .models import SRSItem
+
+DECK_FORMATS = ("csv", "jsonl")
+DECK_FIELDS = ("item_id", "user_id", "content", "easiness", "interval", "repetitions", "next_due", "last_reviewed")
+
+def new_item_id(user_id: str) -> str:
+    """Collision-free id for an item without one"""
+    return f"{user_id}_{uuid.uuid4().hex}"
+
+def _check_format(fmt: str):
+    if fmt not in DECK_FORMATS:
+        raise ValueError(f"Unsupported deck format '{fmt}', expected one of {DECK_FORMATS}")
+
+def iter_deck_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, raw row) pairs from a CSV file with a header row or a JSONL file.
+    JSONL lines are decoded in parse_deck_row so one bad line does not abort the import.
+    """
+    _check_format(fmt)
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_num, line
+
+def parse_deck_row(raw: Union[str, Dict[str, Any]], now: datetime) -> SRSItem:
+    """Validate a raw row; blank fields take their defaults and new cards are due now"""
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("expected a JSON object")
+    fields = {
+        key: value for key, value in raw.items()
+        if key in DECK_FIELDS and (value not in (None, "") or key == "content")
+    }
+    fields.setdefault("next_due", now)
+    if "item_id" not in fields and "user_id" in fields:
+        fields["item_id"] = new_item_id(fields["user_id"])
+    return SRSItem(**fields)
+
+async def format_deck_items(items: AsyncIterable[SRSItem], fmt: str) -> AsyncIterator[str]:
+    """Serialize items lazily, one line (plus a CSV header) at a time"""
+    _check_format(fmt)
+    if fmt == "jsonl":
+        async for item in items:
+            yield item.model_dump_json() + "\n"
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=DECK_FIELDS)
+    writer.writeheader()
+    async for item in items:
+        writer.writerow(item.model_dump(mode="json"))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()  # header of an empty deck
@@ -0,0 +1,103 @@
+"""
+Profile embedding components.
+Feature-hashing embedder that is stable across processes and encodes batches in one matrix product.
+"""
+
+import hashlib
+import math
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+def _label(value: Any) -> str:
+    return str(value.value) if isinstance(value, Enum) else str(value)
+
+class ProfileEmbedder(ABC):
+    """Maps profile dicts to fixed-size float32 vectors; swap in a local model by subclassing"""
+    
+    dim: int
+    
+    def encode(self, profile_data: Dict[str, Any]) -> np.ndarray:
+        """Embed a single profile"""
+        return self.encode_batch([profile_data])[0]
+    
+    @abstractmethod
+    def encode_batch(self, profiles: List[Dict[str, Any]]) -> np.ndarray:
+        """Embed many profiles at once; returns an (n, dim) float32 array"""
+        pass
+
+class FeatureHashingEmbedder(ProfileEmbedder):
+    """
+    Each feature ("key=value" for strings and list items, "key" for numbers)
+    is hashed with BLAKE2b to seed its own generator, which draws a fixed random
+    direction. A profile is the weighted sum of its feature directions, L2
+    normalized. Nothing depends on Python's hash() or NumPy's global RNG.
+    """
+    
+    def __init__(self, dim: int = 384, seed: int = 0, max_cached_features: int = 65536):
+        self.dim = dim
+        self.salt = seed.to_bytes(16, "little")
+        self.max_cached_features = max_cached_features
+        self.directions: Dict[str, np.ndarray] = {}
+    
+    def _hash(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8, salt=self.salt)
+        return int.from_bytes(digest.digest(), "little")
+    
+    def _direction(self, feature: str) -> np.ndarray:
+        direction = self.directions.get(feature)
+        if direction is None:
+            rng = np.random.default_rng(self._hash(feature))
+            direction = (rng.standard_normal(self.dim) / math.sqrt(self.dim)).astype(np.float32)
+            if len(self.directions) >= self.max_cached_features:
+                self.directions.clear()
+            self.directions[feature] = direction
+        return direction
+    
+    def features(self, profile_data: Dict[str, Any], prefix: str = "") -> List[Tuple[str, float]]:
+        """Flatten a profile into weighted features"""
+        features = []
+        for key in sorted(profile_data):
+            value = profile_data[key]
+            name = f"{prefix}{key}"
+            if isinstance(value, bool):
+                features.append((f"{name}={value}", 1.0))
+            elif isinstance(value, (int, float)):
+                # Log scale so minutes and 0-1 indices contribute comparably
+                features.append((name, math.copysign(math.log1p(abs(value)), value)))
+            elif isinstance(value, dict):
+                features.extend(self.features(value, prefix=f"{name}."))
+            elif isinstance(value, (list, tuple, set)):
+                items = sorted(_label(item) for item in value)
+                weight = 1.0 / math.sqrt(len(items)) if items else 0.0
+                features.extend((f"{name}={item}", weight) for item in items)
+            elif value is not None:
+                features.append((f"{name}={_label(value)}", 1.0))
+        return features
+    
+    def encode_batch(self, profiles: List[Dict[str, Any]]) -> np.ndarray:
+        if not profiles:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        
+        # Sparse profile x feature weights times the dense feature directions
+        vocabulary: Dict[str, int] = {}
+        rows, columns, weights = [], [], []
+        for row, profile_data in enumerate(profiles):
+            for feature, weight in self.features(profile_data):
+                rows.append(row)
+                columns.append(vocabulary.setdefault(feature, len(vocabulary)))
+                weights.append(weight)
+        
+        weight_matrix = np.zeros((len(profiles), len(vocabulary)), dtype=np.float32)
+        directions = np.zeros((len(vocabulary), self.dim), dtype=np.float32)
+        np.add.at(weight_matrix, (rows, columns), weights)
+        for feature, column in vocabulary.items():
+            directions[column] = self._direction(feature)
+        
+        embeddings = weight_matrix @ directions
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+# Default embedder used by the profile agent
+profile_embedder = FeatureHashingEmbedder()
@@ -0,0 +1,127 @@
+"""
+WebSocket streaming of focus events and live nudges.
+Coalesces upstream events per connection and pushes focus state and nudges downstream.
+"""
+
+import asyncio
+import json
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import TypeAdapter, ValidationError
+from typing import Any, Dict, List, Optional
+from .models import FocusEvent, Profile
+from .agents.focus_tracker import focus_tracker
+from .agents.nudge_agent import nudge_agent
+from .agents.profile_agent import profile_agent
+
+focus_event_list_adapter = TypeAdapter(List[FocusEvent])
+
+class FocusStreamConnection:
+    """
+    Handles one WebSocket connection for a learning session.
+    
+    Upstream messages:
+        {"type": "focus_event", "event": {...}}
+        {"type": "focus_events", "events": [...]}
+        {"type": "profile", "profile": {...}} or {"type": "profile", "user_id": "..."}
+    
+    Downstream messages:
+        {"type": "focus_state", ...}
+        {"type": "nudge", "nudge": {...}}
+        {"type": "error", "detail": ...}
+    """
+    
+    def __init__(self, websocket: WebSocket, session_id: str, max_pending: int = 500):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.max_pending = max_pending
+        self.profile: Optional[Profile] = None
+        self.user_id: Optional[str] = None
+        self.pending_events: List[FocusEvent] = []
+        self.pending_errors: List[Any] = []
+        self.needs_intervention = False
+        self.has_work = asyncio.Event()
+        self.drained = asyncio.Event()
+    
+    async def run(self):
+        """Run the reader and writer loops until the client disconnects"""
+        await self.websocket.accept()
+        
+        reader = asyncio.create_task(self._read_loop())
+        writer = asyncio.create_task(self._write_loop())
+        done, pending = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+        
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    
+    async def _read_loop(self):
+        """Receive upstream messages, pausing reads while the writer is behind"""
+        while True:
+            # Backpressure: stop reading until the writer drains the pending batch
+            while len(self.pending_events) >= self.max_pending:
+                self.drained.clear()
+                await self.drained.wait()
+            
+            message = await self.websocket.receive_text()
+            try:
+                self._handle_message(json.loads(message))
+            except (ValidationError, ValueError) as e:
+                detail = e.errors(include_url=False, include_context=False) if isinstance(e, ValidationError) else str(e)
+                self.pending_errors.append(detail)
+            self.has_work.set()
+    
+    def _handle_message(self, message: Dict[str, Any]):
+        """Validate an upstream message and queue its events"""
+        message_type = message.get("type") if isinstance(message, dict) else None
+        
+        if message_type == "profile":
+            if message.get("profile") is None and isinstance(message.get("user_id"), str):
+                # Resolved from the profile store when the first nudge is needed
+                self.profile, self.user_id = None, message["user_id"]
+            else:
+                self.profile = Profile.model_validate(message.get("profile"))
+            return
+        
+        if message_type == "focus_event":
+            events = [FocusEvent.model_validate(message.get("event"))]
+        elif message_type == "focus_events":
+            events = focus_event_list_adapter.validate_python(message.get("events"))
+        else:
+            raise ValueError(f"Unknown message type: {message_type}")
+        
+        if any(event.session_id != self.session_id for event in events):
+            raise ValueError("All events must belong to the session of this stream")
+        
+        self.pending_events.extend(events)
+    
+    async def _write_loop(self):
+        """Coalesce queued events into one analysis and send the resulting updates"""
+        while True:
+            await self.has_work.wait()
+            self.has_work.clear()
+            
+            events, self.pending_events = self.pending_events, []
+            errors, self.pending_errors = self.pending_errors, []
+            self.drained.set()
+            
+            for detail in errors:
+                await self.websocket.send_json({"type": "error", "detail": detail})
+            
+            if not events:
+                continue
+            
+            state = await focus_tracker.log_focus_events(self.session_id, events)
+            await self.websocket.send_json({"type": "focus_state", **state})
+            
+            # Only nudge when the session flips into needing an intervention
+            flipped = state["needs_intervention"] and not self.needs_intervention
+            self.needs_intervention = state["needs_intervention"]
+            if flipped and self.profile is None and self.user_id is not None:
+                self.profile = await profile_agent.get_profile(self.user_id)
+            if flipped and self.profile is not None and await nudge_agent.should_nudge(self.session_id, self.profile):
+                nudge = await nudge_agent.generate_nudge(
+                    events[-1], self.profile, {"focus_state": state}
+                )
+                await self.websocket.send_json({"type": "nudge", "nudge": nudge.model_dump()})
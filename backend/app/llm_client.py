@@ -4,11 +4,18 @@ Provides consistent API for all agent LLM interactions.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import copy
 import json
 import random
+import re
 import os
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI
+from .prompt_registry import prompt_registry
+from .cache import content_key
 
 class LLMClient(ABC):
     """Abstract base class for LLM integrations"""
@@ -24,102 +31,356 @@ class LLMClient(ABC):
     @abstractmethod
     async def generate_nudge(self, context: Dict[str, Any]) -> Dict[str, Any]:
         pass
+    
+    async def adapt_content_stream(self, text: str, profile: Dict[str, Any]) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (section, text) pairs as each variant is ready; streaming clients override this"""
+        variants = await self.adapt_content(text, profile)
+        for name in CONTENT_SECTIONS:
+            yield name, variants[name]
+    
+    async def adapt_content_batch(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, str]]:
+        """Adapt several (text, profile) items; clients that can pack them override this"""
+        return list(await asyncio.gather(*[self.adapt_content(text, profile) for text, profile in items]))
+    
+    async def generate_nudge_batch(self, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Generate several nudges; clients that can pack them override this"""
+        return list(await asyncio.gather(*[self.generate_nudge(context) for context in contexts]))
+    
+    def max_batch_items(self, method: str) -> Optional[int]:
+        """Most items one `<method>_batch` call can answer in a single completion (None: no limit)"""
+        return None
+    
+    async def aclose(self):
+        """Release network resources held by the client"""
+        pass
+
+CONTENT_SECTIONS = ("simplified", "bullets", "micro_tasks")
+
+CONTENT_SYSTEM_PROMPT = "You are a content adaptation specialist for neurodivergent learners."
+NUDGE_SYSTEM_PROMPT = "You are a supportive learning coach for neurodivergent students."
+
+# Completion tokens budgeted per answer, for single calls and per item in a batch
+ITEM_MAX_TOKENS = {"adapt_content": 800, "generate_nudge": 300}
+
+BATCH_INSTRUCTIONS = (
+    "You will receive {count} independent requests. Each starts with a line '### REQUEST <n>'.\n"
+    "Answer every request in order. Start each answer with a line '### RESPONSE <n>' "
+    "followed only by the answer in the format that request asks for.\n\n"
+)
+BATCH_RESPONSE_PATTERN = re.compile(r"^###\s*RESPONSE\s+(\d+)\s*$", re.MULTILINE)
+
+def pack_batch_prompt(prompts: List[str]) -> str:
+    """Combine several prompts into one multi-request prompt"""
+    parts = [BATCH_INSTRUCTIONS.format(count=len(prompts))]
+    for i, prompt in enumerate(prompts, start=1):
+        parts.append(f"### REQUEST {i}\n{prompt}\n\n")
+    return "".join(parts)
+
+def unpack_batch_response(content: str, count: int) -> List[Optional[str]]:
+    """Split a multi-request answer back into per-request answers (None when missing)"""
+    responses: List[Optional[str]] = [None] * count
+    pieces = BATCH_RESPONSE_PATTERN.split(content)
+    for number, body in zip(pieces[1::2], pieces[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count:
+            responses[index] = body.strip()
+    return responses
+
+def parse_content_variants(content: str) -> Optional[Dict[str, str]]:
+    """Parse SIMPLIFIED/BULLETS/MICRO_TASKS sections, or None if they are missing"""
+    try:
+        sections = content.split("SIMPLIFIED:")
+        if len(sections) > 1:
+            simplified = sections[1].split("BULLETS:")[0].strip()
+            bullets = sections[1].split("BULLETS:")[1].split("MICRO_TASKS:")[0].strip()
+            micro_tasks = sections[1].split("MICRO_TASKS:")[1].strip()
+            
+            return {
+                "simplified": simplified,
+                "bullets": bullets,
+                "micro_tasks": micro_tasks
+            }
+    except (AttributeError, IndexError):
+        pass
+    return None
+
+class ContentVariantStreamParser:
+    """
+    Incrementally splits a streamed adaptation into its sections.
+    A section is complete as soon as the marker of the next one arrives.
+    """
+    
+    MARKERS = (("simplified", "SIMPLIFIED:"), ("bullets", "BULLETS:"), ("micro_tasks", "MICRO_TASKS:"))
+    
+    def __init__(self):
+        self.buffer = ""
+        self.section = -1  # Index of the section currently being received
+        self.section_start = 0
+        self.search_from = 0
+    
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Add streamed text and return sections completed by it"""
+        self.buffer += text
+        completed = []
+        while self.section + 1 < len(self.MARKERS):
+            marker = self.MARKERS[self.section + 1][1]
+            position = self.buffer.find(marker, self.search_from)
+            if position < 0:
+                break
+            if self.section >= 0:
+                completed.append((self.MARKERS[self.section][0], self.buffer[self.section_start:position].strip()))
+            self.section += 1
+            self.section_start = self.search_from = position + len(marker)
+        
+        # Only rescan the tail where a marker split across chunks could start
+        longest = max(len(marker) for _, marker in self.MARKERS)
+        self.search_from = max(self.section_start, len(self.buffer) - longest)
+        return completed
+    
+    def close(self) -> List[Tuple[str, str]]:
+        """Return the final section once the stream has ended"""
+        if self.section < 0:
+            return []
+        return [(self.MARKERS[self.section][0], self.buffer[self.section_start:].strip())]
+
+# Transient upstream failures worth retrying
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
 
 class OpenAIClient(LLMClient):
-    """OpenAI API client for production use"""
+    """
+    Non-blocking OpenAI API client for production use.
+    Shares one pooled HTTP connection pool, caps in-flight requests with a
+    semaphore and retries transient failures with jittered exponential backoff.
+    """
     
-    def __init__(self, api_key: str = None):
-        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = "gpt-3.5-turbo",
+                 max_concurrency: int = 16, max_connections: int = 64, timeout_seconds: float = 30.0,
+                 max_retries: int = 3, backoff_base_seconds: float = 0.5, backoff_max_seconds: float = 8.0,
+                 max_batch_tokens: int = 4000, http_client: httpx.AsyncClient = None):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout_seconds)
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+            http_client=self.http_client,
+            timeout=timeout_seconds,
+            max_retries=0  # Retries are handled by _complete
+        )
+    
+    async def _complete(self, system_prompt: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        """Run a chat completion with bounded concurrency and retries"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                return response.choices[0].message.content
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter keeps retries from many requests from synchronizing
+                backoff = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, backoff))
+    
+    async def _complete_stream(self, system_prompt: str, prompt: str, temperature: float,
+                               max_tokens: int) -> AsyncIterator[str]:
+        """Stream a chat completion's text; only opening the stream is retried"""
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True
+                    )
+                    break
+                except RETRYABLE_ERRORS:
+                    if attempt == self.max_retries:
+                        raise
+                    backoff = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+                    await asyncio.sleep(random.uniform(0, backoff))
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    async def aclose(self):
+        await self.http_client.aclose()
     
     async def summarize_profile(self, onboarding_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generate learner profile using OpenAI"""
         
-        # Load prompt template
-        with open("app/prompts/profile_prompt.txt", "r") as f:
-            prompt_template = f.read()
-        
-        prompt = prompt_template.format(onboarding_data=json.dumps(onboarding_data, indent=2))
+        prompt = prompt_registry.render("profile", onboarding_data=onboarding_data)
         
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a learning profile analyzer for neurodivergent students."},
-                {"role": "user", "content": prompt}
-            ],
+        content = await self._complete(
+            "You are a learning profile analyzer for neurodivergent students.",
+            prompt,
             temperature=0.3,
             max_tokens=500
         )
         
         try:
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except json.JSONDecodeError:
             # Fallback to stub response if JSON parsing fails
-            return LocalStubClient().summarize_profile(onboarding_data)
+            return await LocalStubClient().summarize_profile(onboarding_data)
     
     async def adapt_content(self, text: str, profile: Dict[str, Any]) -> Dict[str, str]:
         """Adapt content using OpenAI"""
         
-        with open("app/prompts/content_adapter_prompt.txt", "r") as f:
-            prompt_template = f.read()
+        prompt = prompt_registry.render("content_adapter", content=text, profile=profile)
         
-        prompt = prompt_template.format(
-            content=text,
-            profile=json.dumps(profile, indent=2)
-        )
-        
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a content adaptation specialist for neurodivergent learners."},
-                {"role": "user", "content": prompt}
-            ],
+        content = await self._complete(
+            CONTENT_SYSTEM_PROMPT,
+            prompt,
             temperature=0.3,
-            max_tokens=800
+            max_tokens=ITEM_MAX_TOKENS["adapt_content"]
         )
         
-        content = response.choices[0].message.content
-        
-        # Parse the structured response
-        try:
-            sections = content.split("SIMPLIFIED:")
-            if len(sections) > 1:
-                simplified = sections[1].split("BULLETS:")[0].strip()
-                bullets = sections[1].split("BULLETS:")[1].split("MICRO_TASKS:")[0].strip()
-                micro_tasks = sections[1].split("MICRO_TASKS:")[1].strip()
-                
-                return {
-                    "simplified": simplified,
-                    "bullets": bullets,
-                    "micro_tasks": micro_tasks
-                }
-        except:
-            pass
-        
-        # Fallback to stub if parsing fails
-        return await LocalStubClient().adapt_content(text, profile)
+        # Parse the structured response, falling back to stub if parsing fails
+        variants = parse_content_variants(content)
+        if variants is None:
+            return await LocalStubClient().adapt_content(text, profile)
+        return variants
     
     async def generate_nudge(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Generate nudge using OpenAI"""
         
-        with open("app/prompts/nudge_prompt.txt", "r") as f:
-            prompt_template = f.read()
-        
-        prompt = prompt_template.format(context=json.dumps(context, indent=2))
-        
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a supportive learning coach for neurodivergent students."},
-                {"role": "user", "content": prompt}
-            ],
+        content = await self._complete(
+            NUDGE_SYSTEM_PROMPT,
+            self._nudge_prompt(context),
             temperature=0.5,
-            max_tokens=300
+            max_tokens=ITEM_MAX_TOKENS["generate_nudge"]
         )
         
         try:
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except json.JSONDecodeError:
             return await LocalStubClient().generate_nudge(context)
+    
+    async def adapt_content_stream(self, text: str, profile: Dict[str, Any]) -> AsyncIterator[Tuple[str, str]]:
+        """Adapt content using OpenAI, yielding each section as soon as it is complete"""
+        
+        prompt = prompt_registry.render("content_adapter", content=text, profile=profile)
+        parser = ContentVariantStreamParser()
+        emitted = set()
+        
+        async for delta in self._complete_stream(CONTENT_SYSTEM_PROMPT, prompt, temperature=0.3,
+                                                  max_tokens=ITEM_MAX_TOKENS["adapt_content"]):
+            for name, section in parser.feed(delta):
+                emitted.add(name)
+                yield name, section
+        for name, section in parser.close():
+            emitted.add(name)
+            yield name, section
+        
+        # Fill sections the model never produced from the stub, as adapt_content does
+        if len(emitted) < len(CONTENT_SECTIONS):
+            fallback = await LocalStubClient().adapt_content(text, profile)
+            for name in CONTENT_SECTIONS:
+                if name not in emitted:
+                    yield name, fallback[name]
+    
+    def _nudge_prompt(self, context: Dict[str, Any]) -> str:
+        # The template shows the profile separately from the rest of the situation
+        situation = {key: value for key, value in context.items() if key != "profile"}
+        return prompt_registry.render("nudge", profile=context.get("profile", {}), context=situation)
+    
+    def max_batch_items(self, method: str) -> Optional[int]:
+        # Every answer in a batch gets the same token budget as a single call
+        return max(1, self.max_batch_tokens // ITEM_MAX_TOKENS[method])
+    
+    async def _split_batch(self, method: str, items: List[Any]) -> Optional[List[Any]]:
+        """Results of batches too large for one completion, sent as several; None if it fits"""
+        size = self.max_batch_items(method)
+        if len(items) <= size:
+            return None
+        chunks = await asyncio.gather(*[
+            getattr(self, f"{method}_batch")(items[start:start + size])
+            for start in range(0, len(items), size)
+        ])
+        return [result for chunk in chunks for result in chunk]
+    
+    async def adapt_content_batch(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, str]]:
+        """Adapt several texts with one multi-request completion per `max_batch_items`"""
+        if len(items) == 1:
+            return [await self.adapt_content(*items[0])]
+        split = await self._split_batch("adapt_content", items)
+        if split is not None:
+            return split
+        
+        prompts = [
+            prompt_registry.render("content_adapter", content=text, profile=profile)
+            for text, profile in items
+        ]
+        content = await self._complete(
+            CONTENT_SYSTEM_PROMPT,
+            pack_batch_prompt(prompts),
+            temperature=0.3,
+            max_tokens=ITEM_MAX_TOKENS["adapt_content"] * len(items)
+        )
+        
+        responses = unpack_batch_response(content, len(items))
+        results = [parse_content_variants(response) if response else None for response in responses]
+        
+        # Items the combined answer missed or garbled are retried on their own
+        missing = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(*[self.adapt_content(*items[i]) for i in missing])
+        for i, result in zip(missing, retried):
+            results[i] = result
+        return results
+    
+    async def generate_nudge_batch(self, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Generate several nudges with one multi-request completion per `max_batch_items`"""
+        if len(contexts) == 1:
+            return [await self.generate_nudge(contexts[0])]
+        split = await self._split_batch("generate_nudge", contexts)
+        if split is not None:
+            return split
+        
+        content = await self._complete(
+            NUDGE_SYSTEM_PROMPT,
+            pack_batch_prompt([self._nudge_prompt(context) for context in contexts]),
+            temperature=0.5,
+            max_tokens=ITEM_MAX_TOKENS["generate_nudge"] * len(contexts)
+        )
+        
+        results = []
+        for response in unpack_batch_response(content, len(contexts)):
+            try:
+                results.append(json.loads(response) if response else None)
+            except json.JSONDecodeError:
+                results.append(None)
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(*[self.generate_nudge(contexts[i]) for i in missing])
+        for i, result in zip(missing, retried):
+            results[i] = result
+        return results
 
 class LocalStubClient(LLMClient):
     """Deterministic stub for testing and development"""
@@ -167,7 +428,138 @@ class LocalStubClient(LLMClient):
         ]
         return random.choice(nudges)
 
+class MicroBatchingClient(LLMClient):
+    """
+    Queues adapt_content and generate_nudge calls for up to `max_wait_ms` and
+    sends each queue to the wrapped client's batch method as one request,
+    flushing early once `max_batch_size` calls are waiting (or fewer, if the
+    wrapped client's `max_batch_items` cannot fit that many in one completion).
+    """
+    
+    BATCHED_METHODS = ("adapt_content", "generate_nudge")
+    
+    def __init__(self, client: LLMClient, max_batch_size: int = 8, max_wait_ms: float = 10):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.queues: Dict[str, List[Tuple[Any, asyncio.Future]]] = {method: [] for method in self.BATCHED_METHODS}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.tasks = set()  # Keeps dispatch tasks referenced until they finish
+        self.metrics = {"requests": 0, "upstream_batches": 0, "largest_batch": 0}
+    
+    async def _submit(self, method: str, item: Any) -> Any:
+        self.metrics["requests"] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self.queues[method]
+        queue.append((item, future))
+        
+        if len(queue) >= self.batch_limit(method):
+            self._flush(method)
+        elif method not in self.timers:
+            self.timers[method] = loop.call_later(self.max_wait_seconds, self._flush, method)
+        return await future
+    
+    def batch_limit(self, method: str) -> int:
+        """Queue length that triggers an early flush"""
+        return min(self.max_batch_size, self.client.max_batch_items(method) or self.max_batch_size)
+    
+    def _flush(self, method: str):
+        timer = self.timers.pop(method, None)
+        if timer is not None:
+            timer.cancel()
+        batch, self.queues[method] = self.queues[method], []
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(method, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+    
+    async def _dispatch(self, method: str, batch: List[Tuple[Any, asyncio.Future]]):
+        self.metrics["upstream_batches"] += 1
+        self.metrics["largest_batch"] = max(self.metrics["largest_batch"], len(batch))
+        try:
+            results = await getattr(self.client, f"{method}_batch")([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def summarize_profile(self, onboarding_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.client.summarize_profile(onboarding_data)
+    
+    async def adapt_content(self, text: str, profile: Dict[str, Any]) -> Dict[str, str]:
+        return await self._submit("adapt_content", (text, profile))
+    
+    async def generate_nudge(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._submit("generate_nudge", context)
+    
+    async def adapt_content_stream(self, text: str, profile: Dict[str, Any]) -> AsyncIterator[Tuple[str, str]]:
+        async for item in self.client.adapt_content_stream(text, profile):
+            yield item
+    
+    async def aclose(self):
+        await self.client.aclose()
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.metrics)
+
+class SingleFlightClient(LLMClient):
+    """
+    Deduplicates concurrent identical requests to a wrapped client.
+    The first caller starts the upstream call; callers with the same
+    arguments that arrive before it finishes await the same result.
+    """
+    
+    def __init__(self, client: LLMClient):
+        self.client = client
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.metrics = {"calls": 0, "upstream_calls": 0, "collapsed": 0}
+    
+    async def _call(self, method: str, *args) -> Any:
+        self.metrics["calls"] += 1
+        key = content_key(method, *args)
+        
+        future = self.in_flight.get(key)
+        if future is None:
+            self.metrics["upstream_calls"] += 1
+            future = asyncio.ensure_future(getattr(self.client, method)(*args))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.metrics["collapsed"] += 1
+        
+        # Shield so one cancelled waiter doesn't cancel the call for the others,
+        # and copy so waiters can adjust their result independently
+        result = await asyncio.shield(future)
+        return copy.deepcopy(result)
+    
+    async def summarize_profile(self, onboarding_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("summarize_profile", onboarding_data)
+    
+    async def adapt_content(self, text: str, profile: Dict[str, Any]) -> Dict[str, str]:
+        return await self._call("adapt_content", text, profile)
+    
+    async def generate_nudge(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("generate_nudge", context)
+    
+    async def adapt_content_stream(self, text: str, profile: Dict[str, Any]) -> AsyncIterator[Tuple[str, str]]:
+        # Streams are consumed incrementally, so they are not shared between callers
+        async for item in self.client.adapt_content_stream(text, profile):
+            yield item
+    
+    async def aclose(self):
+        await self.client.aclose()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counts of calls received, sent upstream and collapsed into in-flight ones"""
+        return {**self.metrics, "in_flight": len(self.in_flight)}
+
 # Global client instance - can be swapped for OpenAI in production
-llm_client = LocalStubClient()
-# Uncomment for OpenAI integration:
-# llm_client = OpenAIClient()
+llm_client = SingleFlightClient(LocalStubClient())
+# Uncomment for OpenAI integration (identical calls collapsed, the rest micro-batched):
+# llm_client = SingleFlightClient(MicroBatchingClient(OpenAIClient()))
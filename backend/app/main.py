@@ -6,7 +6,9 @@ Mounts agent routes and provides session orchestration.
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from .routes import router
-from .db import init_db
+from .db import init_db, engine, vector_db
+from .llm_client import llm_client
+from .pipeline import job_queue
 
 app = FastAPI(
     title="CogniFlow API",
@@ -26,7 +28,15 @@ app.add_middleware(
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    await init_db()
+
+# Flush memory-mapped embeddings, stop workers and close LLM and database connections on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    vector_db.flush()
+    await job_queue.close()
+    await llm_client.aclose()
+    await engine.dispose()
 
 # Mount agent routes
 app.include_router(router, prefix="/api")
@@ -3,7 +3,7 @@ Pydantic models for CogniFlow data structures.
 Defines schemas for profiles, content variants, focus events, and nudges.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -45,8 +45,18 @@ class ContentVariant(BaseModel):
 
 class ContentRequest(BaseModel):
     raw_text: str
-    profile: Profile
+    profile: Optional[Profile] = None
+    user_id: Optional[str] = None  # look up the stored profile instead of sending it
     subject: Optional[str] = None
+    
+    @model_validator(mode="after")
+    def check_profile_source(self) -> "ContentRequest":
+        if self.profile is None and self.user_id is None:
+            raise ValueError("Either profile or user_id is required")
+        return self
+
+class PrecomputeRequest(BaseModel):
+    lessons: List[str] = Field(min_length=1)
 
 class FocusEvent(BaseModel):
     session_id: str
@@ -78,6 +88,9 @@ class QuizResult(BaseModel):
     response_time_ms: int
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class QuizResultBatch(BaseModel):
+    results: List[QuizResult] = Field(min_length=1)
+
 class SessionStep(BaseModel):
     session_id: str
     user_id: str
@@ -0,0 +1,116 @@
+"""
+Background pipeline that precomputes lesson variants for the course catalog.
+Uses an rq queue when REDIS_URL is set, otherwise an in-process worker pool.
+
+With Redis, run a worker next to the API:
+    rq worker lesson_variants --url $REDIS_URL
+and point PRECOMPUTED_VARIANTS_PATH of both at the same SQLite file.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Optional
+from .agents.content_adapter import content_adapter
+
+try:
+    from redis import Redis
+    from rq import Queue
+except ImportError:  # rq is optional; fall back to the local queue
+    Redis = None
+    Queue = None
+
+async def precompute_lesson(raw_text: str) -> int:
+    """Generate every missing bucket variant for one lesson"""
+    return await content_adapter.precompute(raw_text)
+
+# Event loop shared by every job an rq worker process runs. The global LLM
+# clients pool connections and hold locks bound to the loop that first used
+# them, so a fresh loop per job (asyncio.run) would break the second job.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def run_in_worker_loop(coroutine: Awaitable[Any]) -> Any:
+    """Run a coroutine to completion on this process's persistent event loop"""
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coroutine)
+
+def precompute_lesson_job(raw_text: str) -> int:
+    """Synchronous entry point for rq workers"""
+    return run_in_worker_loop(precompute_lesson(raw_text))
+
+class LocalJobQueue:
+    """In-process stand-in for an rq queue running coroutine jobs on worker tasks"""
+    
+    def __init__(self, workers: int = 2):
+        self.worker_count = workers
+        self.queue: asyncio.Queue = None
+        self.workers: List[asyncio.Task] = []
+        self.metrics = {"enqueued": 0, "completed": 0, "failed": 0}
+    
+    def _ensure_workers(self):
+        # Created lazily so the queue binds to the running event loop
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+    
+    async def _work(self):
+        while True:
+            job, args = await self.queue.get()
+            try:
+                await job(*args)
+                self.metrics["completed"] += 1
+            except Exception:
+                self.metrics["failed"] += 1
+            finally:
+                self.queue.task_done()
+    
+    def enqueue(self, job: Callable[..., Any], *args: Any):
+        self._ensure_workers()
+        self.queue.put_nowait((job, args))
+        self.metrics["enqueued"] += 1
+    
+    async def join(self):
+        """Wait until every enqueued job has finished"""
+        if self.queue is not None:
+            await self.queue.join()
+    
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.queue = None
+        self.workers = []
+    
+    def stats(self) -> dict:
+        pending = self.queue.qsize() if self.queue is not None else 0
+        return {"backend": "local", "pending": pending, **self.metrics}
+
+class RQJobQueue:
+    """Redis-backed queue; jobs run in separate `rq worker` processes"""
+    
+    def __init__(self, redis_url: str, name: str = "lesson_variants"):
+        self.queue = Queue(name, connection=Redis.from_url(redis_url))
+    
+    def enqueue(self, job: Callable[..., Any], *args: Any):
+        self.queue.enqueue(job, *args)
+    
+    async def join(self):
+        pass
+    
+    async def close(self):
+        pass
+    
+    def stats(self) -> dict:
+        return {"backend": "rq", "pending": self.queue.count}
+
+def enqueue_lessons(lessons: List[str]) -> int:
+    """Queue precomputation for each lesson text"""
+    job = precompute_lesson_job if isinstance(job_queue, RQJobQueue) else precompute_lesson
+    for raw_text in lessons:
+        job_queue.enqueue(job, raw_text)
+    return len(lessons)
+
+# Global job queue
+_redis_url = os.getenv("REDIS_URL")
+job_queue = RQJobQueue(_redis_url) if _redis_url and Queue is not None else LocalJobQueue()
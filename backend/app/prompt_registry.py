@@ -0,0 +1,122 @@
+"""
+Prompt template registry for LLM calls.
+Loads and validates templates once, re-reads them when the files change.
+"""
+
+import json
+import os
+import string
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Template name -> placeholders it must define
+PROMPT_FIELDS = {
+    "profile": {"onboarding_data"},
+    "content_adapter": {"profile", "content"},
+    "nudge": {"profile", "context"},
+}
+
+def compact_json(value: Any) -> str:
+    """Serialize prompt values without indentation to keep token counts down"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class PromptTemplate:
+    """A template pre-split into literal text and placeholder names"""
+    
+    def __init__(self, name: str, path: str, text: str, mtime: float):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.segments: List[Tuple[str, Optional[str]]] = []
+        
+        fields = set()
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            if field is not None and (field == "" or format_spec or conversion):
+                raise ValueError(f"Prompt '{name}' has an unsupported placeholder: {{{field}}}")
+            self.segments.append((literal, field))
+            if field is not None:
+                fields.add(field)
+        
+        expected = PROMPT_FIELDS.get(name)
+        if expected is not None and fields != expected:
+            raise ValueError(
+                f"Prompt '{name}' placeholders {sorted(fields)} do not match expected {sorted(expected)}"
+            )
+        self.fields = fields
+    
+    def render(self, **values: Any) -> str:
+        """Fill placeholders; non-string values are serialized as compact JSON"""
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field is not None:
+                value = values[field]
+                parts.append(value if isinstance(value, str) else compact_json(value))
+        return "".join(parts)
+
+class PromptRegistry:
+    """
+    Holds every `<name>_prompt.txt` template in a directory.
+    With hot reload enabled, file modification times are checked at most
+    once per `check_interval` seconds and changed templates are re-validated.
+    """
+    
+    def __init__(self, directory: str = PROMPTS_DIR, hot_reload: bool = True, check_interval: float = 2.0):
+        self.directory = directory
+        self.hot_reload = hot_reload
+        self.check_interval = check_interval
+        self.templates: Dict[str, PromptTemplate] = {}
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        self.load()
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}_prompt.txt")
+    
+    def _read(self, name: str) -> PromptTemplate:
+        path = self._path(name)
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return PromptTemplate(name, path, text, os.path.getmtime(path))
+    
+    def load(self):
+        """Load and validate all templates, failing fast on errors"""
+        names = [
+            filename[:-len("_prompt.txt")]
+            for filename in sorted(os.listdir(self.directory))
+            if filename.endswith("_prompt.txt")
+        ]
+        missing = set(PROMPT_FIELDS) - set(names)
+        if missing:
+            raise FileNotFoundError(f"Missing prompt templates: {sorted(missing)}")
+        
+        self.templates = {name: self._read(name) for name in names}
+        self.last_check = time.monotonic()
+    
+    def reload_changed(self):
+        """Re-read templates whose files changed; invalid edits keep the previous version"""
+        for name, template in list(self.templates.items()):
+            try:
+                if os.path.getmtime(template.path) != template.mtime:
+                    self.templates[name] = self._read(name)
+            except (OSError, ValueError):
+                continue
+    
+    def get(self, name: str) -> PromptTemplate:
+        if self.hot_reload:
+            now = time.monotonic()
+            if now - self.last_check >= self.check_interval:
+                with self.lock:
+                    if now - self.last_check >= self.check_interval:
+                        self.last_check = now
+                        self.reload_changed()
+        return self.templates[name]
+    
+    def render(self, name: str, **values: Any) -> str:
+        return self.get(name).render(**values)
+
+# Global registry loaded at startup
+prompt_registry = PromptRegistry(hot_reload=os.getenv("PROMPT_HOT_RELOAD", "1") != "0")
@@ -3,18 +3,44 @@ FastAPI routes for CogniFlow agents and session orchestration.
 Provides REST API endpoints for all agent interactions.
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, Body
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from .models import *
 from .agents.profile_agent import profile_agent
-from .agents.content_adapter import content_adapter
+from .agents.content_adapter import content_adapter, PROFILE_BUCKETS
 from .agents.focus_tracker import focus_tracker
 from .agents.nudge_agent import nudge_agent
 from .agents.retention_agent import retention_agent
-from .db import get_db, session_store
-from typing import Dict, Any
+from .cohorts import cohort_model
+from .db import get_db
+from .stores import session_store
+from .llm_client import llm_client
+from .focus_stream import FocusStreamConnection
+from .pipeline import enqueue_lessons, job_queue
+from .decks import DECK_FORMATS
+from typing import Dict, Any, List, Optional
+import asyncio
+import io
+import json
+import tempfile
 
 router = APIRouter()
 
+# Validates a whole batch of focus events in a single pass
+focus_event_batch_adapter = TypeAdapter(List[FocusEvent])
+
+async def resolve_profile(profile: Optional[Profile], user_id: Optional[str]) -> Profile:
+    """Use the profile sent by the client, else the stored profile for user_id"""
+    if profile is not None:
+        return profile
+    if user_id is None:
+        raise HTTPException(status_code=422, detail="Either profile or user_id is required")
+    stored = await profile_agent.get_profile(user_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return stored
+
 # Profile Agent Routes
 @router.post("/agents/profile/build", response_model=Profile)
 async def build_profile(user_id: str, onboarding_data: OnboardingData):
@@ -25,16 +51,94 @@ async def build_profile(user_id: str, onboarding_data: OnboardingData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/profile/{user_id}", response_model=Profile)
+async def get_profile(user_id: str):
+    """Get a stored learner profile"""
+    return await resolve_profile(None, user_id)
+
+@router.get("/agents/profile/{user_id}/similar")
+async def get_similar_learners(user_id: str, limit: int = 5):
+    """Learners with the most similar profile embeddings"""
+    similar = profile_agent.similar_learners(user_id, limit)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Profile embedding not found")
+    return {"user_id": user_id, "similar": similar}
+
+@router.get("/agents/profile/{user_id}/cohort")
+async def get_learner_cohort(user_id: str):
+    """Cohort a learner belongs to (cohorts are built by POST /agents/cohorts/refresh)"""
+    cohort = cohort_model.cohort_of(user_id)
+    if cohort is None:
+        raise HTTPException(status_code=404, detail="Learner has no cohort")
+    return {
+        "user_id": user_id,
+        "cohort": cohort,
+        "version": cohort_model.version,
+        "size": cohort_model.cohort_size(cohort)
+    }
+
+# Cohort Routes
+@router.post("/agents/cohorts/refresh")
+async def refresh_cohorts(rebuild: bool = False):
+    """Fold new profile embeddings into the cohorts, or recluster all of them with rebuild=true"""
+    try:
+        # Clustering is CPU bound; keep the event loop responsive
+        job = cohort_model.rebuild if rebuild else cohort_model.refresh
+        return await asyncio.to_thread(job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/cohorts/stats")
+async def get_cohort_stats():
+    """Get cohort count, sizes and model version"""
+    return cohort_model.stats()
+
 # Content Adapter Routes
 @router.post("/agents/content/convert", response_model=ContentVariant)
 async def convert_content(request: ContentRequest):
     """Convert content to multiple adapted variants"""
+    request.profile = await resolve_profile(request.profile, request.user_id)
     try:
         variants = await content_adapter.convert_content(request)
         return variants
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/agents/content/convert/stream")
+async def convert_content_stream(request: ContentRequest):
+    """
+    Stream adapted content variants as NDJSON, one line per section as soon as
+    it is generated, followed by a final {"done": true} line.
+    """
+    request.profile = await resolve_profile(request.profile, request.user_id)
+    
+    async def ndjson_lines():
+        try:
+            async for section, content in content_adapter.convert_content_stream(request):
+                yield json.dumps({"section": section, "content": content}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@router.post("/agents/content/precompute")
+async def precompute_lessons(request: PrecomputeRequest):
+    """Queue background generation of lesson variants for every profile bucket"""
+    try:
+        enqueued = enqueue_lessons(request.lessons)
+        return {"enqueued": enqueued, "buckets": len(PROFILE_BUCKETS), "queue": job_queue.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/content/cache/stats")
+async def get_content_cache_stats():
+    """Get hit/miss metrics for the content adaptation cache and LLM call coalescing"""
+    return {
+        "cache": content_adapter.cache.stats(),
+        "llm": llm_client.stats()
+    }
+
 # Focus Tracker Routes
 @router.post("/agents/focus/events")
 async def log_focus_event(event: FocusEvent):
@@ -45,6 +149,36 @@ async def log_focus_event(event: FocusEvent):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/agents/focus/session/{session_id}/events")
+async def log_focus_events(session_id: str, request: Request):
+    """
+    Log a batch of focus events for a session.
+    Accepts a JSON array or an NDJSON stream (Content-Type: application/x-ndjson).
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        lines = [line for line in body.splitlines() if line.strip()]
+        body = b"[" + b",".join(lines) + b"]"
+    
+    try:
+        events = focus_event_batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    
+    if any(event.session_id != session_id for event in events):
+        raise HTTPException(status_code=422, detail="All events must belong to the session in the path")
+    
+    try:
+        result = await focus_tracker.log_focus_events(session_id, events)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.websocket("/agents/focus/session/{session_id}/stream")
+async def stream_focus_events(websocket: WebSocket, session_id: str):
+    """Stream focus events upstream and receive focus state and nudges downstream"""
+    await FocusStreamConnection(websocket, session_id).run()
+
 @router.get("/agents/focus/session/{session_id}/summary")
 async def get_focus_summary(session_id: str):
     """Get focus summary for a session"""
@@ -56,14 +190,21 @@ async def get_focus_summary(session_id: str):
 
 # Nudge Agent Routes
 @router.post("/agents/nudge/act", response_model=NudgeAction)
-async def generate_nudge(focus_event: FocusEvent, profile: Profile, context: Dict[str, Any] = {}):
-    """Generate contextual nudge based on focus state"""
+async def generate_nudge(focus_event: FocusEvent, profile: Optional[Profile] = None,
+                         user_id: Optional[str] = Body(None), context: Dict[str, Any] = {}):
+    """Generate contextual nudge based on focus state; send a profile or just its user_id"""
+    profile = await resolve_profile(profile, user_id)
     try:
         nudge = await nudge_agent.generate_nudge(focus_event, profile, context)
         return nudge
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/nudge/stats")
+async def get_nudge_stats():
+    """Get how many nudges came from templates versus the LLM"""
+    return nudge_agent.stats()
+
 # Retention Agent Routes
 @router.post("/agents/retention/report")
 async def report_quiz_result(result: QuizResult):
@@ -74,6 +215,41 @@ async def report_quiz_result(result: QuizResult):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/agents/retention/report/batch")
+async def report_quiz_results(batch: QuizResultBatch):
+    """Report a whole quiz's results and update their SRS schedules in one pass"""
+    try:
+        schedule_updates = await retention_agent.report_quiz_results(batch.results)
+        return {"results": schedule_updates}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/agents/retention/import")
+async def import_deck(request: Request, format: str = "jsonl", batch_size: int = 5000):
+    """
+    Import a CSV (with header) or JSONL deck from the raw request body.
+    The upload is spooled to a temporary file and parsed row by row.
+    """
+    if format not in DECK_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {DECK_FORMATS}")
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+            async for chunk in request.stream():
+                spool.write(chunk)
+            spool.seek(0)
+            stream = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            return await retention_agent.import_deck(stream, format, batch_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/retention/export")
+async def export_deck(format: str = "jsonl", user_id: str = None):
+    """Stream the deck (optionally one user's items) as CSV or JSONL"""
+    if format not in DECK_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {DECK_FORMATS}")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(retention_agent.export_deck(format, user_id), media_type=media_type)
+
 @router.get("/agents/retention/due/{user_id}")
 async def get_due_items(user_id: str, limit: int = 10):
     """Get items due for review"""
@@ -88,11 +264,8 @@ async def get_due_items(user_id: str, limit: int = 10):
 async def orchestrate_session_step(session_id: str, step: SessionStep):
     """Orchestrate a learning session step across multiple agents"""
     try:
-        # Store session state
-        if session_id not in session_store:
-            session_store[session_id] = {"steps": [], "profile": None}
-        
-        session_store[session_id]["steps"].append(step.dict())
+        # Store session state (shared across workers with the Redis backend)
+        await session_store.add_step(session_id, step.model_dump(mode="json"))
         
         # Orchestration logic would go here
         # For now, return a simple response
@@ -108,10 +281,11 @@ async def orchestrate_session_step(session_id: str, step: SessionStep):
 @router.get("/session/{session_id}")
 async def get_session_state(session_id: str):
     """Get current session state"""
-    if session_id not in session_store:
+    state = await session_store.get(session_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return session_store[session_id]
+    return state
 
 # Admin endpoint for user data export (privacy compliance)
 @router.get("/admin/user/{user_id}/export")
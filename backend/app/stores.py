@@ -0,0 +1,345 @@
+"""
+Pluggable backends for focus events, session state and nudge rate limits.
+In-memory stores serve a single process; Redis stores share state across workers and nodes.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from .db import (
+    FocusEventStore, FOCUS_EVENT_CODES, UNKNOWN_EVENT_CODE, CONFIDENCE_SCALE, confidence_units
+)
+
+try:
+    from redis.asyncio import Redis
+    from redis.exceptions import WatchError
+except ImportError:  # redis is optional; only the in-memory stores are available
+    Redis = None
+    WatchError = None
+
+FocusEventTuple = Tuple[str, float, datetime]
+
+class FocusWindow(NamedTuple):
+    """Totals over a session's recent events, plus the newest confidences (oldest first)"""
+    count: int
+    confidence_units: int
+    distraction_count: int
+    latest_confidences: List[float]
+    
+    @property
+    def average_confidence(self) -> float:
+        return self.confidence_units / self.count / CONFIDENCE_SCALE if self.count else 0.0
+
+class FocusTotals(NamedTuple):
+    """Lifetime totals for a session"""
+    total_events: int
+    confidence_sum: float
+    distraction_count: int
+    first_timestamp: float
+    last_timestamp: float
+
+class FocusStore(ABC):
+    """Per-session focus event storage"""
+    
+    async def append(self, session_id: str, event_type: str, confidence: float, timestamp: datetime):
+        await self.append_many(session_id, [(event_type, confidence, timestamp)])
+    
+    @abstractmethod
+    async def append_many(self, session_id: str, events: List[FocusEventTuple]):
+        """Store a batch of (event_type, confidence, timestamp) events for one session"""
+        pass
+    
+    @abstractmethod
+    async def window(self, session_id: str, window_seconds: float, now: float,
+                     latest: int = 0) -> Optional[FocusWindow]:
+        """Totals for events newer than `now - window_seconds`, or None for an unknown session"""
+        pass
+    
+    @abstractmethod
+    async def totals(self, session_id: str) -> Optional[FocusTotals]:
+        pass
+    
+    @abstractmethod
+    async def clear(self):
+        pass
+
+class SessionStore(ABC):
+    """Learning session state: the list of completed steps and the session profile"""
+    
+    @abstractmethod
+    async def add_step(self, session_id: str, step: Dict[str, Any]):
+        pass
+    
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        pass
+    
+    @abstractmethod
+    async def clear(self):
+        pass
+
+class NudgeLimiter(ABC):
+    """Per-session cooldown between nudges"""
+    
+    @abstractmethod
+    async def acquire(self, session_id: str, now: float) -> bool:
+        """True if the session may be nudged now, in which case its cooldown starts"""
+        pass
+    
+    @abstractmethod
+    async def clear(self):
+        pass
+
+class InMemoryFocusStore(FocusStore):
+    """Ring buffers in this process (see FocusEventStore)"""
+    
+    def __init__(self, events: FocusEventStore = None):
+        self.events = events or FocusEventStore()
+    
+    async def append_many(self, session_id: str, events: List[FocusEventTuple]):
+        self.events.append_many(session_id, events)
+    
+    async def window(self, session_id: str, window_seconds: float, now: float,
+                     latest: int = 0) -> Optional[FocusWindow]:
+        buffer = self.events.get(session_id)
+        if buffer is None:
+            return None
+        aggregate = buffer.aggregate(window_seconds, now)
+        return FocusWindow(
+            aggregate.count,
+            aggregate.confidence_units,
+            aggregate.distraction_count,
+            buffer.latest_confidences(latest).tolist() if latest else []
+        )
+    
+    async def totals(self, session_id: str) -> Optional[FocusTotals]:
+        buffer = self.events.get(session_id)
+        if buffer is None or buffer.total_events == 0:
+            return None
+        return FocusTotals(
+            buffer.total_events,
+            buffer.confidence_sum,
+            buffer.distraction_count,
+            buffer.first_timestamp,
+            buffer.last_timestamp
+        )
+    
+    async def clear(self):
+        self.events.clear()
+
+class InMemorySessionStore(SessionStore):
+    """Session state in a dict in this process"""
+    
+    def __init__(self):
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+    
+    async def add_step(self, session_id: str, step: Dict[str, Any]):
+        if session_id not in self.sessions:
+            self.sessions[session_id] = {"steps": [], "profile": None}
+        self.sessions[session_id]["steps"].append(step)
+    
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.sessions.get(session_id)
+    
+    async def clear(self):
+        self.sessions.clear()
+
+class InMemoryNudgeLimiter(NudgeLimiter):
+    """
+    Next allowed nudge time per session. With a fixed cooldown the dict is
+    ordered by expiry, so expired sessions are dropped from its front.
+    """
+    
+    def __init__(self, cooldown_seconds: float = 300, max_sessions: int = 100000):
+        self.cooldown_seconds = cooldown_seconds
+        self.max_sessions = max_sessions
+        self.allowed_at: "OrderedDict[str, float]" = OrderedDict()
+    
+    async def acquire(self, session_id: str, now: float) -> bool:
+        allowed_at = self.allowed_at.get(session_id)
+        if allowed_at is not None and now < allowed_at:
+            return False
+        self.allowed_at[session_id] = now + self.cooldown_seconds
+        self.allowed_at.move_to_end(session_id)
+        
+        while self.allowed_at and (
+            len(self.allowed_at) > self.max_sessions or next(iter(self.allowed_at.values())) <= now
+        ):
+            self.allowed_at.popitem(last=False)
+        return True
+    
+    async def clear(self):
+        self.allowed_at.clear()
+
+class RedisFocusStore(FocusStore):
+    """
+    Each session is a Redis stream of events whose ids are the event times in
+    milliseconds, so a time window is an XRANGE, plus a hash of lifetime totals.
+    Timestamps are clamped to be non-decreasing like the in-memory buffers; a
+    WATCH on the totals hash keeps concurrent writers to one session consistent.
+    """
+    
+    def __init__(self, redis: "Redis", prefix: str = "cogniflow", capacity_per_session: int = 1024,
+                 idle_ttl_seconds: int = 3600):
+        self.redis = redis
+        self.prefix = prefix
+        self.capacity_per_session = capacity_per_session
+        self.idle_ttl_seconds = idle_ttl_seconds
+    
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        base = f"{self.prefix}:focus:{session_id}"
+        return f"{base}:events", f"{base}:totals"
+    
+    async def append_many(self, session_id: str, events: List[FocusEventTuple]):
+        if not events:
+            return
+        events_key, totals_key = self._keys(session_id)
+        # Sort on epoch seconds: a batch may mix naive and timezone-aware datetimes
+        timed = sorted(
+            ((timestamp.timestamp(), confidence, event_type) for event_type, confidence, timestamp in events),
+            key=lambda e: e[0]
+        )
+        
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(totals_key)
+                    last_timestamp, last_id = await pipe.hmget(totals_key, "last_timestamp", "last_id")
+                    last_timestamp = float(last_timestamp) if last_timestamp is not None else None
+                    last_ms, last_seq = map(int, last_id.split("-")) if last_id else (-1, -1)
+                    
+                    pipe.multi()
+                    first_timestamp = None
+                    units = 0
+                    distractions = 0
+                    for ts, confidence, event_type in timed:
+                        if last_timestamp is not None and ts < last_timestamp:
+                            ts = last_timestamp
+                        ms = int(ts * 1000)
+                        last_seq = last_seq + 1 if ms == last_ms else 0
+                        last_ms = ms
+                        code = FOCUS_EVENT_CODES.get(event_type, UNKNOWN_EVENT_CODE)
+                        pipe.xadd(
+                            events_key, {"c": repr(confidence), "e": code}, id=f"{ms}-{last_seq}",
+                            maxlen=self.capacity_per_session, approximate=True
+                        )
+                        units += confidence_units(confidence)
+                        distractions += code == FOCUS_EVENT_CODES["distraction"]
+                        last_timestamp = ts
+                        if first_timestamp is None:
+                            first_timestamp = ts
+                    
+                    pipe.hsetnx(totals_key, "first_timestamp", repr(first_timestamp))
+                    pipe.hincrby(totals_key, "total_events", len(events))
+                    pipe.hincrby(totals_key, "confidence_units", units)
+                    pipe.hincrby(totals_key, "distraction_count", distractions)
+                    pipe.hset(totals_key, mapping={"last_timestamp": repr(last_timestamp), "last_id": f"{last_ms}-{last_seq}"})
+                    pipe.expire(events_key, self.idle_ttl_seconds)
+                    pipe.expire(totals_key, self.idle_ttl_seconds)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+    
+    async def window(self, session_id: str, window_seconds: float, now: float,
+                     latest: int = 0) -> Optional[FocusWindow]:
+        events_key, totals_key = self._keys(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists(totals_key)
+            pipe.xrange(events_key, min=str(int((now - window_seconds) * 1000) + 1), max="+")
+            if latest:
+                pipe.xrevrange(events_key, max="+", min="-", count=latest)
+            replies = await pipe.execute()
+        
+        if not replies[0]:
+            return None
+        entries = replies[1]
+        units = sum(confidence_units(float(fields["c"])) for _, fields in entries)
+        distractions = sum(int(fields["e"]) == FOCUS_EVENT_CODES["distraction"] for _, fields in entries)
+        newest = [float(fields["c"]) for _, fields in reversed(replies[2])] if latest else []
+        return FocusWindow(len(entries), units, distractions, newest)
+    
+    async def totals(self, session_id: str) -> Optional[FocusTotals]:
+        _, totals_key = self._keys(session_id)
+        totals = await self.redis.hgetall(totals_key)
+        if not totals:
+            return None
+        return FocusTotals(
+            int(totals["total_events"]),
+            int(totals["confidence_units"]) / CONFIDENCE_SCALE,
+            int(totals["distraction_count"]),
+            float(totals["first_timestamp"]),
+            float(totals["last_timestamp"])
+        )
+    
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}:focus:*"):
+            await self.redis.delete(key)
+
+class RedisSessionStore(SessionStore):
+    """Session steps in a Redis list and the profile in a hash, both expiring when idle"""
+    
+    def __init__(self, redis: "Redis", prefix: str = "cogniflow", idle_ttl_seconds: int = 24 * 3600):
+        self.redis = redis
+        self.prefix = prefix
+        self.idle_ttl_seconds = idle_ttl_seconds
+    
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        base = f"{self.prefix}:session:{session_id}"
+        return f"{base}:steps", f"{base}:state"
+    
+    async def add_step(self, session_id: str, step: Dict[str, Any]):
+        steps_key, state_key = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(state_key, "profile", "null")
+            pipe.rpush(steps_key, json.dumps(step))
+            pipe.expire(state_key, self.idle_ttl_seconds)
+            pipe.expire(steps_key, self.idle_ttl_seconds)
+            await pipe.execute()
+    
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        steps_key, state_key = self._keys(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(state_key, "profile")
+            pipe.lrange(steps_key, 0, -1)
+            profile, steps = await pipe.execute()
+        if profile is None:
+            return None
+        return {"steps": [json.loads(step) for step in steps], "profile": json.loads(profile)}
+    
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}:session:*"):
+            await self.redis.delete(key)
+
+class RedisNudgeLimiter(NudgeLimiter):
+    """One expiring key per session set with SET NX, so workers share each cooldown atomically"""
+    
+    def __init__(self, redis: "Redis", prefix: str = "cogniflow", cooldown_seconds: float = 300):
+        self.redis = redis
+        self.prefix = prefix
+        self.cooldown_seconds = cooldown_seconds
+    
+    async def acquire(self, session_id: str, now: float) -> bool:
+        # Expiry runs on the Redis clock; `now` is only used by the in-memory limiter
+        key = f"{self.prefix}:nudge:{session_id}"
+        return bool(await self.redis.set(key, repr(now), nx=True, px=int(self.cooldown_seconds * 1000)))
+    
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}:nudge:*"):
+            await self.redis.delete(key)
+
+def create_stores() -> Tuple[FocusStore, SessionStore, NudgeLimiter]:
+    """Redis stores when STORE_BACKEND=redis, otherwise in-memory (single worker only)"""
+    cooldown_seconds = float(os.getenv("NUDGE_COOLDOWN_SECONDS", "300"))
+    if os.getenv("STORE_BACKEND", "memory") == "redis":
+        if Redis is None:
+            raise RuntimeError("STORE_BACKEND=redis requires the redis package")
+        client = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+        return RedisFocusStore(client), RedisSessionStore(client), RedisNudgeLimiter(client, cooldown_seconds=cooldown_seconds)
+    return InMemoryFocusStore(), InMemorySessionStore(), InMemoryNudgeLimiter(cooldown_seconds)
+
+# Global stores shared by the agents and session routes
+focus_store, session_store, nudge_limiter = create_stores()
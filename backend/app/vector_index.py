@@ -0,0 +1,180 @@
+"""
+Approximate nearest-neighbour index for VectorDB embeddings.
+Inverted file (IVF) index over spherical k-means clusters, implemented with NumPy.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10,
+                     seed: int = 0, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Cluster normalized vectors by cosine similarity.
+    Returns a (k, dim) float32 array of normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    
+    for _ in range(iterations):
+        assignments = assign_nearest(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        
+        # Re-seed empty clusters with random points so every list stays usable
+        empty = np.flatnonzero(np.bincount(assignments, minlength=k) == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+        
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    
+    return centroids
+
+def kmeans_plus_plus(vectors: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Pick k spread out seed vectors, each with probability proportional to its cosine distance to the nearest seed"""
+    seeds = [int(rng.integers(len(vectors)))]
+    distances = np.maximum(1.0 - vectors @ vectors[seeds[0]], 0.0)
+    for _ in range(1, k):
+        total = distances.sum()
+        if total > 0:
+            seeds.append(int(rng.choice(len(vectors), p=distances / total)))
+        else:
+            seeds.append(int(rng.integers(len(vectors))))
+        distances = np.minimum(distances, np.maximum(1.0 - vectors @ vectors[seeds[-1]], 0.0))
+    return vectors[seeds].copy()
+
+def minibatch_spherical_kmeans(vectors: np.ndarray, k: int, batch_size: int = 1024, iterations: int = 100,
+                               seed: int = 0, centroids: Optional[np.ndarray] = None,
+                               counts: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mini-batch k-means on normalized vectors: each step assigns a random batch
+    and moves its centroids towards the batch means with a per-centroid rate
+    of 1/count, so cost per step does not depend on the number of vectors.
+    New models are seeded with k-means++ on a sample of 3 batches.
+    Pass previous `centroids` and `counts` to keep training on new vectors.
+    Returns (centroids, counts), the counts being vectors seen per centroid.
+    """
+    rng = np.random.default_rng(seed)
+    if centroids is None:
+        sample = vectors
+        if len(vectors) > 3 * batch_size:
+            sample = vectors[rng.choice(len(vectors), size=3 * batch_size, replace=False)]
+        centroids = kmeans_plus_plus(sample, k, rng)
+        counts = np.zeros(k)
+    centroids = np.array(centroids, dtype=np.float32)
+    counts = np.zeros(len(centroids)) if counts is None else np.array(counts, dtype=np.float64)
+    k = len(centroids)
+    
+    for _ in range(iterations):
+        batch = vectors[rng.integers(len(vectors), size=min(batch_size, len(vectors)))]
+        assignments = assign_nearest(batch, centroids)
+        batch_counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, batch)
+        
+        updated = np.flatnonzero(batch_counts)
+        counts[updated] += batch_counts[updated]
+        rate = (batch_counts[updated] / counts[updated])[:, None]
+        means = sums[updated] / batch_counts[updated][:, None]
+        moved = (1 - rate) * centroids[updated] + rate * means
+        norms = np.linalg.norm(moved, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids[updated] = moved / norms
+    
+    return centroids, counts
+
+def assign_nearest(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for each vector, computed in bounded chunks"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+class IVFIndex:
+    """
+    Inverted file index: rows are bucketed by their nearest centroid and a query
+    only scores the rows in its `nprobe` most similar buckets.
+    
+    Knobs:
+        nlist: number of clusters (defaults to sqrt of the row count at training time)
+        nprobe: clusters scanned per query; higher means better recall, slower queries
+        min_train_size: rows required before the index is trained (exact search until then)
+        retrain_growth: retrain once the row count grows by this factor since training
+    """
+    
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, min_train_size: int = 1024,
+                 retrain_growth: float = 4.0, kmeans_iterations: int = 10,
+                 train_sample_size: int = 65536, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample_size = train_sample_size
+        self.seed = seed
+        self.reset()
+    
+    def reset(self):
+        """Forget the trained centroids and all bucketed rows"""
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.assignments: Dict[int, int] = {}  # row -> list
+        self.trained_size = 0
+    
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+    
+    def needs_training(self, size: int) -> bool:
+        if not self.trained:
+            return size >= self.min_train_size
+        return size >= self.trained_size * self.retrain_growth
+    
+    def train(self, vectors: np.ndarray, rows: np.ndarray):
+        """Cluster a sample of the vectors and bucket every row"""
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        
+        sample = vectors
+        if len(vectors) > self.train_sample_size:
+            rng = np.random.default_rng(self.seed)
+            sample = vectors[rng.choice(len(vectors), size=self.train_sample_size, replace=False)]
+        
+        self.centroids = spherical_kmeans(sample, nlist, self.kmeans_iterations, self.seed)
+        self.trained_size = len(vectors)
+        self.assign_all(vectors, rows)
+    
+    def assign_all(self, vectors: np.ndarray, rows: np.ndarray):
+        """Rebuild the inverted lists for the given rows using the current centroids"""
+        assignments = assign_nearest(vectors, self.centroids)
+        self.lists = [[] for _ in range(len(self.centroids))]
+        self.assignments = {}
+        for row, list_id in zip(rows.tolist(), assignments.tolist()):
+            self.lists[list_id].append(row)
+            self.assignments[row] = list_id
+    
+    def add(self, row: int, vector: np.ndarray):
+        """Bucket a newly stored row"""
+        list_id = int(np.argmax(self.centroids @ vector))
+        self.lists[list_id].append(row)
+        self.assignments[row] = list_id
+    
+    def remove(self, row: int):
+        """Remove a row from its bucket"""
+        list_id = self.assignments.pop(row, None)
+        if list_id is not None:
+            self.lists[list_id].remove(row)
+    
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Rows in the buckets whose centroids are most similar to the query"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        if nprobe < len(scores):
+            probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(len(scores))
+        
+        rows = [row for list_id in probes for row in self.lists[list_id]]
+        return np.asarray(rows, dtype=np.int64)
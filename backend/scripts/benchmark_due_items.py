@@ -0,0 +1,67 @@
+"""
+Latency of get_due_items with the indexed range scan vs the single-writer due queues.
+Uses a temporary SQLite file so the development database is untouched.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app.agents.retention_agent import RetentionAgent
+from app.db import SRSItemDB, create_engine_from_url, init_db
+from app.models import QuizResult
+
+async def seed_items(engine, items: int):
+    """One user with `items` due items, all due in the past"""
+    now = datetime.now()
+    await init_db(engine)
+    async with engine.begin() as connection:
+        await connection.execute(insert(SRSItemDB), [
+            {"item_id": f"item_{i}", "user_id": "bench", "content": f"Card {i}", "easiness": 2.5,
+             "interval": 1, "repetitions": 0, "next_due": now - timedelta(seconds=i), "last_reviewed": None}
+            for i in range(items)
+        ])
+
+async def timed_calls(agent: RetentionAgent, calls: int, limit: int, review: bool) -> float:
+    """Mean latency in ms of get_due_items, optionally reviewing the first due item each time"""
+    await agent.get_due_items("bench", limit)  # warm up (loads the queue in single-writer mode)
+    elapsed = 0.0
+    for _ in range(calls):
+        start = time.perf_counter()
+        due = await agent.get_due_items("bench", limit)
+        elapsed += time.perf_counter() - start
+        if review and due:
+            await agent.report_quiz_results([
+                QuizResult(item_id=due[0].item_id, user_id="bench", quality=4, response_time_ms=1000)
+            ])
+    return elapsed / calls * 1000
+
+async def run_benchmark(items: int, calls: int, limit: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine_from_url(f"sqlite:///{directory}/bench.db")
+        print(f"Seeding {items} due items for one user...")
+        await seed_items(engine, items)
+        
+        print(f"\n{'mode':<16}{'reviews':>10}{'latency ms':>14}")
+        for review in (False, True):
+            indexed_ms = await timed_calls(RetentionAgent(bind=engine), calls, limit, review)
+            queue_ms = await timed_calls(RetentionAgent(bind=engine, single_writer=True), calls, limit, review)
+            label = "yes" if review else "no"
+            print(f"{'indexed':<16}{label:>10}{indexed_ms:>14.3f}")
+            print(f"{'single_writer':<16}{label:>10}{queue_ms:>14.3f}")
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    
+    asyncio.run(run_benchmark(args.items, args.calls, args.limit))
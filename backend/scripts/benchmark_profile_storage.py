@@ -0,0 +1,66 @@
+"""
+Row write/read throughput for profile embeddings stored as JSON text vs float32 blobs.
+Uses a temporary SQLite file so the development database is untouched.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import Column, MetaData, String, Table, Text, create_engine, insert, select
+from app.db import Float32Vector
+
+def build_tables(metadata: MetaData):
+    json_table = Table("embeddings_json", metadata, Column("user_id", String, primary_key=True), Column("embedding", Text))
+    blob_table = Table("embeddings_blob", metadata, Column("user_id", String, primary_key=True), Column("embedding", Float32Vector))
+    return json_table, blob_table
+
+def bench(engine, table, rows, encode, decode):
+    """Return (writes/s, reads/s, bytes per embedding)"""
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(table), [{"user_id": user_id, "embedding": encode(vector)} for user_id, vector in rows])
+    write_rate = len(rows) / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        decoded = [decode(embedding) for _, embedding in connection.execute(select(table))]
+    read_rate = len(decoded) / (time.perf_counter() - start)
+    
+    with engine.connect() as connection:
+        size = connection.exec_driver_sql(f"SELECT avg(length(embedding)) FROM {table.name}").scalar()
+    return write_rate, read_rate, size
+
+def run_benchmark(count: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    rows = [(f"user_{i}", rng.normal(size=dim).astype(np.float32)) for i in range(count)]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        metadata = MetaData()
+        json_table, blob_table = build_tables(metadata)
+        metadata.create_all(engine)
+        
+        results = {
+            "json text": bench(engine, json_table, rows, lambda v: json.dumps(v.tolist()), json.loads),
+            "float32 blob": bench(engine, blob_table, rows, lambda v: v, lambda v: v),
+        }
+        engine.dispose()
+    
+    print(f"{count} rows, {dim}-dim embeddings")
+    print(f"{'format':<14}{'writes/s':>12}{'reads/s':>12}{'bytes/row':>12}")
+    for name, (write_rate, read_rate, size) in results.items():
+        print(f"{name:<14}{write_rate:>12.0f}{read_rate:>12.0f}{size:>12.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run_benchmark(args.count, args.dim, args.seed)
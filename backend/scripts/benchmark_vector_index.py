@@ -0,0 +1,65 @@
+"""
+Recall vs latency benchmark for the VectorDB IVF index.
+Compares approximate search at several nprobe settings against exact search.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+from app.db import VectorDB
+from app.vector_index import IVFIndex
+
+def build_dataset(size: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered synthetic embeddings, closer to real profiles than pure noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(clusters, size=size)
+    return (centers[labels] + 0.5 * rng.normal(size=(size, dim))).astype(np.float32)
+
+def timed_search(db: VectorDB, queries: np.ndarray, limit: int, **kwargs):
+    """Run queries one at a time and return (results, mean latency in ms)"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append([r["id"] for r in db.search_similar(query, limit, **kwargs)])
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+def run_benchmark(size: int, dim: int, queries: int, limit: int, nlist: int, seed: int):
+    vectors = build_dataset(size, dim, clusters=64, seed=seed)
+    query_vectors = build_dataset(queries, dim, clusters=64, seed=seed + 1)
+    
+    print(f"Indexing {size} vectors of dimension {dim}...")
+    db = VectorDB(dim=dim, index=IVFIndex(nlist=nlist, min_train_size=size))
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        db.store_embedding(f"user_{i}", vector)
+    print(f"Indexed in {time.perf_counter() - start:.2f}s ({len(db.index.centroids)} lists)")
+    
+    exact, exact_ms = timed_search(db, query_vectors, limit, exact=True)
+    print(f"\n{'mode':<12}{'recall@' + str(limit):>12}{'latency ms':>14}{'speedup':>10}")
+    print(f"{'exact':<12}{1.0:>12.3f}{exact_ms:>14.3f}{1.0:>10.1f}")
+    
+    for nprobe in [1, 2, 4, 8, 16, 32, 64]:
+        if nprobe > len(db.index.centroids):
+            break
+        approximate, ann_ms = timed_search(db, query_vectors, limit, nprobe=nprobe)
+        hits = sum(len(set(a) & set(e)) for a, e in zip(approximate, exact))
+        recall = hits / (len(exact) * limit)
+        print(f"{'nprobe=' + str(nprobe):<12}{recall:>12.3f}{ann_ms:>14.3f}{exact_ms / ann_ms:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    run_benchmark(args.size, args.dim, args.queries, args.limit, args.nlist, args.seed)
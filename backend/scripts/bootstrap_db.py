@@ -11,11 +11,11 @@ from app.db import init_db, SessionLocal
 from app.models import Profile, SRSItem
 from datetime import datetime, timedelta
 
-def bootstrap_database():
+async def bootstrap_database():
     """Initialize database with sample data"""
     
     print("Initializing database...")
-    init_db()
+    await init_db()
     
     db = SessionLocal()
     
@@ -37,9 +37,9 @@ def bootstrap_database():
         
     except Exception as e:
         print(f"Error during bootstrap: {e}")
-        db.rollback()
+        await db.rollback()
     finally:
-        db.close()
+        await db.close()
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,29 @@
+"""
+Cluster stored profile embeddings into learner cohorts.
+Run periodically (e.g. from cron) with COHORT_MODEL_PATH pointing at the file the API reads.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+from app.cohorts import cohort_model
+
+def main(rebuild: bool):
+    if not cohort_model.path:
+        print("COHORT_MODEL_PATH is not set; the API will not see these cohorts")
+    start = time.perf_counter()
+    stats = cohort_model.rebuild() if rebuild else cohort_model.refresh()
+    elapsed = time.perf_counter() - start
+    sizes = stats["sizes"]
+    print(f"Version {stats['version']}: {stats['assigned']} learners in {stats['cohorts']} cohorts in {elapsed:.2f}s")
+    if sizes:
+        print(f"Cohort sizes: min {min(sizes)}, median {sorted(sizes)[len(sizes) // 2]}, max {max(sizes)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rebuild", action="store_true", help="recluster every learner instead of refreshing")
+    args = parser.parse_args()
+    main(args.rebuild)
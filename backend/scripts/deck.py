@@ -0,0 +1,46 @@
+"""
+Import or export spaced repetition decks.
+Streams CSV (with a header row) or JSONL files into or out of srs_items.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+from app.agents.retention_agent import retention_agent
+
+def deck_format(path: str, fmt: str = None) -> str:
+    return fmt or ("csv" if path.endswith(".csv") else "jsonl")
+
+async def import_file(path: str, fmt: str, batch_size: int):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        stats = await retention_agent.import_deck(f, fmt, batch_size)
+    print(f"Imported {stats['imported']} items in {stats['batches']} batches "
+          f"({stats['seconds']}s, {stats['items_per_second']} items/s)")
+    if stats["skipped"]:
+        print(f"Skipped {stats['skipped']} invalid rows:")
+        for error in stats["errors"]:
+            print(f"  {error}")
+
+async def export_file(path: str, fmt: str, user_id: str = None):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        async for chunk in retention_agent.export_deck(fmt, user_id):
+            f.write(chunk)
+    print(f"Wrote {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="Deck file (.csv or .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per insert transaction")
+    parser.add_argument("--user-id", help="Export only this user's items")
+    args = parser.parse_args()
+    
+    fmt = deck_format(args.path, args.format)
+    if args.command == "import":
+        asyncio.run(import_file(args.path, fmt, args.batch_size))
+    else:
+        asyncio.run(export_file(args.path, fmt, args.user_id))
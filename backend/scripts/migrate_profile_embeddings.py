@@ -0,0 +1,19 @@
+"""
+Convert profile embeddings stored as JSON text to packed float32 blobs.
+Safe to run repeatedly; rows already stored as blobs are left alone.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from app.db import engine, migrate_profile_embeddings
+
+async def main():
+    converted = await migrate_profile_embeddings()
+    await engine.dispose()
+    print(f"Converted {converted} profile embeddings to float32 blobs")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Precompute lesson variants for a course catalog.
+Reads a JSONL catalog ({"lesson_id": ..., "raw_text": ...} per line) and
+generates variants for every profile bucket, or queues them for rq workers.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import time
+from app.pipeline import job_queue, enqueue_lessons, RQJobQueue
+from app.agents.content_adapter import PROFILE_BUCKETS
+
+def read_catalog(path: str):
+    """Yield lesson texts from a JSONL catalog"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)["raw_text"]
+
+async def precompute_catalog(path: str):
+    lessons = list(read_catalog(path))
+    start = time.perf_counter()
+    enqueue_lessons(lessons)
+    
+    if isinstance(job_queue, RQJobQueue):
+        print(f"Queued {len(lessons)} lessons for rq workers")
+        return
+    
+    await job_queue.join()
+    await job_queue.close()
+    elapsed = time.perf_counter() - start
+    print(f"Precomputed {len(lessons)} lessons x {len(PROFILE_BUCKETS)} buckets in {elapsed:.2f}s")
+    print(job_queue.stats())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("catalog", help="JSONL file with a raw_text field per lesson")
+    args = parser.parse_args()
+    
+    if not os.getenv("PRECOMPUTED_VARIANTS_PATH") and not isinstance(job_queue, RQJobQueue):
+        print("Warning: PRECOMPUTED_VARIANTS_PATH is not set, variants will not be persisted")
+    
+    asyncio.run(precompute_catalog(args.catalog))
@@ -0,0 +1,28 @@
+"""
+Recompute stored profile embeddings with the current embedder.
+Profiles are read and encoded in batches; the vector DB is updated as well.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+from app.agents.profile_agent import profile_agent
+from app.db import engine, vector_db
+
+async def main(batch_size: int):
+    start = time.perf_counter()
+    updated = await profile_agent.reembed_profiles(batch_size)
+    vector_db.flush()
+    await engine.dispose()
+    elapsed = time.perf_counter() - start
+    print(f"Re-embedded {updated} profiles in {elapsed:.2f}s ({updated / elapsed if elapsed else 0:.0f} profiles/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
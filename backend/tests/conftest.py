@@ -0,0 +1,11 @@
+"""
+Shared test configuration.
+Points the app at a throwaway SQLite database before any app module is imported.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cogniflow-tests-'), 'test.db')}"
+)
@@ -0,0 +1,91 @@
+"""
+Unit tests for learner cohorts.
+Tests mini-batch clustering, incremental refresh and sharing a saved model.
+"""
+
+import numpy as np
+from app.cohorts import CohortModel
+from app.db import VectorDB
+from app.vector_index import minibatch_spherical_kmeans
+
+def make_store(groups: int = 4, per_group: int = 50, dim: int = 16, seed: int = 0):
+    """Vector store with well separated groups of learners"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(groups, dim))
+    store = VectorDB()
+    for group in range(groups):
+        for i in range(per_group):
+            vector = centers[group] + 0.05 * rng.normal(size=dim)
+            store.store_embedding(f"g{group}_{i}", vector.tolist())
+    return store, centers
+
+def test_minibatch_kmeans_finds_separated_clusters():
+    """Test that mini-batches recover the groups and training can continue"""
+    
+    store, centers = make_store()
+    vectors = store.matrix[store.live_rows()]
+    centroids, counts = minibatch_spherical_kmeans(vectors, 4, batch_size=32, iterations=50)
+    
+    assert centroids.shape == (4, 16)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+    normalized = centers / np.linalg.norm(centers, axis=1, keepdims=True)
+    assert (normalized @ centroids.T).max(axis=1).min() > 0.99
+    
+    resumed, resumed_counts = minibatch_spherical_kmeans(
+        vectors[:10], 4, batch_size=10, iterations=1, centroids=centroids, counts=counts
+    )
+    assert resumed_counts.sum() == counts.sum() + 10
+
+def test_cohort_rebuild_and_incremental_refresh():
+    """Test that refresh assigns new learners without reclustering"""
+    
+    store, centers = make_store()
+    model = CohortModel(store, n_cohorts=4, batch_size=64, iterations=50)
+    assert model.cohort_of("g0_0") is None  # Not built yet
+    
+    stats = model.rebuild()
+    assert stats["version"] == 1 and stats["assigned"] == 200
+    assert sorted(stats["sizes"]) == [50, 50, 50, 50]
+    for group in range(4):
+        assert len({model.cohort_of(f"g{group}_{i}") for i in range(50)}) == 1
+        cohort = model.cohort_of(f"g{group}_0")
+        assert model.cohort_of(model.representative(cohort)) == cohort
+    
+    # New learners join their group's cohort, deleted ones leave
+    rng = np.random.default_rng(1)
+    store.store_embedding("new_a", (centers[2] + 0.05 * rng.normal(size=16)).tolist())
+    store.store_embedding("new_b", (centers[2] + 0.05 * rng.normal(size=16)).tolist())
+    store.delete_embedding("g1_0")
+    stats = model.refresh()
+    
+    assert stats["version"] == 1
+    assert stats["assigned"] == 201
+    assert model.cohort_of("new_a") == model.cohort_of("new_b") == model.cohort_of("g2_0")
+    assert "g1_0" not in model.assignments
+    
+    # Unrefreshed learners are assigned on lookup
+    store.store_embedding("late", (centers[3] + 0.05 * rng.normal(size=16)).tolist())
+    assert model.cohort_of("late") == model.cohort_of("g3_0")
+    
+    # Doubling the store triggers a full rebuild
+    for i in range(250):
+        store.store_embedding(f"extra_{i}", (centers[i % 4] + 0.05 * rng.normal(size=16)).tolist())
+    assert model.refresh()["version"] == 2
+
+def test_saved_model_is_shared(tmp_path):
+    """Test that another process reloads the saved model"""
+    
+    store, _ = make_store(groups=2, per_group=20)
+    path = str(tmp_path / "cohorts.npz")
+    writer = CohortModel(store, n_cohorts=2, path=path)
+    writer.rebuild()
+    
+    reader = CohortModel(store, path=path, check_interval=0)
+    assert reader.version == 1
+    assert reader.assignments == writer.assignments
+    assert reader.representatives == writer.representatives
+    assert reader.stats()["sizes"] == writer.stats()["sizes"]
+    
+    writer.rebuild()
+    assert reader.cohort_of("g0_0") == writer.cohort_of("g0_0")
+    assert reader.version == 2
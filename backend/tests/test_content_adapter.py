@@ -101,3 +101,260 @@ async def test_content_variant_format():
     
     # Check that micro_tasks contains step-like structure
     assert "step" in variants.micro_tasks.lower() or "1" in variants.micro_tasks
+
+@pytest.mark.asyncio
+async def test_equivalent_profiles_share_cached_adaptation():
+    """Test that the LLM is only called once per text and equivalent profile"""
+    
+    from app.agents.content_adapter import ContentAdapterAgent
+    from app.cache import LRUCache
+    
+    agent = ContentAdapterAgent(cache=LRUCache(max_entries=10))
+    calls = []
+    
+    async def fake_adapt(text, profile):
+        calls.append(profile)
+        return {"simplified": text, "bullets": "• point", "micro_tasks": "Step 1: read"}
+    
+    def make_profile(user_id, modalities):
+        return Profile(
+            user_id=user_id,
+            attention_span_minutes=25,
+            preferred_modalities=modalities,
+            working_memory_index=0.6,
+            anxiety_triggers=[],
+            best_time_of_day="morning",
+            suggestions=[],
+            embedding=[0.1, 0.2]
+        )
+    
+    import app.agents.content_adapter as module
+    original = module.llm_client.adapt_content
+    module.llm_client.adapt_content = fake_adapt
+    try:
+        await agent.convert_content(ContentRequest(raw_text="Cells", profile=make_profile("a", ["visual", "reading"])))
+        await agent.convert_content(ContentRequest(raw_text="Cells", profile=make_profile("b", ["reading", "visual"])))
+        await agent.convert_content(ContentRequest(raw_text="Cells", profile=make_profile("c", ["auditory"])))
+    finally:
+        module.llm_client.adapt_content = original
+    
+    # Ids and embeddings do not affect the prompt, modality order is normalized
+    assert len(calls) == 2
+    assert "embedding" not in calls[0] and "user_id" not in calls[0]
+    assert agent.cache.stats()["hits"] == 1
+
+def test_lru_cache_limits_ttl_and_persistence(tmp_path):
+    """Test LRU eviction, TTL expiry and SQLite write-through"""
+    
+    from app.cache import LRUCache
+    
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # Evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+    
+    expiring = LRUCache(ttl_seconds=-1)
+    expiring.set("a", 1)
+    assert expiring.get("a") is None
+    
+    path = str(tmp_path / "cache.db")
+    LRUCache(path=path).set("lesson", {"simplified": "text"})
+    restarted = LRUCache(path=path)
+    assert restarted.get("lesson") == {"simplified": "text"}
+    assert restarted.stats()["disk_hits"] == 1
+
+def test_convert_content_stream_endpoint():
+    """Test that the streaming endpoint emits one NDJSON line per section"""
+    
+    import json
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    profile = {
+        "user_id": "stream_user",
+        "attention_span_minutes": 25,
+        "preferred_modalities": ["auditory"],
+        "working_memory_index": 0.7,
+        "anxiety_triggers": [],
+        "best_time_of_day": "morning",
+        "suggestions": []
+    }
+    
+    client = TestClient(app)
+    response = client.post("/api/agents/content/convert/stream", json={"raw_text": "Streamed lesson", "profile": profile})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [line.get("section") for line in lines[:3]] == ["simplified", "bullets", "micro_tasks"]
+    assert "text-to-speech" in lines[0]["content"]
+    assert lines[-1] == {"done": True}
+
+@pytest.mark.asyncio
+async def test_precomputed_bucket_variants_are_served():
+    """Test that precomputed lessons are served from the learner's bucket"""
+    
+    from app.agents.content_adapter import ContentAdapterAgent, PROFILE_BUCKETS, profile_bucket
+    from app.cache import LRUCache
+    from app.pipeline import LocalJobQueue
+    
+    agent = ContentAdapterAgent(cache=LRUCache(), precomputed=LRUCache())
+    queue = LocalJobQueue(workers=2)
+    queue.enqueue(agent.precompute, "Precomputed lesson")
+    await queue.join()
+    await queue.close()
+    
+    assert queue.stats()["completed"] == 1
+    assert len(agent.precomputed.entries) == len(PROFILE_BUCKETS)
+    assert await agent.precompute("Precomputed lesson") == 0  # Already stored
+    
+    profile = Profile(
+        user_id="bucket_user",
+        attention_span_minutes=10,
+        preferred_modalities=["visual"],
+        working_memory_index=0.3,
+        anxiety_triggers=["time_pressure"],
+        best_time_of_day="evening",
+        suggestions=[]
+    )
+    assert profile_bucket(profile) == "short:low_memory:time_pressure"
+    
+    variants = await agent.convert_content(ContentRequest(raw_text="Precomputed lesson", profile=profile))
+    
+    # Served from the bucket, with per-learner adaptations still applied
+    assert agent.precomputed.stats()["hits"] >= 1
+    assert agent.cache.stats()["misses"] == 0
+    assert "diagram" in variants.bullets
+
+@pytest.mark.asyncio
+async def test_precompute_requests_buckets_concurrently(monkeypatch):
+    """Test that missing buckets are generated concurrently rather than one after another"""
+    
+    import asyncio
+    from app.agents import content_adapter as module
+    from app.agents.content_adapter import ContentAdapterAgent, PROFILE_BUCKETS
+    from app.cache import LRUCache
+    
+    in_flight = []
+    peak = []
+    
+    async def fake_adapt_content(text, profile):
+        in_flight.append(profile)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(profile)
+        return {"simplified": text, "bullets": "", "micro_tasks": ""}
+    
+    monkeypatch.setattr(module.llm_client, "adapt_content", fake_adapt_content)
+    agent = ContentAdapterAgent(precomputed=LRUCache())
+    
+    assert await agent.precompute("Concurrent lesson") == len(PROFILE_BUCKETS)
+    assert max(peak) == len(PROFILE_BUCKETS)
+    assert len(agent.precomputed.entries) == len(PROFILE_BUCKETS)
+
+def test_rq_jobs_share_one_event_loop(monkeypatch):
+    """Test that consecutive rq jobs in one worker run on the same open event loop"""
+    
+    import asyncio
+    from app import pipeline
+    
+    loops = []
+    
+    async def fake_precompute_lesson(raw_text):
+        loops.append(asyncio.get_running_loop())
+        return 0
+    
+    monkeypatch.setattr(pipeline, "_worker_loop", None)
+    monkeypatch.setattr(pipeline, "precompute_lesson", fake_precompute_lesson)
+    try:
+        pipeline.precompute_lesson_job("first")
+        pipeline.precompute_lesson_job("second")
+        assert loops[0] is loops[1]
+        assert not loops[0].is_closed()
+    finally:
+        pipeline._worker_loop.close()
+        asyncio.set_event_loop(None)
+
+@pytest.mark.asyncio
+async def test_cohort_members_share_variants():
+    """Test that cohort variants come from the representative, per bucket, and only for big enough cohorts"""
+    
+    import app.agents.content_adapter as module
+    from app.agents.content_adapter import ContentAdapterAgent
+    from app.cache import LRUCache
+    from app.cohorts import CohortModel
+    from app.db import VectorDB
+    
+    store = VectorDB()
+    for i, offset in enumerate([0.0, 0.05, 0.1]):
+        store.store_embedding(f"near_{i}", [1.0, offset, 0.0])
+        store.store_embedding(f"far_{i}", [0.0, offset, 1.0])
+    store.store_embedding("alone", [0.0, 1.0, 0.0])
+    cohorts = CohortModel(store, n_cohorts=3, seed=1)
+    cohorts.rebuild()
+    assert len({cohorts.cohort_of(f"near_{i}") for i in range(3)}) == 1
+    assert cohorts.cohort_size(cohorts.cohort_of("alone")) == 1
+    representative = cohorts.representative(cohorts.cohort_of("near_0"))
+    
+    def make_profile(user_id, attention_span, modalities=("visual",)):
+        return Profile(
+            user_id=user_id,
+            attention_span_minutes=attention_span,
+            preferred_modalities=list(modalities),
+            working_memory_index=0.6,
+            anxiety_triggers=[],
+            best_time_of_day="morning",
+            suggestions=[]
+        )
+    
+    class Profiles:
+        async def get_profile(self, user_id):
+            return make_profile(user_id, 50, ("auditory",)) if user_id == representative else None
+    
+    calls = []
+    
+    async def fake_adapt(text, profile):
+        calls.append(profile)
+        return {"simplified": text, "bullets": "• point", "micro_tasks": "Step 1: read"}
+    
+    async def convert(agent, user_id, attention_span, modalities=("visual",)):
+        request = ContentRequest(raw_text="Cells", profile=make_profile(user_id, attention_span, modalities))
+        return await agent.convert_content(request)
+    
+    original = module.llm_client.adapt_content
+    module.llm_client.adapt_content = fake_adapt
+    try:
+        agent = ContentAdapterAgent(cache=LRUCache(), cohorts=cohorts, profiles=Profiles(), min_cohort_size=3)
+        await convert(agent, "near_1", 30, ("reading",))
+        variants = await convert(agent, "near_2", 35)
+        assert len(calls) == 1
+        assert "diagram" in variants.bullets  # The learner's own adaptations still apply
+        
+        # Generated for the representative's modalities and the bucket's fields, not the first requester's
+        assert calls[0]["preferred_modalities"] == ["auditory"]
+        assert calls[0]["attention_span_minutes"] == 25
+        
+        # Another bucket in the same cohort, and a cohort below the minimum size, generate separately
+        await convert(agent, "near_1", 10)
+        await convert(agent, "alone", 30)
+        await convert(agent, "alone", 31)
+        assert len(calls) == 4
+        assert calls[-1]["attention_span_minutes"] == 31  # Exact profile, not a cohort variant
+        
+        # The first member to ask does not change what the cohort gets
+        reordered = ContentAdapterAgent(cache=LRUCache(), cohorts=cohorts, profiles=Profiles(), min_cohort_size=3)
+        await convert(reordered, "near_2", 35)
+        assert calls[-1] == calls[0]
+        
+        # With a single cohort everyone falls back to their exact profile
+        single = CohortModel(store, n_cohorts=1)
+        single.rebuild()
+        fallback = ContentAdapterAgent(cache=LRUCache(), cohorts=single, min_cohort_size=1)
+        await convert(fallback, "near_1", 30)
+        await convert(fallback, "near_2", 35)
+        assert [call["attention_span_minutes"] for call in calls[-2:]] == [30, 35]
+    finally:
+        module.llm_client.adapt_content = original
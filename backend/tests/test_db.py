@@ -0,0 +1,66 @@
+"""
+Unit tests for the async database layer.
+Tests URL handling, SQLite pragmas and schema creation.
+"""
+
+import json
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+from app.agents.profile_agent import ProfileAgent
+from app.db import async_database_url, create_engine_from_url, init_db, migrate_profile_embeddings
+
+def test_async_database_url():
+    """Plain URLs from docker-compose get async drivers"""
+    
+    assert async_database_url("sqlite:///./cogniflow.db") == "sqlite+aiosqlite:///./cogniflow.db"
+    assert async_database_url("postgresql://u:p@db:5432/app") == "postgresql+asyncpg://u:p@db:5432/app"
+    assert async_database_url("sqlite+aiosqlite://") == "sqlite+aiosqlite://"
+
+@pytest.mark.asyncio
+async def test_sqlite_file_engine_uses_wal_and_pool(tmp_path):
+    """File-backed SQLite runs in WAL mode behind a sized connection pool"""
+    
+    engine = create_engine_from_url(f"sqlite:///{tmp_path / 'test.db'}", pool_size=3, max_overflow=0)
+    try:
+        await init_db(engine)
+        async with engine.connect() as connection:
+            journal_mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+            busy_timeout = (await connection.execute(text("PRAGMA busy_timeout"))).scalar()
+            tables = (await connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))).scalars().all()
+        
+        assert journal_mode == "wal"
+        assert busy_timeout == 5000
+        assert engine.pool.size() == 3
+        assert {"profiles", "srs_items"} <= set(tables)
+    finally:
+        await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_migrate_json_embeddings_to_blobs():
+    """Legacy JSON text embeddings are rewritten as packed float32 blobs"""
+    
+    engine = create_engine_from_url("sqlite://", poolclass=StaticPool)
+    embedding = np.arange(384, dtype=np.float32) / 7
+    async with engine.begin() as connection:
+        # Table as created before embeddings were stored as blobs
+        await connection.execute(text(
+            "CREATE TABLE profiles (user_id VARCHAR PRIMARY KEY, attention_span_minutes INTEGER, "
+            "preferred_modalities TEXT, working_memory_index FLOAT, anxiety_triggers TEXT, "
+            "best_time_of_day VARCHAR, suggestions TEXT, embedding TEXT, created_at DATETIME)"
+        ))
+        await connection.execute(text(
+            "INSERT INTO profiles VALUES ('legacy', 25, '[\"visual\"]', 0.6, '[]', 'morning', '[]', :embedding, "
+            "'2024-01-01 09:00:00.000000')"
+        ), {"embedding": json.dumps(embedding.tolist())})
+    
+    assert await migrate_profile_embeddings(engine) == 1
+    assert await migrate_profile_embeddings(engine) == 0
+    
+    async with engine.connect() as connection:
+        stored = (await connection.execute(text("SELECT typeof(embedding), length(embedding) FROM profiles"))).one()
+    assert tuple(stored) == ("blob", 384 * 4)
+    
+    profile = await ProfileAgent(bind=engine).get_profile("legacy")
+    assert profile.embedding == embedding.tolist()
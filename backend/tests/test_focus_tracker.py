@@ -0,0 +1,187 @@
+"""
+Unit tests for FocusTrackerAgent and the per-session focus event store.
+Tests ring buffer windowing, eviction and focus state analysis.
+"""
+
+import pytest
+import json
+import random
+from datetime import datetime, timedelta
+from app.agents.focus_tracker import focus_tracker
+from app.db import FocusEventStore, SessionEventBuffer
+from app.stores import focus_store
+from app.models import FocusEvent
+
+def test_ring_buffer_wraps_and_windows():
+    """Test that the ring buffer keeps only the newest events in order"""
+    
+    buffer = SessionEventBuffer(capacity=4)
+    for i in range(6):
+        buffer.append(float(i), i / 10, 0)
+    
+    timestamps, confidences, codes = buffer.window(-1.0)
+    
+    # Oldest two events were overwritten, order is preserved across the wrap
+    assert timestamps.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert confidences.tolist() == [0.2, 0.3, 0.4, 0.5]
+    assert buffer.window(3.0)[0].tolist() == [4.0, 5.0]
+    assert len(buffer.window(10.0)[0]) == 0
+    
+    # Lifetime totals still cover every event
+    assert buffer.total_events == 6
+
+def test_window_aggregate_matches_full_scan():
+    """Test that incremental window totals match a recomputation from scratch"""
+    
+    rng = random.Random(7)
+    buffer = SessionEventBuffer(capacity=4)
+    now = 0.0
+    for _ in range(200):
+        now += rng.uniform(0, 3)
+        buffer.append(now, round(rng.random(), 3), rng.choice([0, 1, 2]))
+        aggregate = buffer.aggregate(10, now)
+        
+        _, confidences, codes = buffer.window(now - 10)
+        assert aggregate.count == len(confidences)
+        assert aggregate.average_confidence == pytest.approx(confidences.mean() if len(confidences) else 0.0)
+        assert aggregate.distraction_count == int((codes == 1).sum())
+
+def test_idle_sessions_are_evicted():
+    """Test that idle sessions are dropped from the store"""
+    
+    store = FocusEventStore(idle_ttl_seconds=60)
+    store.append("old", "distraction", 0.3, datetime.now())
+    store.get("old").last_seen -= 120
+    
+    store.append("new", "focus_restored", 0.9, datetime.now())
+    
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+@pytest.mark.asyncio
+async def test_log_focus_event_detects_distraction():
+    """Test that repeated distractions trigger an intervention"""
+    
+    await focus_store.clear()
+    
+    # Events outside the analysis window are ignored
+    await focus_tracker.log_focus_event(FocusEvent(
+        session_id="focus_session",
+        event_type="distraction",
+        confidence=0.1,
+        timestamp=datetime.now() - timedelta(minutes=30)
+    ))
+    
+    result = None
+    for confidence in [0.9, 0.9, 0.9]:
+        result = await focus_tracker.log_focus_event(FocusEvent(
+            session_id="focus_session",
+            event_type="distraction",
+            confidence=confidence
+        ))
+    
+    assert result["event_logged"] is True
+    assert result["current_focus_score"] == pytest.approx(0.9)
+    assert result["needs_intervention"] is True
+    
+    summary = await focus_tracker.get_session_summary("focus_session")
+    assert summary["total_events"] == 4
+    assert summary["distraction_count"] == 4
+    assert summary["session_duration_minutes"] >= 29
+
+@pytest.mark.asyncio
+async def test_session_summary_missing_session():
+    """Test summary for an unknown session"""
+    
+    summary = await focus_tracker.get_session_summary("missing_session")
+    
+    assert "error" in summary
+
+def test_batch_endpoint_accepts_json_and_ndjson():
+    """Test batch focus event ingestion in both supported formats"""
+    
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    client = TestClient(app)
+    events = [
+        {"session_id": "batch_session", "event_type": "distraction", "confidence": 0.4},
+        {"session_id": "batch_session", "event_type": "focus_restored", "confidence": 0.8},
+    ]
+    
+    response = client.post("/api/agents/focus/session/batch_session/events", json=events)
+    assert response.status_code == 200
+    assert response.json()["events_logged"] == 2
+    assert response.json()["current_focus_score"] == pytest.approx(0.6)
+    
+    ndjson = "\n".join(json.dumps(event) for event in events) + "\n"
+    response = client.post(
+        "/api/agents/focus/session/batch_session/events",
+        content=ndjson,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.json()["events_logged"] == 2
+    
+    # Invalid confidence and mismatched sessions are rejected as a whole
+    bad = [{"session_id": "batch_session", "event_type": "distraction", "confidence": 3}]
+    assert client.post("/api/agents/focus/session/batch_session/events", json=bad).status_code == 422
+    other = [{"session_id": "other", "event_type": "distraction", "confidence": 0.5}]
+    assert client.post("/api/agents/focus/session/batch_session/events", json=other).status_code == 422
+
+def test_batch_endpoint_accepts_mixed_naive_and_aware_timestamps():
+    """Test that a batch mixing local and UTC ("Z") timestamps is ordered by actual time"""
+    
+    from datetime import datetime, timedelta, timezone
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    client = TestClient(app)
+    aware = (datetime.now(timezone.utc) - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    events = [
+        {"session_id": "mixed_tz", "event_type": "focus_restored", "confidence": 0.9,
+         "timestamp": datetime.now().isoformat()},
+        {"session_id": "mixed_tz", "event_type": "distraction", "confidence": 0.3, "timestamp": aware},
+    ]
+    
+    response = client.post("/api/agents/focus/session/mixed_tz/events", json=events)
+    assert response.status_code == 200
+    assert response.json()["events_logged"] == 2
+    assert response.json()["current_focus_score"] == pytest.approx(0.6)
+    
+    summary = client.get("/api/agents/focus/session/mixed_tz/summary").json()
+    assert summary["session_duration_minutes"] == pytest.approx(1, abs=0.1)
+
+def test_stream_sends_state_and_nudge():
+    """Test that the WebSocket stream pushes focus state and a nudge on intervention"""
+    
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    client = TestClient(app)
+    profile = {
+        "user_id": "stream_user",
+        "attention_span_minutes": 25,
+        "preferred_modalities": ["visual"],
+        "working_memory_index": 0.7,
+        "anxiety_triggers": [],
+        "best_time_of_day": "morning",
+        "suggestions": []
+    }
+    
+    with client.websocket_connect("/api/agents/focus/session/stream_session/stream") as websocket:
+        websocket.send_json({"type": "profile", "profile": profile})
+        websocket.send_json({"type": "focus_events", "events": [
+            {"session_id": "stream_session", "event_type": "distraction", "confidence": 0.2}
+        ]})
+        
+        state = websocket.receive_json()
+        assert state["type"] == "focus_state"
+        assert state["needs_intervention"] is True
+        
+        nudge = websocket.receive_json()
+        assert nudge["type"] == "nudge"
+        assert nudge["nudge"]["type"] in ("break", "breathing")
+        
+        websocket.send_json({"type": "unknown"})
+        assert websocket.receive_json()["type"] == "error"
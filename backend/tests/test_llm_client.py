@@ -0,0 +1,283 @@
+"""
+Unit tests for the async OpenAI client.
+Runs against a local stub transport instead of the real API.
+"""
+
+import asyncio
+import json
+import os
+import re
+import httpx
+import pytest
+from app.llm_client import OpenAIClient
+
+def completion(content: str) -> httpx.Response:
+    """Minimal chat completion response body"""
+    return httpx.Response(200, json={
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }]
+    })
+
+def make_client(handler, **kwargs) -> OpenAIClient:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return OpenAIClient(
+        api_key="test",
+        base_url="http://stub.local/v1",
+        http_client=http_client,
+        backoff_base_seconds=0.001,
+        **kwargs
+    )
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors():
+    """Test that server errors are retried and the eventual response is parsed"""
+    
+    attempts = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) < 3:
+            return httpx.Response(503, json={"error": {"message": "overloaded"}})
+        return completion("SIMPLIFIED: short BULLETS: • one MICRO_TASKS: Step 1")
+    
+    client = make_client(handler, max_retries=3)
+    variants = await client.adapt_content("text", {})
+    await client.aclose()
+    
+    assert len(attempts) == 3
+    assert variants["micro_tasks"] == "Step 1"
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    """Test that persistent failures surface after the retry budget"""
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500, json={"error": {"message": "down"}})
+    
+    client = make_client(handler, max_retries=1)
+    with pytest.raises(Exception):
+        await client.adapt_content("text", {})
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    """Test that in-flight requests never exceed max_concurrency"""
+    
+    in_flight = 0
+    peak = 0
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return completion("SIMPLIFIED: short BULLETS: • one MICRO_TASKS: Step 1")
+    
+    client = make_client(handler, max_concurrency=2)
+    results = await asyncio.gather(*[client.adapt_content("text", {}) for _ in range(6)])
+    await client.aclose()
+    
+    assert peak == 2
+    assert all(result["simplified"] == "short" for result in results)
+
+@pytest.mark.asyncio
+async def test_nudge_prompt_is_rendered_compactly():
+    """Test that prompts come from the registry with compact JSON values"""
+    
+    prompts = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompts.append(json.loads(request.content)["messages"][1]["content"])
+        return completion(json.dumps({"type": "break", "payload": {}, "message": "Rest", "priority": 2}))
+    
+    client = make_client(handler)
+    nudge = await client.generate_nudge({"profile": {"attention_span_minutes": 15}, "focus_score": 0.3})
+    await client.aclose()
+    
+    assert nudge["type"] == "break"
+    assert '{"attention_span_minutes":15}' in prompts[0]
+    assert '{"focus_score":0.3}' in prompts[0]
+    assert '"payload": {<specific parameters>}' in prompts[0]
+
+def test_prompt_registry_validation_and_hot_reload(tmp_path):
+    """Test placeholder validation and reloading of edited templates"""
+    
+    from app.prompt_registry import PromptRegistry
+    
+    for name, text in [
+        ("profile", "Data: {onboarding_data}"),
+        ("content_adapter", "{profile} {content}"),
+        ("nudge", "{profile} {context}"),
+    ]:
+        (tmp_path / f"{name}_prompt.txt").write_text(text)
+    
+    registry = PromptRegistry(str(tmp_path), check_interval=0)
+    assert registry.render("profile", onboarding_data={"a": [1, 2]}) == 'Data: {"a":[1,2]}'
+    
+    # Valid edits are picked up, invalid ones keep the last good template
+    path = tmp_path / "profile_prompt.txt"
+    path.write_text("New: {onboarding_data}")
+    os.utime(path, (1, 1))
+    assert registry.render("profile", onboarding_data="x") == "New: x"
+    
+    path.write_text("Broken: {unknown}")
+    os.utime(path, (2, 2))
+    assert registry.render("profile", onboarding_data="x") == "New: x"
+    
+    (tmp_path / "nudge_prompt.txt").write_text("{profile}")
+    with pytest.raises(ValueError):
+        PromptRegistry(str(tmp_path))
+
+@pytest.mark.asyncio
+async def test_single_flight_collapses_identical_calls():
+    """Test that concurrent identical requests share one upstream call"""
+    
+    from app.llm_client import LocalStubClient, SingleFlightClient
+    
+    class SlowClient(LocalStubClient):
+        def __init__(self):
+            self.calls = 0
+        
+        async def adapt_content(self, text, profile):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return {"simplified": text, "bullets": "", "micro_tasks": ""}
+    
+    upstream = SlowClient()
+    client = SingleFlightClient(upstream)
+    
+    results = await asyncio.gather(
+        *[client.adapt_content("lesson", {"level": 1}) for _ in range(10)],
+        client.adapt_content("other lesson", {"level": 1})
+    )
+    
+    assert upstream.calls == 2
+    assert client.stats()["collapsed"] == 9
+    assert client.stats()["in_flight"] == 0
+    assert results[0] == results[9] and results[0] is not results[9]
+    
+    # Once finished, the next identical call goes upstream again
+    await client.adapt_content("lesson", {"level": 1})
+    assert upstream.calls == 3
+
+@pytest.mark.asyncio
+async def test_micro_batching_packs_requests_into_one_completion():
+    """Test that concurrent adaptations are sent as one multi-request completion"""
+    
+    from app.llm_client import MicroBatchingClient
+    
+    requests = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["messages"][1]["content"]
+        requests.append(prompt)
+        if "### REQUEST" not in prompt:
+            return completion("SIMPLIFIED: retried BULLETS: • b MICRO_TASKS: Step 1")
+        # Answer requests 1 and 3 only; request 2 must be retried on its own
+        return completion(
+            "### RESPONSE 1\nSIMPLIFIED: first BULLETS: • a MICRO_TASKS: Step 1\n"
+            "### RESPONSE 3\nSIMPLIFIED: third BULLETS: • c MICRO_TASKS: Step 1\n"
+        )
+    
+    client = MicroBatchingClient(make_client(handler), max_batch_size=3, max_wait_ms=50)
+    results = await asyncio.gather(*[client.adapt_content(f"text {i}", {}) for i in range(3)])
+    await client.aclose()
+    
+    assert [r["simplified"] for r in results] == ["first", "retried", "third"]
+    assert len(requests) == 2
+    assert "### REQUEST 3" in requests[0]
+    assert client.stats()["upstream_batches"] == 1
+
+@pytest.mark.asyncio
+async def test_full_micro_batches_fit_the_token_budget():
+    """Test that no batched answer gets fewer tokens than a single call"""
+    
+    from app.llm_client import ITEM_MAX_TOKENS, MicroBatchingClient
+    
+    budgets = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        count = len(re.findall(r"^### REQUEST \d+$", body["messages"][1]["content"], re.MULTILINE))
+        budgets.append((count, body["max_tokens"]))
+        return completion("".join(
+            f"### RESPONSE {i}\nSIMPLIFIED: s BULLETS: • b MICRO_TASKS: Step 1\n" for i in range(1, count + 1)
+        ))
+    
+    upstream = make_client(handler, max_batch_tokens=4000)
+    client = MicroBatchingClient(upstream, max_batch_size=8, max_wait_ms=50)
+    assert client.batch_limit("adapt_content") == 5
+    assert client.batch_limit("generate_nudge") == 8
+    assert upstream.max_batch_items("generate_nudge") == 13
+    
+    results = await asyncio.gather(*[client.adapt_content(f"text {i}", {}) for i in range(8)])
+    assert all(result["simplified"] == "s" for result in results)
+    assert sorted(count for count, _ in budgets) == [3, 5]
+    
+    # Oversized batches passed straight to the client are split, not truncated
+    budgets.clear()
+    await upstream.adapt_content_batch([(f"text {i}", {}) for i in range(12)])
+    await client.aclose()
+    
+    assert sorted(count for count, _ in budgets) == [2, 5, 5]
+    for count, max_tokens in budgets:
+        assert max_tokens >= ITEM_MAX_TOKENS["adapt_content"] * count
+        assert max_tokens <= 4000
+
+@pytest.mark.asyncio
+async def test_micro_batching_flushes_after_max_wait():
+    """Test that a partial batch is dispatched once the wait expires"""
+    
+    from app.llm_client import LocalStubClient, MicroBatchingClient
+    
+    client = MicroBatchingClient(LocalStubClient(), max_batch_size=10, max_wait_ms=5)
+    results = await asyncio.gather(client.generate_nudge({}), client.generate_nudge({}))
+    
+    assert all(result["type"] in ("break", "breathing") for result in results)
+    assert client.stats() == {"requests": 2, "upstream_batches": 1, "largest_batch": 2}
+
+def test_stream_parser_handles_split_markers():
+    """Test that sections are emitted as soon as the next marker arrives"""
+    
+    from app.llm_client import ContentVariantStreamParser
+    
+    parser = ContentVariantStreamParser()
+    emitted = []
+    for chunk in ["SIMPLI", "FIED: Plants ", "make food. BUL", "LETS: • light", "\nMICRO_", "TASKS: Step 1"]:
+        emitted.append(parser.feed(chunk))
+    
+    assert emitted[:3] == [[], [], []]
+    assert emitted[3] == [("simplified", "Plants make food.")]
+    assert emitted[5] == [("bullets", "• light")]
+    assert parser.close() == [("micro_tasks", "Step 1")]
+
+@pytest.mark.asyncio
+async def test_adapt_content_stream_from_server_sent_events():
+    """Test streaming adaptation against a stub SSE completion"""
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        events = []
+        for delta in ["SIMPLIFIED: Short.", " BULLETS: • a", " MICRO_TASKS: Step 1"]:
+            chunk = {
+                "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+            }
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content="".join(events))
+    
+    client = make_client(handler)
+    sections = [item async for item in client.adapt_content_stream("text", {})]
+    await client.aclose()
+    
+    assert sections == [("simplified", "Short."), ("bullets", "• a"), ("micro_tasks", "Step 1")]
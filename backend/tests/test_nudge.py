@@ -0,0 +1,96 @@
+"""
+Unit tests for NudgeAgent functionality.
+Tests the template fast path, LLM fallback and per-session rate limiting.
+"""
+
+import random
+import pytest
+import app.agents.nudge_agent as module
+from app.agents.nudge_agent import NudgeAgent
+from app.models import FocusEvent, Profile
+from app.stores import InMemoryNudgeLimiter
+
+def make_profile(**overrides) -> Profile:
+    fields = {
+        "user_id": "nudge_user",
+        "attention_span_minutes": 25,
+        "preferred_modalities": ["visual"],
+        "working_memory_index": 0.7,
+        "anxiety_triggers": [],
+        "best_time_of_day": "morning",
+        "suggestions": []
+    }
+    fields.update(overrides)
+    return Profile(**fields)
+
+def make_event(event_type: str) -> FocusEvent:
+    return FocusEvent(session_id="nudge_session", event_type=event_type, confidence=0.3)
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Record LLM nudge calls instead of making them"""
+    calls = []
+    
+    async def fake_generate_nudge(context):
+        calls.append(context)
+        return {"type": "breathing", "payload": {}, "message": "Let's pause together.", "priority": 2}
+    
+    monkeypatch.setattr(module.llm_client, "generate_nudge", fake_generate_nudge)
+    return calls
+
+@pytest.mark.asyncio
+async def test_routine_nudges_use_templates(llm_calls):
+    """Test that routine situations never reach the LLM and respect the profile"""
+    
+    agent = NudgeAgent(limiter=InMemoryNudgeLimiter(), llm_sample_rate=0.0)
+    
+    nudge = await agent.generate_nudge(make_event("distraction"), make_profile(), {})
+    assert nudge.type == "break"
+    assert nudge.payload["duration_minutes"] == 5
+    
+    # Short attention spans get shorter breaks, and the message says so
+    short = make_profile(attention_span_minutes=12, preferred_modalities=["kinesthetic"])
+    nudge = await agent.generate_nudge(make_event("distraction"), short, {})
+    assert nudge.payload["duration_minutes"] == 3
+    assert "3 minutes" in nudge.message
+    assert "activity_suggestion" in nudge.payload
+    
+    declining = {"focus_state": {"trend": "declining", "needs_intervention": True}}
+    nudge = await agent.generate_nudge(make_event("attention_drop"), make_profile(working_memory_index=0.3), declining)
+    assert nudge.type == "adjust_difficulty"
+    nudge = await agent.generate_nudge(make_event("attention_drop"), make_profile(), declining)
+    assert nudge.type == "breathing"
+    
+    # Templates are not modified by per-learner adjustments
+    assert module.NUDGE_TEMPLATES["break"]["payload"] == {"duration_minutes": 5}
+    assert llm_calls == []
+    assert agent.stats()["template"] == 4
+
+@pytest.mark.asyncio
+async def test_novel_and_sampled_nudges_use_llm(llm_calls):
+    """Test that unknown events, extra context and sampled routine nudges go to the LLM"""
+    
+    agent = NudgeAgent(limiter=InMemoryNudgeLimiter(), llm_sample_rate=0.0)
+    await agent.generate_nudge(make_event("focus_restored"), make_profile(), {})
+    await agent.generate_nudge(make_event("distraction"), make_profile(), {"current_task": "essay outline"})
+    assert len(llm_calls) == 2
+    assert llm_calls[1]["session_context"] == {"current_task": "essay outline"}
+    
+    sampled = NudgeAgent(limiter=InMemoryNudgeLimiter(), llm_sample_rate=0.5, rng=random.Random(0))
+    for _ in range(200):
+        await sampled.generate_nudge(make_event("distraction"), make_profile(), {})
+    stats = sampled.stats()
+    assert stats["template"] + stats["llm_sampled"] == 200
+    assert 60 < stats["llm_sampled"] < 140
+
+@pytest.mark.asyncio
+async def test_should_nudge_rate_limits_sessions():
+    """Test that a session is nudged at most once per cooldown"""
+    
+    agent = NudgeAgent(limiter=InMemoryNudgeLimiter(cooldown_seconds=300))
+    profile = make_profile()
+    
+    assert await agent.should_nudge("limited", profile, now=1000.0)
+    assert not await agent.should_nudge("limited", profile, now=1200.0)
+    assert await agent.should_nudge("other", profile, now=1200.0)
+    assert await agent.should_nudge("limited", profile, now=1300.0)
@@ -3,10 +3,28 @@ Unit tests for ProfileAgent functionality.
 Tests profile creation and data validation.
 """
 
+import os
+import subprocess
+import sys
+import numpy as np
 import pytest
-from app.agents.profile_agent import profile_agent
+from sqlalchemy.pool import StaticPool
+from app.embeddings import FeatureHashingEmbedder
+from app.agents.profile_agent import profile_agent, ProfileAgent, EMBEDDING_FIELDS
+from app.cache import LRUCache
+from app.db import create_engine_from_url
 from app.models import OnboardingData, Profile
 
+def make_onboarding() -> OnboardingData:
+    return OnboardingData(
+        age_range="18-25",
+        learning_goals=["improve focus"],
+        previous_experience="none",
+        attention_challenges=["easily distracted"],
+        preferred_pace="moderate",
+        accessibility_needs=[]
+    )
+
 @pytest.mark.asyncio
 async def test_build_profile():
     """Test profile creation from onboarding data"""
@@ -77,3 +95,126 @@ def test_embedding_generation():
     # Should be identical (deterministic)
     assert embedding1 == embedding2
     assert len(embedding1) == 384
+
+@pytest.mark.asyncio
+async def test_profiles_persist_and_cache():
+    """Built profiles are stored, cached by user_id and refreshed on save"""
+    
+    cache = LRUCache(max_entries=10)
+    agent = ProfileAgent(bind=create_engine_from_url("sqlite://", poolclass=StaticPool), cache=cache)
+    built = await agent.build_profile("stored_user", make_onboarding())
+    
+    # A fresh agent on the same database reads it back from the table
+    uncached = ProfileAgent(bind=agent.bind)
+    loaded = await uncached.get_profile("stored_user")
+    assert loaded == built
+    
+    assert await agent.get_profile("stored_user") is built
+    assert cache.stats()["hits"] == 1
+    
+    updated = built.model_copy(update={"attention_span_minutes": 40})
+    await uncached.save_profile(updated)
+    agent.invalidate("stored_user")
+    assert (await agent.get_profile("stored_user")).attention_span_minutes == 40
+    assert await agent.get_profile("missing_user") is None
+
+def test_routes_accept_user_id():
+    """Content and nudge routes look up the stored profile from a user_id"""
+    
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    with TestClient(app) as client:
+        response = client.post("/api/agents/profile/build", params={"user_id": "route_user"},
+                               json=make_onboarding().model_dump())
+        assert response.status_code == 200
+        assert client.get("/api/agents/profile/route_user").json()["user_id"] == "route_user"
+        
+        response = client.post("/api/agents/content/convert", json={"raw_text": "Cells divide.", "user_id": "route_user"})
+        assert response.status_code == 200
+        assert set(response.json()) == {"simplified", "bullets", "micro_tasks"}
+        
+        response = client.post("/api/agents/nudge/act", json={
+            "focus_event": {"session_id": "s", "event_type": "distraction", "confidence": 0.3},
+            "user_id": "route_user"
+        })
+        assert response.status_code == 200
+        
+        assert client.post("/api/agents/content/convert", json={"raw_text": "x", "user_id": "nobody"}).status_code == 404
+        assert client.post("/api/agents/content/convert", json={"raw_text": "x"}).status_code == 422
+
+def test_embedding_stable_across_processes():
+    """Embeddings do not depend on hash randomization"""
+    
+    code = (
+        "from app.embeddings import FeatureHashingEmbedder;"
+        "print(FeatureHashingEmbedder().encode({'best_time_of_day': 'morning', 'preferred_modalities': ['visual']})[:4].tolist())"
+    )
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed}
+        ).stdout
+        for seed in ("1", "2")
+    }
+    assert len(outputs) == 1
+
+def test_batch_encoding_matches_single():
+    """Batched encoding equals per-profile encoding and keeps similar profiles close"""
+    
+    embedder = FeatureHashingEmbedder()
+    profiles = [
+        {"attention_span_minutes": 25, "preferred_modalities": ["visual", "reading"], "best_time_of_day": "morning"},
+        {"attention_span_minutes": 25, "preferred_modalities": ["reading", "visual"], "best_time_of_day": "evening"},
+        {"attention_span_minutes": 90, "preferred_modalities": ["auditory"], "best_time_of_day": "night"},
+    ]
+    
+    batch = embedder.encode_batch(profiles)
+    
+    assert batch.shape == (3, 384)
+    assert batch.dtype == np.float32
+    for row, profile in zip(batch, profiles):
+        np.testing.assert_allclose(row, embedder.encode(profile), rtol=1e-6, atol=1e-7)
+    assert np.linalg.norm(batch, axis=1) == pytest.approx([1.0, 1.0, 1.0], abs=1e-5)
+    assert batch[0] @ batch[1] > batch[0] @ batch[2]
+
+@pytest.mark.asyncio
+async def test_reembed_profiles_backfills_in_batches():
+    """Stored embeddings are recomputed with a new embedder"""
+    
+    agent = ProfileAgent(bind=create_engine_from_url("sqlite://", poolclass=StaticPool))
+    for n in range(5):
+        await agent.build_profile(f"backfill_{n}", make_onboarding())
+    
+    agent.embedder = FeatureHashingEmbedder(seed=7)
+    assert await agent.reembed_profiles(batch_size=2) == 5
+    
+    profile = await agent.get_profile("backfill_3")
+    expected = agent.embedder.encode({field: getattr(profile, field) for field in EMBEDDING_FIELDS})
+    np.testing.assert_allclose(profile.embedding, expected, rtol=1e-6)
+
+def test_similar_learners_and_cohort_routes():
+    """Similar learners come from the vector DB and cohorts are built on request"""
+    
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    with TestClient(app) as client:
+        for user_id in ("similar_a", "similar_b"):
+            response = client.post("/api/agents/profile/build", params={"user_id": user_id},
+                                   json=make_onboarding().model_dump())
+            assert response.status_code == 200
+        
+        similar = client.get("/api/agents/profile/similar_a/similar", params={"limit": 50}).json()["similar"]
+        assert "similar_b" in [match["id"] for match in similar]
+        assert similar[0]["similarity"] > 0.999  # Identical onboarding, identical embedding
+        assert all(match["id"] != "similar_a" for match in similar)
+        assert client.get("/api/agents/profile/nobody/similar").status_code == 404
+        
+        stats = client.post("/api/agents/cohorts/refresh", params={"rebuild": True}).json()
+        assert stats["trained"] and stats["assigned"] >= 2
+        cohort_a = client.get("/api/agents/profile/similar_a/cohort").json()
+        cohort_b = client.get("/api/agents/profile/similar_b/cohort").json()
+        assert cohort_a["cohort"] == cohort_b["cohort"]
+        assert cohort_a["size"] >= 2
+        assert client.get("/api/agents/cohorts/stats").json()["version"] == stats["version"]
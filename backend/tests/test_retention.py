@@ -3,13 +3,30 @@ Unit tests for RetentionAgent SRS scheduling functionality.
 Tests SM-2 algorithm implementation and schedule updates.
 """
 
+import io
+import json
+import random
 import pytest
 from datetime import datetime, timedelta
-from app.agents.retention_agent import retention_agent
+from sqlalchemy import inspect
+from sqlalchemy.pool import StaticPool
+from app.db import create_engine_from_url
+from app.agents.retention_agent import RetentionAgent, UserDueQueue, DueQueueStore
 from app.models import SRSItem, QuizResult
 
+@pytest.fixture
+def retention_agent():
+    """Agent backed by a fresh in-memory SQLite database"""
+    engine = create_engine_from_url("sqlite://", poolclass=StaticPool)
+    return RetentionAgent(bind=engine)
+
+@pytest.fixture
+def single_writer_agent(retention_agent):
+    """Agent on the same database that serves due items from in-memory queues"""
+    return RetentionAgent(bind=retention_agent.bind, single_writer=True)
+
 @pytest.mark.asyncio
-async def test_sm2_scheduling():
+async def test_sm2_scheduling(retention_agent):
     """Test SM-2 algorithm implementation"""
     
     # Arrange - Create initial SRS item
@@ -39,12 +56,12 @@ async def test_sm2_scheduling():
     assert result["repetitions"] == 1  # Should increment repetitions
     
     # Get updated item
-    updated_item = retention_agent.srs_items["test_item"]
+    updated_item = await retention_agent.get_item("test_item")
     assert updated_item.repetitions == 1
     assert updated_item.interval > 1
 
 @pytest.mark.asyncio
-async def test_incorrect_answer_reset():
+async def test_incorrect_answer_reset(retention_agent):
     """Test that incorrect answers reset the schedule"""
     
     # Arrange - Item with some progress
@@ -57,7 +74,7 @@ async def test_incorrect_answer_reset():
         repetitions=2,
         next_due=datetime.now()
     )
-    retention_agent.srs_items["test_item_2"] = item
+    await retention_agent.save_item(item)
     
     # Act - Report incorrect answer (quality = 1)
     quiz_result = QuizResult(
@@ -70,25 +87,22 @@ async def test_incorrect_answer_reset():
     result = await retention_agent.report_quiz_result(quiz_result)
     
     # Assert - Should reset progress
-    updated_item = retention_agent.srs_items["test_item_2"]
+    updated_item = await retention_agent.get_item("test_item_2")
     assert updated_item.repetitions == 0  # Reset to 0
     assert updated_item.interval == 1  # Reset to 1 day
     assert result["repetitions"] == 0
 
 @pytest.mark.asyncio
-async def test_get_due_items():
+async def test_get_due_items(retention_agent):
     """Test retrieval of items due for review"""
     
     # Arrange - Add items with different due dates
     past_due = datetime.now() - timedelta(days=1)
     future_due = datetime.now() + timedelta(days=1)
     
-    await retention_agent.add_item("user1", "Past due item", "past_item")
-    await retention_agent.add_item("user1", "Future item", "future_item")
-    
-    # Manually set due dates
-    retention_agent.srs_items["past_item"].next_due = past_due
-    retention_agent.srs_items["future_item"].next_due = future_due
+    await retention_agent.add_item("user1", "Past due item", "past_item", next_due=past_due)
+    await retention_agent.add_item("user1", "Future item", "future_item", next_due=future_due)
+    await retention_agent.add_item("user2", "Other user's item", "other_item", next_due=past_due)
     
     # Act
     due_items = await retention_agent.get_due_items("user1")
@@ -98,8 +112,39 @@ async def test_get_due_items():
     due_item_ids = [item.item_id for item in due_items]
     assert "past_item" in due_item_ids
     assert "future_item" not in due_item_ids
+    assert "other_item" not in due_item_ids
+
+@pytest.mark.asyncio
+async def test_due_items_ordered_and_limited(retention_agent):
+    """Due items come back oldest first and respect the limit"""
+    
+    now = datetime.now()
+    for days in (3, 1, 5, 2):
+        await retention_agent.add_item("user1", f"Item {days}", f"item_{days}", next_due=now - timedelta(days=days))
+    
+    due_items = await retention_agent.get_due_items("user1", limit=3)
+    
+    assert [item.item_id for item in due_items] == ["item_5", "item_3", "item_2"]
+
+@pytest.mark.asyncio
+async def test_schedule_persists_across_agents(retention_agent):
+    """State lives in the database, so a new agent on the same engine sees it"""
+    
+    await retention_agent.add_item("user1", "Persistent item", "persisted")
+    await retention_agent.report_quiz_result(
+        QuizResult(item_id="persisted", user_id="user1", quality=5, response_time_ms=1000)
+    )
+    
+    restarted = RetentionAgent(bind=retention_agent.bind)
+    item = await restarted.get_item("persisted")
+    
+    assert item.repetitions == 1
+    assert item.content == "Persistent item"
+    async with retention_agent.bind.connect() as connection:
+        indexes = await connection.run_sync(lambda sync: inspect(sync).get_indexes("srs_items"))
+    assert any(index["column_names"] == ["user_id", "next_due"] for index in indexes)
 
-def test_easiness_bounds():
+def test_easiness_bounds(retention_agent):
     """Test that easiness factor stays within bounds"""
     
     item = SRSItem(
@@ -117,3 +162,194 @@ def test_easiness_bounds():
     
     # Easiness should not go below 1.3
     assert updated_item.easiness >= 1.3
+
+@pytest.mark.asyncio
+async def test_due_queue_tracks_reschedules(single_writer_agent):
+    """Reviews and new items update a loaded due queue without reloading it"""
+    
+    retention_agent = single_writer_agent
+    now = datetime.now()
+    await retention_agent.add_item("user1", "Old", "old", next_due=now - timedelta(days=2))
+    await retention_agent.add_item("user1", "Older", "older", next_due=now - timedelta(days=3))
+    assert [item.item_id for item in await retention_agent.get_due_items("user1")] == ["older", "old"]
+    
+    # Reviewing pushes the item into the future; a new item becomes due
+    await retention_agent.report_quiz_result(
+        QuizResult(item_id="older", user_id="user1", quality=5, response_time_ms=1000)
+    )
+    await retention_agent.add_item("user1", "New", "new", next_due=now - timedelta(days=1))
+    
+    due_items = await retention_agent.get_due_items("user1")
+    assert [item.item_id for item in due_items] == ["old", "new"]
+    assert retention_agent.due_queues.get("user1") is not None
+
+@pytest.mark.asyncio
+async def test_single_writer_serves_due_items_without_queries(single_writer_agent):
+    """A loaded queue answers like the indexed query without touching the database"""
+    
+    from sqlalchemy import event
+    
+    now = datetime.now()
+    rng = random.Random(3)
+    indexed = RetentionAgent(bind=single_writer_agent.bind)
+    for n in range(50):
+        await indexed.add_item("user1", f"Card {n}", f"card{n}", next_due=now + timedelta(hours=rng.uniform(-48, 48)))
+    await single_writer_agent.get_due_items("user1")  # load the user's queue
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(single_writer_agent.bind.sync_engine, "before_cursor_execute", listener)
+    try:
+        for n in range(0, 50, 5):
+            await single_writer_agent.report_quiz_results([
+                QuizResult(item_id=f"card{n}", user_id="user1", quality=n % 6, response_time_ms=1000)
+            ])
+        statements.clear()
+        for limit in (1, 5, 100):
+            served = await single_writer_agent.get_due_items("user1", limit)
+            assert not statements
+            expected = await indexed.get_due_items("user1", limit)
+            assert [item.model_dump() for item in served] == [item.model_dump() for item in expected]
+            statements.clear()
+    finally:
+        event.remove(single_writer_agent.bind.sync_engine, "before_cursor_execute", listener)
+
+@pytest.mark.asyncio
+async def test_due_items_see_writes_from_other_processes(retention_agent):
+    """Items added or rescheduled by another agent on the same database are picked up"""
+    
+    now = datetime.now()
+    other = RetentionAgent(bind=retention_agent.bind)
+    await retention_agent.add_item("shared", "First", "first", next_due=now - timedelta(days=2))
+    assert [item.item_id for item in await retention_agent.get_due_items("shared")] == ["first"]
+    
+    await other.add_item("shared", "Second", "second", next_due=now - timedelta(days=1))
+    assert [item.item_id for item in await retention_agent.get_due_items("shared")] == ["first", "second"]
+    
+    # Moving a later item ahead of a due one changes the order
+    await other.add_item("shared", "Third", "third", next_due=now + timedelta(days=1))
+    assert len(await retention_agent.get_due_items("shared")) == 2
+    await other.save_item(SRSItem(item_id="third", user_id="shared", content="Third", next_due=now - timedelta(days=3)))
+    assert [item.item_id for item in await retention_agent.get_due_items("shared")] == ["third", "first", "second"]
+
+def test_user_due_queue_tracks_rescheduled_items():
+    """Rescheduled items surface only at their latest due date"""
+    
+    now = datetime.now()
+    item = lambda item_id, next_due: SRSItem(item_id=item_id, user_id="u1", content="", next_due=next_due)
+    queue = UserDueQueue([item("a", now - timedelta(days=1)), item("b", now - timedelta(days=2))])
+    queue.push(item("b", now + timedelta(days=1)))
+    queue.push(item("c", now - timedelta(hours=1)))
+    queue.push(item("c", now - timedelta(hours=2)))
+    queue.push(item("c", now - timedelta(hours=1)))
+    
+    assert [due.item_id for due in queue.top_due(now, 10)] == ["a", "c"]
+    assert [due.item_id for due in queue.top_due(now, 1)] == ["a"]
+    assert [due.item_id for due in queue.top_due(now, 10)] == ["a", "c"]
+    assert [due.item_id for due in queue.top_due(now - timedelta(days=1), 10)] == ["a"]  # due exactly then
+    
+    # Stale entries are compacted away once they outnumber the live ones
+    for hours in range(199, -1, -1):
+        queue.push(item("a", now - timedelta(hours=hours)))
+    assert len(queue.heap) <= 2 * len(queue.items) + 64
+    assert [due.item_id for due in queue.top_due(now, 10)] == ["c", "a"]
+
+def test_due_queue_store_evicts_idle_users():
+    """Idle users and users over the cap are evicted oldest first"""
+    
+    store = DueQueueStore(idle_ttl_seconds=3600, max_users=2)
+    for user_id in ("u1", "u2", "u3"):
+        store.put(user_id, UserDueQueue())
+    assert list(store.queues) == ["u2", "u3"]
+    
+    store.queues["u2"].last_seen -= 7200
+    store.put("u4", UserDueQueue())
+    assert list(store.queues) == ["u3", "u4"]
+
+@pytest.mark.asyncio
+async def test_bulk_results_match_scalar_path(retention_agent):
+    """Property test: the vectorized batch gives the same schedule as scalar updates"""
+    
+    rng = random.Random(17)
+    for trial in range(25):
+        reference = {}
+        for n in range(rng.randint(1, 12)):
+            item = SRSItem(
+                item_id=f"t{trial}_{n}",
+                user_id="prop_user",
+                content="Q",
+                easiness=rng.uniform(1.3, 3.0),
+                interval=rng.randint(1, 400),
+                repetitions=rng.randint(0, 12),
+                next_due=datetime.now()
+            )
+            await retention_agent.save_item(item)
+            reference[item.item_id] = item.model_copy()
+        
+        # Include repeated answers for the same item
+        results = [
+            QuizResult(item_id=rng.choice(list(reference)), user_id="prop_user",
+                       quality=rng.randint(0, 5), response_time_ms=1000)
+            for _ in range(rng.randint(1, 30))
+        ]
+        responses = await retention_agent.report_quiz_results(results)
+        
+        for result, response in zip(results, responses):
+            expected = retention_agent._update_sm2_schedule(reference[result.item_id], result.quality)
+            assert response["item_id"] == result.item_id
+            assert response["easiness"] == expected.easiness
+            assert response["interval_days"] == expected.interval
+            assert response["repetitions"] == expected.repetitions
+        
+        for item_id, expected in reference.items():
+            stored = await retention_agent.get_item(item_id)
+            assert (stored.easiness, stored.interval, stored.repetitions) == (
+                expected.easiness, expected.interval, expected.repetitions
+            )
+
+@pytest.mark.asyncio
+async def test_bulk_results_create_missing_items(single_writer_agent):
+    """Unknown items are created, and their schedule becomes visible to due queries"""
+    
+    retention_agent = single_writer_agent
+    await retention_agent.get_due_items("user1")  # load the user's queue
+    responses = await retention_agent.report_quiz_results([
+        QuizResult(item_id="fresh", user_id="user1", quality=4, response_time_ms=1000)
+    ])
+    
+    assert responses[0]["repetitions"] == 1
+    assert (await retention_agent.get_item("fresh")).user_id == "user1"
+    assert retention_agent.due_queues.get("user1").items["fresh"].next_due > datetime.now()
+
+@pytest.mark.asyncio
+async def test_import_jsonl_deck_in_batches(retention_agent):
+    """JSONL rows are inserted in batches with generated ids; bad rows are reported"""
+    
+    lines = [json.dumps({"user_id": "school", "content": f"Card {n}"}) for n in range(25)]
+    lines.insert(3, "{not json")
+    lines.insert(7, json.dumps({"user_id": "school"}))  # missing content
+    
+    stats = await retention_agent.import_deck(io.StringIO("\n".join(lines)), "jsonl", batch_size=10)
+    
+    assert stats["imported"] == 25
+    assert stats["batches"] == 3
+    assert stats["skipped"] == 2
+    assert stats["errors"][0].startswith("line 4:")
+    assert len(await retention_agent.get_due_items("school", limit=100)) == 25
+
+@pytest.mark.asyncio
+async def test_deck_export_import_roundtrip(retention_agent):
+    """Exported CSV re-imports to the same items, replacing existing ids"""
+    
+    await retention_agent.add_item("user1", "Comma, \"quoted\"\nand newline", "rt_1")
+    await retention_agent.report_quiz_results([
+        QuizResult(item_id="rt_1", user_id="user1", quality=5, response_time_ms=1000),
+        QuizResult(item_id="rt_2", user_id="user1", quality=2, response_time_ms=1000)
+    ])
+    before = [item async for item in retention_agent.iter_items("user1")]
+    
+    exported = "".join([chunk async for chunk in retention_agent.export_deck("csv", "user1")])
+    stats = await retention_agent.import_deck(io.StringIO(exported, newline=""), "csv")
+    
+    assert stats["imported"] == 2
+    assert [item async for item in retention_agent.iter_items("user1")] == before
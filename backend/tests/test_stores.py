@@ -0,0 +1,136 @@
+"""
+Unit tests for the pluggable focus and session stores.
+Runs the same scenarios against the in-memory and Redis backends.
+"""
+
+import asyncio
+import pytest
+import time
+from datetime import datetime, timedelta
+from app.agents.focus_tracker import FocusTrackerAgent
+from app.models import FocusEvent
+from app.stores import (
+    InMemoryFocusStore, InMemorySessionStore, InMemoryNudgeLimiter,
+    RedisFocusStore, RedisSessionStore, RedisNudgeLimiter
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture(params=["memory", "redis"])
+def stores(request):
+    """(focus store, session store, factory for a second worker's focus store)"""
+    if request.param == "memory":
+        focus = InMemoryFocusStore()
+        return focus, InMemorySessionStore(), lambda: focus
+    server = fakeredis.FakeServer()
+    client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return RedisFocusStore(client()), RedisSessionStore(client()), lambda: RedisFocusStore(client())
+
+@pytest.mark.asyncio
+async def test_focus_state_is_shared_between_workers(stores):
+    """Events logged by one worker are visible to another"""
+    
+    focus, _, second_worker = stores
+    worker_a = FocusTrackerAgent(store=focus)
+    worker_b = FocusTrackerAgent(store=second_worker())
+    
+    await worker_a.log_focus_event(FocusEvent(
+        session_id="shared", event_type="distraction", confidence=0.1,
+        timestamp=datetime.now() - timedelta(minutes=30)
+    ))
+    for confidence in [0.2, 0.4, 0.9]:
+        await worker_a.log_focus_event(FocusEvent(
+            session_id="shared", event_type="distraction", confidence=confidence
+        ))
+    result = await worker_b.log_focus_events("shared", [
+        FocusEvent(session_id="shared", event_type="focus_restored", confidence=0.9)
+    ])
+    
+    # The 30 minute old event is outside the window
+    assert result["current_focus_score"] == pytest.approx(0.6)
+    assert result["trend"] == "improving"
+    assert result["needs_intervention"] is True
+    
+    summary = await worker_b.get_session_summary("shared")
+    assert summary["total_events"] == 5
+    assert summary["distraction_count"] == 4
+    assert summary["average_focus"] == pytest.approx(0.5)
+    assert summary["session_duration_minutes"] >= 29
+
+@pytest.mark.asyncio
+async def test_out_of_order_events_are_clamped(stores):
+    """Late events count as arriving at the latest timestamp, like the ring buffers"""
+    
+    focus, _, _ = stores
+    now = datetime.now()
+    await focus.append("late", "distraction", 0.5, now)
+    await focus.append("late", "distraction", 0.5, now - timedelta(minutes=20))
+    
+    window = await focus.window("late", 300, time.time(), latest=2)
+    assert window.count == 2
+    assert window.latest_confidences == [0.5, 0.5]
+    assert await focus.window("missing", 300, time.time()) is None
+
+@pytest.mark.asyncio
+async def test_mixed_naive_and_aware_timestamps(stores):
+    """A batch may mix local and UTC timestamps; events are ordered by actual time"""
+    
+    from datetime import timezone
+    focus, _, _ = stores
+    await focus.append_many("mixed", [
+        ("focus_restored", 0.9, datetime.now()),
+        ("distraction", 0.3, datetime.now(timezone.utc) - timedelta(minutes=1)),
+    ])
+    
+    window = await focus.window("mixed", 300, time.time(), latest=2)
+    assert window.count == 2
+    assert window.latest_confidences == [0.3, 0.9]
+
+@pytest.mark.asyncio
+async def test_session_store_roundtrip(stores):
+    """Steps accumulate in order and unknown sessions return None"""
+    
+    _, sessions, _ = stores
+    await sessions.add_step("s1", {"step_type": "content", "completed": True})
+    await sessions.add_step("s1", {"step_type": "quiz", "completed": False})
+    
+    state = await sessions.get("s1")
+    assert state["profile"] is None
+    assert [step["step_type"] for step in state["steps"]] == ["content", "quiz"]
+    assert await sessions.get("s2") is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_nudge_limiter_cooldown(backend):
+    """One nudge per session per cooldown, shared by every worker"""
+    
+    if backend == "memory":
+        limiter = InMemoryNudgeLimiter(cooldown_seconds=0.2)
+        second_worker = limiter
+    else:
+        server = fakeredis.FakeServer()
+        limiter = RedisNudgeLimiter(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), cooldown_seconds=0.2)
+        second_worker = RedisNudgeLimiter(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), cooldown_seconds=0.2)
+    
+    assert await limiter.acquire("s1", time.time())
+    assert not await second_worker.acquire("s1", time.time())
+    assert await second_worker.acquire("s2", time.time())
+    
+    await asyncio.sleep(0.25)
+    assert await second_worker.acquire("s1", time.time())
+    assert not await limiter.acquire("s1", time.time())
+    
+    await limiter.clear()
+    assert await limiter.acquire("s1", time.time())
+
+@pytest.mark.asyncio
+async def test_in_memory_nudge_limiter_is_bounded():
+    """Expired and least recently nudged sessions are dropped"""
+    
+    limiter = InMemoryNudgeLimiter(cooldown_seconds=10, max_sessions=3)
+    for i in range(5):
+        assert await limiter.acquire(f"s{i}", now=100.0 + i)
+    assert list(limiter.allowed_at) == ["s2", "s3", "s4"]
+    
+    assert await limiter.acquire("s5", now=113.5)
+    assert list(limiter.allowed_at) == ["s4", "s5"]
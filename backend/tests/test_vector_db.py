@@ -0,0 +1,123 @@
+"""
+Unit tests for the matrix-backed VectorDB.
+Tests top-k search against a brute-force scan, batched queries and deletion.
+"""
+
+import numpy as np
+from app.db import VectorDB
+from app.vector_index import IVFIndex
+
+def brute_force(vectors: dict, query: np.ndarray, limit: int) -> list:
+    """Reference cosine similarity ranking"""
+    scores = {
+        id: float(np.dot(query, v) / (np.linalg.norm(query) * np.linalg.norm(v)))
+        for id, v in vectors.items()
+    }
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+def test_search_matches_brute_force():
+    """Test that top-k search returns the same ids as a full scan"""
+    
+    rng = np.random.default_rng(0)
+    db = VectorDB(initial_capacity=4)  # Forces several growth steps
+    vectors = {f"user_{i}": rng.normal(size=16) for i in range(50)}
+    for id, vector in vectors.items():
+        db.store_embedding(id, vector.tolist(), {"index": id})
+    
+    query = rng.normal(size=16)
+    results = db.search_similar(query.tolist(), limit=5)
+    
+    assert [r["id"] for r in results] == brute_force(vectors, query, 5)
+    assert results[0]["metadata"] == {"index": results[0]["id"]}
+    assert results[0]["similarity"] >= results[-1]["similarity"]
+
+def test_search_similar_many():
+    """Test batched queries against individual searches"""
+    
+    rng = np.random.default_rng(1)
+    db = VectorDB()
+    for i in range(20):
+        db.store_embedding(f"user_{i}", rng.normal(size=8).tolist())
+    
+    queries = rng.normal(size=(3, 8)).tolist()
+    batched = db.search_similar_many(queries, limit=3)
+    
+    assert len(batched) == 3
+    for query, results in zip(queries, batched):
+        assert [r["id"] for r in results] == [r["id"] for r in db.search_similar(query, limit=3)]
+
+def test_delete_and_compact():
+    """Test that deleted embeddings are never returned"""
+    
+    db = VectorDB()
+    for i in range(6):
+        db.store_embedding(f"user_{i}", [1.0, float(i)])
+    
+    assert db.delete_embedding("user_0")
+    assert not db.delete_embedding("user_0")
+    for i in range(1, 4):
+        db.delete_embedding(f"user_{i}")
+    
+    # More than half the rows were deleted, so the matrix was compacted
+    assert db.size == len(db) == 2
+    results = db.search_similar([1.0, 0.0], limit=10)
+    assert sorted(r["id"] for r in results) == ["user_4", "user_5"]
+    
+    # Re-storing an id overwrites its row
+    db.store_embedding("user_4", [0.0, 1.0])
+    assert len(db) == 2
+
+def test_ivf_index_recall():
+    """Test that the IVF index trains on insert and finds the exact neighbours"""
+    
+    rng = np.random.default_rng(2)
+    centers = rng.normal(size=(8, 32))
+    db = VectorDB(index=IVFIndex(nlist=8, nprobe=2, min_train_size=200))
+    exact_db = VectorDB()
+    for i in range(400):
+        vector = (centers[i % 8] + 0.1 * rng.normal(size=32)).tolist()
+        db.store_embedding(f"user_{i}", vector)
+        exact_db.store_embedding(f"user_{i}", vector)
+    
+    assert db.index.trained
+    
+    queries = (centers + 0.1 * rng.normal(size=(8, 32))).tolist()
+    approximate = db.search_similar_many(queries, limit=5)
+    exact = exact_db.search_similar_many(queries, limit=5)
+    
+    hits = sum(len({r["id"] for r in a} & {r["id"] for r in e}) for a, e in zip(approximate, exact))
+    assert hits / 40 >= 0.9
+    
+    # Probing every list is equivalent to exact search
+    assert [r["id"] for r in db.search_similar(queries[0], limit=5, nprobe=8)] == [r["id"] for r in exact[0]]
+    
+    # Deleted rows leave the index
+    db.delete_embedding(exact[0][0]["id"])
+    assert exact[0][0]["id"] not in [r["id"] for r in db.search_similar(queries[0], limit=5)]
+
+def test_persistent_store_reloads_and_shares(tmp_path):
+    """Test that a memory-mapped store survives restarts and is shared between instances"""
+    
+    path = str(tmp_path / "vectors")
+    writer = VectorDB(path=path, initial_capacity=2)
+    for i in range(5):
+        writer.store_embedding(f"user_{i}", [1.0, float(i), 0.5], {"i": i})
+    writer.delete_embedding("user_0")
+    writer.flush()
+    
+    # A second instance (e.g. another worker or a restart) maps the same file
+    reader = VectorDB(path=path)
+    assert len(reader) == 4
+    assert reader.search_similar([1.0, 4.0, 0.5], limit=1)[0]["id"] == "user_4"
+    assert np.allclose(reader.get_embedding("user_2"), writer.get_embedding("user_2"))
+    
+    # Writes from one instance become visible to the other on the next query
+    writer.store_embedding("user_9", [0.0, 0.0, 1.0], {"i": 9})
+    assert reader.search_similar([0.0, 0.0, 1.0], limit=1)[0]["metadata"] == {"i": 9}
+    
+    # Compaction rewrites the files and other instances reload
+    writer.compact()
+    assert writer.size == 5
+    results = reader.search_similar([1.0, 1.0, 0.5], limit=10)
+    assert sorted(r["id"] for r in results) == ["user_1", "user_2", "user_3", "user_4", "user_9"]
+    assert VectorDB(path=path).size == 5